@@ -0,0 +1,51 @@
+"""Benchmarks comparing the separate position functions with the fused
+position_properties calculation."""
+
+import numpy as np
+from astropy.time import Time
+
+from magda_tools import (
+    SATURN_RADIUS_KM,
+    distance,
+    latitude,
+    position_properties,
+    saturn_local_time,
+    saturn_local_time_array,
+)
+
+
+class Position:
+    params = [10_000, 1_000_000]
+    param_names = ["n_samples"]
+
+    def setup(self, n_samples):
+        rng = np.random.default_rng(0)
+        self.x, self.y, self.z = rng.uniform(-1e6, 1e6, (3, n_samples))
+        self.unix = 1.4e9 + np.arange(n_samples, dtype=np.float64)
+        self.time = Time(self.unix, format="unix", scale="utc")
+        self.out = np.empty(n_samples)
+
+    def time_separate(self, n_samples):
+        distance(self.x, self.y, self.z, radius=SATURN_RADIUS_KM)
+        latitude(self.x, self.y, self.z)
+        saturn_local_time(self.time, self.x, self.y, self.z)
+
+    def time_fused(self, n_samples):
+        position_properties(self.x, self.y, self.z, self.unix, radius=SATURN_RADIUS_KM)
+
+    def time_local_time(self, n_samples):
+        saturn_local_time(self.time, self.x, self.y, self.z)
+
+    def time_local_time_array(self, n_samples):
+        saturn_local_time_array(self.unix, self.x, self.y, self.z, out=self.out)
+
+    def time_local_time_interpolated(self, n_samples):
+        saturn_local_time_array(
+            self.unix, self.x, self.y, self.z, out=self.out, lambda_step=86400.0
+        )
+
+    def peakmem_separate(self, n_samples):
+        self.time_separate(n_samples)
+
+    def peakmem_fused(self, n_samples):
+        self.time_fused(n_samples)
@@ -0,0 +1,87 @@
+"""Benchmarks for parsing and loading flat files and deriving the time
+axis, using synthetic files generated from the test header layout."""
+
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+
+from magda_tools import DataFile, parse_headers
+
+from .synthetic import N_ROWS, TEMPLATE, make_flat_file
+
+
+class DataFileSuite:
+    params = [[10_000, N_ROWS]]
+    param_names = ["n_rows"]
+
+    def setup(self, n_rows):
+        self.directory = TemporaryDirectory()
+        self.path = str(make_flat_file(self.directory.name, n_rows))
+        self.header_path = self.path[:-1] + "h"
+        self.datafile = DataFile(self.path)
+        self.datafile.to_cache()
+        Path(self.directory.name, "written").mkdir()
+
+    def teardown(self, n_rows):
+        self.directory.cleanup()
+
+    def time_parse_header(self, n_rows):
+        DataFile.parse_header(self.header_path)
+
+    def time_load(self, n_rows):
+        DataFile(self.path)
+
+    def time_load_mmap(self, n_rows):
+        DataFile(self.path, mmap=True)
+
+    def time_unix_time(self, n_rows):
+        DataFile(self.path, mmap=True).unix_time
+
+    def time_astropy_time(self, n_rows):
+        DataFile(self.path, mmap=True)["TIME"].data
+
+    def time_from_cache(self, n_rows):
+        DataFile.from_cache(self.path).unix_time
+
+    def time_to_cache(self, n_rows):
+        self.datafile.to_cache()
+
+    def time_write(self, n_rows):
+        self.datafile.write(
+            str(Path(self.directory.name, "written", Path(self.path).name))
+        )
+
+    def peakmem_load(self, n_rows):
+        DataFile(self.path)
+
+    def peakmem_load_mmap(self, n_rows):
+        DataFile(self.path, mmap=True)
+
+    def peakmem_astropy_time(self, n_rows):
+        DataFile(self.path, mmap=True)["TIME"].data
+
+    def peakmem_from_cache(self, n_rows):
+        DataFile.from_cache(self.path).unix_time
+
+
+class ParseHeaders:
+    params = [[1000], [1, 2]]
+    param_names = ["n_headers", "workers"]
+
+    def setup(self, n_headers, workers):
+        self.directory = TemporaryDirectory()
+        self.paths = []
+        for i in range(n_headers):
+            path = Path(self.directory.name, f"{i:05d}_{TEMPLATE.name}")
+            shutil.copy(TEMPLATE, path)
+            self.paths.append(path)
+
+    def teardown(self, n_headers, workers):
+        self.directory.cleanup()
+
+    def time_parse_header(self, n_headers, workers):
+        for path in self.paths:
+            DataFile.parse_header(path)
+
+    def time_parse_headers(self, n_headers, workers):
+        parse_headers(self.paths, workers=workers)
@@ -0,0 +1,27 @@
+"""Benchmarks for fitting axisymmetric model coefficients."""
+
+import numpy as np
+
+from magda_tools import BFieldModel
+from magda_tools.fitting import AxisymmetricBasis
+
+
+class Fit:
+    params = [[3, 10], [1, 500]]
+    param_names = ["degree", "n_segments"]
+
+    def setup(self, degree, n_segments):
+        rng = np.random.default_rng(0)
+        n_samples = 500_000
+        self.r = rng.uniform(1.0, 30.0, n_samples)
+        self.theta = rng.uniform(0.0, np.pi, n_samples)
+        self.segments = np.sort(rng.integers(0, n_segments, n_samples))
+        gn0s = list(rng.uniform(-2e4, 2e4, degree))
+        self.b_r, self.b_theta = BFieldModel(gn0s).field(self.r, self.theta)
+        self.basis = AxisymmetricBasis(self.r, self.theta, degree)
+
+    def time_basis(self, degree, n_segments):
+        AxisymmetricBasis(self.r, self.theta, degree)
+
+    def time_fit(self, degree, n_segments):
+        self.basis.fit(self.b_r, self.b_theta, segments=self.segments)
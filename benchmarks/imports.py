@@ -0,0 +1,13 @@
+"""Benchmarks of the time to import the package in a fresh interpreter."""
+
+
+def timeraw_import():
+    return "import magda_tools"
+
+
+def timeraw_import_datafile():
+    return "from magda_tools import DataFile"
+
+
+def timeraw_import_model():
+    return "from magda_tools import BFieldModel"
@@ -0,0 +1,83 @@
+"""Benchmarks for construction and evaluation of BFieldModel."""
+
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from magda_tools import BFieldModel, DataFile, ModelCache, SphericalHarmonicModel
+
+from .synthetic import KG_TEMPLATE, N_ROWS, make_flat_file
+
+
+class Model:
+    params = [[1, 3, 10], [100_000]]
+    param_names = ["degree", "n_samples"]
+
+    def setup(self, degree, n_samples):
+        rng = np.random.default_rng(0)
+        self.gn0s = list(rng.uniform(-2e4, 2e4, degree))
+        self.r = rng.uniform(1.0, 30.0, n_samples)
+        self.theta = rng.uniform(0.0, np.pi, n_samples)
+        self.model = BFieldModel(self.gn0s)
+        self.reference = self.model.reference_functions()
+
+    def time_construct(self, degree, n_samples):
+        BFieldModel(self.gn0s)
+
+    def time_construct_reference(self, degree, n_samples):
+        BFieldModel(self.gn0s).reference_functions()
+
+    def time_field(self, degree, n_samples):
+        self.model.field(self.r, self.theta)
+
+    def time_field_reference(self, degree, n_samples):
+        r_hat, theta_hat = self.reference
+        r_hat(self.r, self.theta)
+        theta_hat(self.r, self.theta)
+
+    def peakmem_field(self, degree, n_samples):
+        self.model.field(self.r, self.theta)
+
+
+class ProcessDataFile:
+    params = [[1, 3, 10], [N_ROWS]]
+    param_names = ["degree", "n_rows"]
+
+    def setup(self, degree, n_rows):
+        self.directory = TemporaryDirectory()
+        self.datafile = DataFile(
+            str(make_flat_file(self.directory.name, n_rows, template=KG_TEMPLATE)),
+            mmap=True,
+        )
+        rng = np.random.default_rng(0)
+        self.gn0s = list(rng.uniform(-2e4, 2e4, degree))
+        self.model = BFieldModel(self.gn0s)
+        self.harmonic = SphericalHarmonicModel.from_gn0s(self.gn0s)
+        self.cache = ModelCache()
+        self.model.process_datafile(self.datafile, cache=self.cache)
+        self.disk_cache = ModelCache(0, f"{self.directory.name}/model_cache")
+        self.model.process_datafile(self.datafile, cache=self.disk_cache)
+
+    def teardown(self, degree, n_rows):
+        self.directory.cleanup()
+
+    def time_axisymmetric(self, degree, n_rows):
+        self.model.process_datafile(self.datafile)
+
+    def time_axisymmetric_chunked(self, degree, n_rows):
+        self.model.process_datafile(self.datafile, chunk_size=65536)
+
+    def time_axisymmetric_cached(self, degree, n_rows):
+        self.model.process_datafile(self.datafile, cache=self.cache)
+
+    def time_axisymmetric_disk_cached(self, degree, n_rows):
+        self.model.process_datafile(self.datafile, cache=self.disk_cache)
+
+    def time_spherical_harmonic(self, degree, n_rows):
+        self.harmonic.process_datafile(self.datafile)
+
+    def peakmem_axisymmetric(self, degree, n_rows):
+        self.model.process_datafile(self.datafile)
+
+    def peakmem_axisymmetric_chunked(self, degree, n_rows):
+        self.model.process_datafile(self.datafile, chunk_size=65536)
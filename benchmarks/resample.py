@@ -0,0 +1,29 @@
+"""Benchmarks for binned statistics and min-max decimation."""
+
+import numpy as np
+
+from magda_tools import bin_statistics, minmax_decimate
+
+from .synthetic import N_ROWS
+
+
+class Resample:
+    params = [[10_000, N_ROWS]]
+    param_names = ["n_samples"]
+
+    def setup(self, n_samples):
+        rng = np.random.default_rng(0)
+        self.unix_time = 1.4e9 + np.arange(n_samples, dtype=np.float64)
+        self.values = rng.normal(size=(n_samples, 3)).astype(np.float32)
+
+    def time_bin_mean(self, n_samples):
+        bin_statistics(self.unix_time, self.values, "1m")
+
+    def time_bin_all(self, n_samples):
+        bin_statistics(self.unix_time, self.values, "1m", ("mean", "min", "max", "std"))
+
+    def time_minmax_decimate(self, n_samples):
+        minmax_decimate(self.unix_time, self.values[:, 0], 2000)
+
+    def peakmem_bin_all(self, n_samples):
+        bin_statistics(self.unix_time, self.values, "1m", ("mean", "min", "max", "std"))
@@ -0,0 +1,95 @@
+"""Generation of synthetic MAGDA flat files for benchmarking.
+
+The header of one of the test data files is used as a template, with
+the number of rows and the time range rewritten, and a data file of
+random records in the corresponding layout is written alongside it.
+"""
+
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+from typing import Union
+
+import numpy as np
+
+from magda_tools.data_file import MAGDA_TIME_FMT_MS, DataFile
+
+TEST_DATA = Path(__file__).parent.parent / "tests/data/casdata"
+TEMPLATE = TEST_DATA / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffh"
+# planetocentric (KG) positions as required by the field models
+KG_TEMPLATE = TEST_DATA / "y08/08100/processed/08100_mrdcd_hkfgmn_kg_1m.ffh"
+
+# default number of rows, may be overridden via the environment
+N_ROWS = int(os.environ.get("MAGDA_BENCHMARK_ROWS", 1_000_000))
+
+LINE_LENGTH = 72
+
+
+def _header_line(text: str) -> str:
+    return text.ljust(LINE_LENGTH)[:LINE_LENGTH]
+
+
+def make_flat_file(
+    directory: Union[str, Path],
+    n_rows: int = N_ROWS,
+    cadence: float = 1.0,
+    template: Union[str, Path] = TEMPLATE,
+) -> Path:
+    """Write a synthetic flat file of ``n_rows`` records, with samples every
+    ``cadence`` seconds, into ``directory`` using the header at
+    ``template`` as a model. Returns the path of the data file.
+
+    Positions follow a circular orbit of 10 to 20 Saturn radii so that
+    derived quantities take realistic values; field values are random.
+    """
+    template = Path(template)
+    metadata = DataFile.parse_header(str(template))
+    with open(template) as f:
+        text = f.read()
+    lines = [text[i : i + LINE_LENGTH] for i in range(0, len(text), LINE_LENGTH)]
+
+    start = metadata["start"]
+    end = start + timedelta(seconds=cadence * max(n_rows - 1, 0))
+
+    def format_time(value: datetime) -> str:
+        return value.strftime(MAGDA_TIME_FMT_MS)[:-3].upper()
+
+    for i, line in enumerate(lines):
+        if line.startswith("NROWS"):
+            lines[i] = _header_line(f"NROWS = {n_rows:>10d}")
+        elif line.startswith("FIRST TIME"):
+            lines[i] = _header_line(f"FIRST TIME         = {format_time(start)}")
+        elif line.startswith("LAST TIME"):
+            lines[i] = _header_line(f"LAST TIME          = {format_time(end)}")
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    header_path = directory / template.name
+    with open(header_path, "w") as f:
+        f.write("".join(lines))
+
+    dtype = np.dtype([(c.name, ">" + c.type_) for c in metadata["columns"]])
+    records = np.zeros(n_rows, dtype)
+    names = dtype.names
+    assert names is not None
+
+    rng = np.random.default_rng(0)
+    # offset of the first sample from the J2000 timebase, as stored in
+    # the template data file
+    with open(template.with_suffix(".ffd"), "rb") as f:
+        first = np.fromfile(f, dtype, count=1)[names[0]][0]
+    records[names[0]] = first + cadence * np.arange(n_rows)
+    for name in names[1:]:
+        records[name] = rng.normal(0.0, 5.0, n_rows)
+
+    phase = np.linspace(0.0, 8 * np.pi, n_rows)
+    radius = 60268.0 * (15.0 + 5.0 * np.sin(phase / 7))
+    for name, values in zip(
+        names[-3:],
+        (radius * np.cos(phase), radius * np.sin(phase), 0.1 * radius * np.sin(phase)),
+    ):
+        records[name] = values
+
+    data_path = header_path.with_suffix(".ffd")
+    records.tofile(data_path)
+    return data_path
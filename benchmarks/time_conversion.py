@@ -0,0 +1,31 @@
+"""Benchmarks comparing construction of astropy times for the time
+column of a flat file with the numeric time axis."""
+
+import numpy as np
+from astropy.time import Time, TimeDelta
+
+from magda_tools.data_file import EPOCHS
+from magda_tools.time_conversion import epoch_seconds_to_unix, unix_to_datetime64
+
+
+class TimeConversion:
+    params = [10_000, 1_000_000]
+    param_names = ["n_rows"]
+
+    def setup(self, n_rows):
+        # one second resolution samples starting in 2017
+        self.seconds = 540_000_000.0 + np.arange(n_rows, dtype=">f8")
+        self.timebase_unix = EPOCHS["J2000"]
+        self.timebase = Time(self.timebase_unix, format="unix", scale="utc")
+
+    def time_astropy(self, n_rows):
+        TimeDelta(self.seconds, format="sec", scale="tai") + self.timebase
+
+    def time_astropy_datetime(self, n_rows):
+        (TimeDelta(self.seconds, format="sec", scale="tai") + self.timebase).datetime
+
+    def time_numeric(self, n_rows):
+        epoch_seconds_to_unix(self.seconds, self.timebase_unix)
+
+    def time_numeric_datetime64(self, n_rows):
+        unix_to_datetime64(epoch_seconds_to_unix(self.seconds, self.timebase_unix))
@@ -0,0 +1,24 @@
+"""Benchmarks for transformation of vectors between coordinate systems."""
+
+import numpy as np
+
+from magda_tools import transform_vectors
+
+from .synthetic import N_ROWS
+
+
+class Transforms:
+    params = [[N_ROWS], [("KSM", "KSO"), ("KG", "KSM"), ("KRTP", "KSM")]]
+    param_names = ["n_samples", "frames"]
+
+    def setup(self, n_samples, frames):
+        rng = np.random.default_rng(0)
+        self.unix_time = 1.4e9 + np.arange(n_samples, dtype=np.float64)
+        self.vectors = rng.normal(size=(n_samples, 3))
+        self.position_kg = rng.normal(size=(n_samples, 3)) * 1e6
+
+    def time_transform_vectors(self, n_samples, frames):
+        transform_vectors(self.vectors, self.unix_time, *frames, self.position_kg)
+
+    def peakmem_transform_vectors(self, n_samples, frames):
+        transform_vectors(self.vectors, self.unix_time, *frames, self.position_kg)
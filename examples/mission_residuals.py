@@ -0,0 +1,40 @@
+"""Compute the root mean square difference between the observed magnetic
+field and that predicted by a three term harmonic expansion model over
+every KRTP data file in a casdata directory tree. The data are streamed
+through a pool of worker processes one file at a time so the memory
+required does not depend on the number of files. Requires dask."""
+
+import argparse
+
+import dask
+import dask.array as da
+
+from magda_tools import BFieldModel, Catalog, open_dask, position_properties
+from magda_tools.calculate import SATURN_RADIUS_KM
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("casdata", type=str, help="Path to a casdata directory")
+    parser.add_argument("--res", type=str, default="1m", help="Data resolution")
+    args = parser.parse_args()
+
+    with Catalog(args.casdata) as catalog:
+        catalog.update()
+        files = catalog.query(coord="KRTP", res=args.res)
+
+    columns = open_dask(files, columns=["BX_KRTP", "BY_KRTP", "X_KG", "Y_KG", "Z_KG"])
+    position = position_properties(
+        columns["X_KG"], columns["Y_KG"], columns["Z_KG"], radius=SATURN_RADIUS_KM
+    )
+    model = BFieldModel([21160.0, 1560.0, 2320.0])
+    b_r, b_theta = model.field(position.distance, position.colatitude)
+
+    rms = [
+        da.sqrt(da.mean((observed - predicted) ** 2))
+        for observed, predicted in ((columns["BX"], b_r), (columns["BY"], b_theta))
+    ]
+    with dask.config.set(scheduler="processes"):
+        rms_r, rms_theta = dask.compute(*rms)
+    print(
+        f"{len(files)} files, RMS residual Br {rms_r:.2f} nT, Btheta {rms_theta:.2f} nT"
+    )
@@ -15,9 +15,9 @@ model = BFieldModel([21160.0, 1560.0, 2320.0])
 
 df = DataFile(args.FFD_file)
 r, theta, phi = model.process_datafile(df)
-plt.plot(df["TIME"].data.datetime, r)
-plt.plot(df["TIME"].data.datetime, theta)
-plt.plot(df["TIME"].data.datetime, phi)
+plt.plot(df.datetime64, r)
+plt.plot(df.datetime64, theta)
+plt.plot(df.datetime64, phi)
 
 plt.xlabel("Date and Time")
 plt.ylabel("Predicted Magnetic Field Strength (nT)")
@@ -1,7 +1,8 @@
 import argparse
 import matplotlib.pyplot as plt
 
-from magda_tools import DataFile
+from magda_tools import DataFile, minmax_decimate
+from magda_tools.time_conversion import unix_to_datetime64
 
 parser = argparse.ArgumentParser(
     description="Plot the magnetic field strength data from a Magda flat file"
@@ -11,9 +12,14 @@ args = parser.parse_args()
 
 df = DataFile(args.FFD_file)
 coord = df.coord.upper()
-plt.plot(df["TIME"].data.datetime, df[f"BX_{coord}"].data)
-plt.plot(df["TIME"].data.datetime, df[f"BY_{coord}"].data)
-plt.plot(df["TIME"].data.datetime, df[f"BZ_{coord}"].data)
+# reduce each component to the extremes within each horizontal pixel of
+# the figure, which looks the same as plotting every sample
+n_pixels = int(plt.figure().get_figwidth() * plt.rcParams["figure.dpi"])
+for component in ("BX", "BY", "BZ"):
+    times, values = minmax_decimate(
+        df.unix_time, df[f"{component}_{coord}"].data, n_pixels
+    )
+    plt.plot(unix_to_datetime64(times), values)
 
 plt.xlabel("Date and Time")
 plt.ylabel("Magnetic Field Strength (nT)")
@@ -18,10 +18,10 @@ x, y, z = df[f"BX_{coord}"].data, df[f"BY_{coord}"].data, df[f"BZ_{coord}"].data
 lat = latitude(x, y, z)
 dist = distance(x, y, z)
 
-l1 = plt.plot(df["TIME"].data.datetime, lat)[0]
+l1 = plt.plot(df.datetime64, lat)[0]
 plt.ylabel("Latitude (degrees)")
 plt.twinx()
-l2 = plt.plot(df["TIME"].data.datetime, dist, "r")[0]
+l2 = plt.plot(df.datetime64, dist, "r")[0]
 plt.ylabel("Distance (km)")
 plt.legend((l1, l2), ("latitude", "distance"))
 
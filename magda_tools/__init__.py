@@ -1,4 +1,83 @@
-from .calculate import distance  # noqa F401, F403
-from .calculate import SATURN_RADIUS_KM, latitude, saturn_local_time  # noqa F401, F403
-from .data_file import DataFile, MAGDA_TIME_FMT, MAGDA_TIME_FMT_MS  # noqa F401, F403
-from .model import BFieldModel  # noqa F401, F403
+"""Tools for reading and processing MAGDA flat files.
+
+The names below are imported from their submodules on first access so
+that importing the package is cheap and heavy dependencies (astropy,
+sympy, dask) are only imported by the functionality that uses them.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+# the submodule providing each name exported by the package
+_EXPORTS = {
+    "distance": "calculate",
+    "SATURN_RADIUS_KM": "calculate",
+    "latitude": "calculate",
+    "saturn_local_time": "calculate",
+    "saturn_local_time_array": "calculate",
+    "PositionProperties": "calculate",
+    "position_properties": "calculate",
+    "Catalog": "catalog",
+    "DataFile": "data_file",
+    "MAGDA_TIME_FMT": "data_file",
+    "MAGDA_TIME_FMT_MS": "data_file",
+    "RowCountWarning": "data_file",
+    "parse_headers": "data_file",
+    "MagdaDataset": "dataset",
+    "EventFinder": "events",
+    "EventTable": "events",
+    "find_events": "events",
+    "AxisymmetricBasis": "fitting",
+    "FitResult": "fitting",
+    "fit_datafile": "fitting",
+    "Profile": "instrumentation",
+    "profile": "instrumentation",
+    "BFieldModel": "model",
+    "SphericalHarmonicModel": "model",
+    "ModelCache": "model_cache",
+    "Resampled": "resample",
+    "bin_statistics": "resample",
+    "minmax_decimate": "resample",
+    "StatusSegments": "status",
+    "transform_positions": "transforms",
+    "transform_vectors": "transforms",
+    "FlatFileWriter": "writer",
+    "open_dask": "dask_arrays",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .calculate import distance  # noqa F401, F403
+    from .calculate import SATURN_RADIUS_KM, latitude, saturn_local_time  # noqa F401
+    from .calculate import PositionProperties, position_properties  # noqa F401, F403
+    from .calculate import saturn_local_time_array  # noqa F401, F403
+    from .catalog import Catalog  # noqa F401, F403
+    from .data_file import DataFile, MAGDA_TIME_FMT, MAGDA_TIME_FMT_MS  # noqa F401
+    from .data_file import RowCountWarning, parse_headers  # noqa F401, F403
+    from .dataset import MagdaDataset  # noqa F401, F403
+    from .events import EventFinder, EventTable, find_events  # noqa F401, F403
+    from .fitting import AxisymmetricBasis, FitResult, fit_datafile  # noqa F401, F403
+    from .instrumentation import Profile, profile  # noqa F401, F403
+    from .model import BFieldModel, SphericalHarmonicModel  # noqa F401, F403
+    from .model_cache import ModelCache  # noqa F401, F403
+    from .resample import Resampled, bin_statistics, minmax_decimate  # noqa F401
+    from .status import StatusSegments  # noqa F401, F403
+    from .transforms import transform_positions, transform_vectors  # noqa F401
+    from .writer import FlatFileWriter  # noqa F401, F403
+    from .dask_arrays import open_dask  # noqa F401, F403
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f".{module}", __name__), name)
+    # cache so that later lookups bypass this function
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -1,8 +1,25 @@
-from typing import Union
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from astropy.time import Time, TimeDelta
 import numpy as np
 
+from .dask_arrays import is_dask_array, map_samples
+from .instrumentation import stage
+from .time_conversion import is_astropy_time
+
+if TYPE_CHECKING:
+    from astropy.time import Time, TimeDelta
+
 # Fitted parameters for calculation of saturn local time
 SLT_OMEGA: float = 26.75
 SLT_ALPHA: float = 10759.5
@@ -16,11 +33,11 @@ SATURN_RADIUS_KM: float = 60268.0
 
 
 def saturn_local_time(
-    time: Time,
+    time: "Time",
     x_ksm: Union[float, np.ndarray],
     y_ksm: Union[float, np.ndarray],
     z_ksm: Union[float, np.ndarray],
-) -> TimeDelta:
+) -> "TimeDelta":
     """For the given `time` and positions in the ksm coordinate
     system return an estimated value for Saturn local time.
 
@@ -38,19 +55,15 @@ def saturn_local_time(
     -------
     float:
       saturn local time in seconds from midnight
+
+    See :func:`saturn_local_time_array` to avoid the construction of
+    astropy objects.
     """
-    days_since_epoch = time.utc.unix / SECS_PER_DAY
+    from astropy.time import TimeDelta
 
-    lambda_ = (
-        SLT_OMEGA * np.sin((2 * np.pi * days_since_epoch / SLT_ALPHA) + SLT_PHI) - SLT_K
+    return TimeDelta(
+        saturn_local_time_array(time.utc.unix, x_ksm, y_ksm, z_ksm), format="sec"
     )
-    X = (x_ksm * np.cos(lambda_ * np.pi / 180)) - (
-        z_ksm * np.sin(lambda_ * np.pi / 180)
-    )
-
-    phi = (np.arctan2(y_ksm, X) * 180 / np.pi) % 360
-
-    return TimeDelta(((12 + (phi * 24 / 360)) % 24) * 3600, format="sec")
 
 
 def latitude(
@@ -85,3 +98,378 @@ def distance(
         return dist / radius
     else:
         return dist
+
+
+class PositionProperties(NamedTuple):
+    """Properties of a trajectory returned by :func:`position_properties`.
+
+    Attributes
+    ----------
+    distance: array of floats
+      distance from the origin in km, or multiples of ``radius``
+    latitude: array of floats
+      latitude in degrees
+    colatitude: array of floats
+      co-latitude in radians, as used by the field models
+    local_time: array of floats or None
+      Saturn local time in seconds from midnight, if times were provided
+    """
+
+    distance: np.ndarray
+    latitude: np.ndarray
+    colatitude: np.ndarray
+    local_time: Optional[np.ndarray]
+
+
+# number of samples processed at a time by the numpy implementation of
+# position_properties, chosen so that the working arrays stay in cache
+POSITION_BLOCK_SIZE: int = 16384
+
+
+def _as_unix_seconds(time: Any) -> np.ndarray:
+    """Return ``time`` as an array of UTC unix seconds. Accepts astropy
+    times, ``datetime64`` arrays or numbers of seconds."""
+    if is_astropy_time(time):
+        return time.utc.unix
+    time = np.asarray(time)
+    if np.issubdtype(time.dtype, np.datetime64):
+        return time.astype("datetime64[ns]").astype(np.int64) / 1e9
+    return time.astype(np.float64, copy=False)
+
+
+SLT_UNITS = {"seconds": 3600.0, "hours": 1.0}
+
+
+def _slt_lambda(unix: np.ndarray) -> np.ndarray:
+    """Return the seasonal longitude of the KSM frame in radians at UTC
+    unix seconds ``unix``."""
+    days = np.asarray(unix, dtype=np.float64) / SECS_PER_DAY
+    lambda_ = SLT_OMEGA * np.sin((2 * np.pi * days / SLT_ALPHA) + SLT_PHI) - SLT_K
+    return lambda_ * np.pi / 180
+
+
+class _LambdaTable(NamedTuple):
+    """The cosine and sine of the seasonal longitude at regular times, for
+    linear interpolation."""
+
+    start: float
+    step: float
+    cos: np.ndarray
+    sin: np.ndarray
+    cos_slope: np.ndarray
+    sin_slope: np.ndarray
+
+    @classmethod
+    def build(cls, start: float, stop: float, step: float) -> "_LambdaTable":
+        n_steps = int(np.ceil((stop - start) / step)) + 2
+        lambda_ = _slt_lambda(start + step * np.arange(n_steps))
+        cos, sin = np.cos(lambda_), np.sin(lambda_)
+        return cls(start, step, cos, sin, np.diff(cos), np.diff(sin))
+
+
+def _local_time_block(
+    unix: np.ndarray,
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    out: np.ndarray,
+    scratch: np.ndarray,
+    table: Optional[_LambdaTable] = None,
+    scale: float = SLT_UNITS["seconds"],
+) -> None:
+    """Compute the Saturn local time for a single block of samples writing
+    only into ``out`` and ``scratch``, see :func:`saturn_local_time_array`.
+    """
+    if table is None:
+        lambda_ = _slt_lambda(unix)
+        np.sin(lambda_, out=scratch)
+        np.cos(lambda_, out=out)
+    else:
+        np.subtract(unix, table.start, out=out)
+        out /= table.step
+        index = out.astype(np.intp)
+        out -= index
+        fraction = out.copy()
+        np.take(table.sin_slope, index, out=scratch)
+        scratch *= fraction
+        scratch += table.sin[index]
+        np.take(table.cos_slope, index, out=out)
+        out *= fraction
+        out += table.cos[index]
+    # rotate into the frame with x in the equatorial plane
+    scratch *= z
+    out *= x
+    out -= scratch
+    np.arctan2(y, out, out=out)
+    out *= 12 / np.pi
+    out += 12
+    out %= 24
+    if scale != 1:
+        out *= scale
+
+
+def saturn_local_time_array(
+    time: Any,
+    x_ksm: Union[float, np.ndarray],
+    y_ksm: Union[float, np.ndarray],
+    z_ksm: Union[float, np.ndarray],
+    units: str = "seconds",
+    out: Optional[np.ndarray] = None,
+    lambda_step: Optional[float] = None,
+) -> np.ndarray:
+    """As :func:`saturn_local_time` but taking numeric times and returning
+    a plain array of floats, avoiding the construction of astropy objects.
+
+    Parameters
+    ----------
+    time: float array, datetime64 array or astropy.time
+      time of each position, floats are taken as UTC unix seconds
+    x_ksm, y_ksm, z_ksm: float or array of floats
+      position coordinates in the KSM system in km
+    units: str
+      "seconds" (the default) or "hours" from midnight
+    out: array of floats, optional
+      a contiguous float64 array to write the results into, e.g. a buffer
+      reused across calls
+    lambda_step: float, optional
+      if given the seasonal term, which varies over Saturn's orbital
+      period, is evaluated every ``lambda_step`` seconds and linearly
+      interpolated rather than evaluated for every sample. A step of a
+      day (86400 s) introduces errors of around 1e-6 degrees
+
+    The inputs may also be dask arrays (without ``out``), see
+    :mod:`magda_tools.dask_arrays`.
+
+    Returns
+    -------
+    array of floats
+      saturn local time in ``units`` from midnight
+    """
+    if units not in SLT_UNITS:
+        raise ValueError(f"Unknown units {units}, expected one of {list(SLT_UNITS)}")
+    if any(is_dask_array(v) for v in (time, x_ksm, y_ksm, z_ksm)):
+        if out is not None:
+            raise ValueError("Output arrays can not be given for dask arrays")
+
+        def evaluate(
+            t: np.ndarray, bx: np.ndarray, by: np.ndarray, bz: np.ndarray
+        ) -> Tuple[np.ndarray]:
+            return (saturn_local_time_array(t, bx, by, bz, units, None, lambda_step),)
+
+        return map_samples(evaluate, [time, x_ksm, y_ksm, z_ksm], 1)[0]
+
+    unix, x, y, z = np.broadcast_arrays(
+        _as_unix_seconds(time), np.asarray(x_ksm), np.asarray(y_ksm), np.asarray(z_ksm)
+    )
+    if out is None:
+        out = np.empty(x.shape)
+    elif out.shape != x.shape or not out.flags.c_contiguous or out.dtype != np.float64:
+        raise ValueError("Output array must be contiguous float64 matching the input")
+    unix, x, y, z = unix.ravel(), x.ravel(), y.ravel(), z.ravel()
+    flat = out.reshape(-1)
+
+    table = None
+    if lambda_step is not None and unix.size:
+        table = _LambdaTable.build(unix.min(), unix.max(), lambda_step)
+
+    with stage("saturn_local_time") as timer:
+        timer.add(rows=x.size)
+        scratch = np.empty(min(POSITION_BLOCK_SIZE, x.size))
+        for start in range(0, x.size, POSITION_BLOCK_SIZE):
+            block = slice(start, start + POSITION_BLOCK_SIZE)
+            n = len(x[block])
+            _local_time_block(
+                unix[block],
+                x[block],
+                y[block],
+                z[block],
+                flat[block],
+                scratch[:n],
+                table,
+                SLT_UNITS[units],
+            )
+    return out
+
+
+def _position_block(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    unix: Optional[np.ndarray],
+    radius: Optional[float],
+    out: PositionProperties,
+    scratch: np.ndarray,
+) -> None:
+    """Compute the position properties for a single block of samples
+    writing only into ``out`` and ``scratch``."""
+    dist, lat, colat, slt = out
+    np.multiply(x, x, out=dist)
+    np.multiply(y, y, out=scratch)
+    dist += scratch
+    np.multiply(z, z, out=scratch)
+    dist += scratch
+    np.sqrt(dist, out=dist)
+
+    np.divide(z, dist, out=lat)
+    np.arcsin(lat, out=lat)
+    lat /= np.pi
+    lat *= 180
+    np.subtract(90.0, lat, out=colat)
+    colat /= 180
+    colat *= np.pi
+
+    if radius is not None:
+        dist /= radius
+
+    if unix is not None and slt is not None:
+        _local_time_block(unix, x, y, z, slt, scratch)
+
+
+@lru_cache(maxsize=None)
+def _numba_kernel() -> Callable:
+    """Compile the numba implementation of position_properties. numba is
+    only imported when this backend is first used."""
+    import numba
+
+    @numba.njit(parallel=True, cache=True)
+    def kernel(x, y, z, unix, radius, dist, lat, colat, slt):  # pragma: no cover
+        for i in numba.prange(x.shape[0]):
+            d = np.sqrt(x[i] * x[i] + y[i] * y[i] + z[i] * z[i])
+            la = np.arcsin(z[i] / d) / np.pi * 180
+            lat[i] = la
+            colat[i] = (90.0 - la) / 180 * np.pi
+            dist[i] = d / radius
+            if unix.shape[0]:
+                lambda_ = (
+                    SLT_OMEGA
+                    * np.sin(2 * np.pi * (unix[i] / SECS_PER_DAY) / SLT_ALPHA + SLT_PHI)
+                    - SLT_K
+                )
+                lam = lambda_ * np.pi / 180
+                X = x[i] * np.cos(lam) - z[i] * np.sin(lam)
+                phi = (np.arctan2(y[i], X) * 180 / np.pi) % 360
+                slt[i] = ((12 + phi * 24 / 360) % 24) * 3600
+
+    return kernel
+
+
+def position_properties(
+    x: Union[float, np.ndarray],
+    y: Union[float, np.ndarray],
+    z: Union[float, np.ndarray],
+    time: Any = None,
+    radius: Optional[float] = None,
+    out: Optional[PositionProperties] = None,
+    backend: str = "numpy",
+) -> PositionProperties:
+    """For the given x, y and z coordinates return the distance,
+    latitude, co-latitude and, if ``time`` is given, the Saturn local
+    time in a single pass over the data. The coordinates are used for
+    all properties so must be in a frame suitable for each of them (see
+    :func:`latitude` and :func:`saturn_local_time`).
+
+    Parameters
+    ----------
+    x, y, z: float or array of floats
+      position coordinates in km
+    time: astropy.time, datetime64 or float array, optional
+      time of each position, floats are taken as UTC unix seconds
+    radius: float, optional
+      if provided distances are returned as multiples of this value
+    out: PositionProperties, optional
+      preallocated arrays to write the results into. ``local_time`` may
+      be None if no times are given
+    backend: str
+      "numpy" (the default) for a blocked numpy implementation or "numba"
+      for a compiled kernel parallelised across cores, which requires
+      numba to be installed. The numba kernel is compiled on first use
+      and cached on disk
+
+    The coordinates and (numeric) times may also be dask arrays, see
+    :mod:`magda_tools.dask_arrays`, in which case the results are lazily
+    evaluated dask arrays.
+
+    Returns
+    -------
+    PositionProperties
+    """
+    if backend not in ("numpy", "numba"):
+        raise ValueError(f"Unknown backend {backend}")
+    if backend == "numba" and find_spec("numba") is None:
+        raise ImportError("The numba backend requires numba to be installed")
+
+    if any(is_dask_array(v) for v in (x, y, z, time)):
+        # evaluate lazily, one chunk at a time
+        if out is not None:
+            raise ValueError("Output arrays can not be given for dask arrays")
+        inputs = [x, y, z] if time is None else [x, y, z, time]
+
+        def evaluate(*blocks: np.ndarray) -> Tuple[np.ndarray, ...]:
+            bx, by, bz = blocks[:3]
+            block_time = blocks[3] if len(blocks) > 3 else None
+            properties = position_properties(
+                bx, by, bz, block_time, radius, backend=backend
+            )
+            return tuple(v for v in properties if v is not None)
+
+        results = map_samples(evaluate, inputs, len(inputs))
+        return PositionProperties(*results, *([None] * (4 - len(results))))
+
+    with stage("position_properties") as timer:
+        x, y, z = np.broadcast_arrays(np.asarray(x), np.asarray(y), np.asarray(z))
+        unix = (
+            None if time is None else np.broadcast_to(_as_unix_seconds(time), x.shape)
+        )
+        if out is None:
+            out = PositionProperties(
+                np.empty(x.shape),
+                np.empty(x.shape),
+                np.empty(x.shape),
+                None if unix is None else np.empty(x.shape),
+            )
+            timer.allocated(*out)
+        timer.add(rows=x.size)
+
+        for o in out:
+            if o is not None and (o.shape != x.shape or not o.flags.c_contiguous):
+                raise ValueError("Output arrays must be contiguous and match the input")
+        x, y, z = x.ravel(), y.ravel(), z.ravel()
+        unix = None if unix is None or out.local_time is None else unix.ravel()
+        views: List[Any] = [None if o is None else o.reshape(-1) for o in out]
+
+        if backend == "numba":
+            # numba requires native byte order
+            _numba_kernel()(
+                np.asarray(x, dtype=np.float64),
+                np.asarray(y, dtype=np.float64),
+                np.asarray(z, dtype=np.float64),
+                np.empty(0) if unix is None else unix,
+                1.0 if radius is None else radius,
+                *(np.empty(0) if v is None else v for v in views),
+            )
+            return out
+
+        # each block of coordinates is copied into native float64 buffers so
+        # that all arithmetic is done in double precision
+        size = min(POSITION_BLOCK_SIZE, x.size)
+        bx, by, bz, scratch = (np.empty(size) for _ in range(4))
+        for start in range(0, x.size, POSITION_BLOCK_SIZE):
+            block = slice(start, start + POSITION_BLOCK_SIZE)
+            n = len(x[block])
+            for buffer, values in ((bx, x), (by, y), (bz, z)):
+                buffer[:n] = values[block]
+            _position_block(
+                bx[:n],
+                by[:n],
+                bz[:n],
+                None if unix is None else unix[block],
+                radius,
+                PositionProperties(
+                    views[0][block],
+                    views[1][block],
+                    views[2][block],
+                    None if views[3] is None else views[3][block],
+                ),
+                scratch[:n],
+            )
+        return out
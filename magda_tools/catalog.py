@@ -0,0 +1,204 @@
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import sqlite3
+from typing import Any, Iterator, List, Optional, Tuple, Union
+
+from .data_file import parse_headers
+from .time_conversion import as_unix
+
+CATALOG_FILENAME = ".magda_catalog.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    n_rows INTEGER,
+    telem TEXT,
+    sensor TEXT,
+    coord TEXT,
+    res TEXT,
+    columns TEXT
+);
+CREATE INDEX IF NOT EXISTS files_selection
+    ON files (coord, sensor, res, telem, start_time, end_time);
+"""
+
+_FIELDS = "path, start_time, end_time, n_rows, telem, sensor, coord, res, columns"
+
+
+@dataclass
+class CatalogEntry:
+    """Metadata recorded in a :class:`Catalog` for a single flat file."""
+
+    header_path: Path
+    start: float
+    end: float
+    n_rows: int
+    telem: str
+    sensor: str
+    coord: str
+    res: str
+    columns: List[str]
+
+    @property
+    def data_path(self) -> Path:
+        return self.header_path.with_suffix(".ffd")
+
+
+class Catalog(object):
+    """An index of the flat files within a MAGDA casdata directory tree
+    (``yYY/DDDDD/processed/*.ffh``).
+
+    The metadata from each header file is stored in an SQLite database
+    so that the files covering an interval can be found without
+    parsing every header. Calling :meth:`update` rescans the tree and
+    only parses headers that are new or have been modified.
+
+    Times are held as UTC unix seconds. Query bounds may be given as
+    numbers, ``datetime`` or ``numpy.datetime64`` values.
+    """
+
+    def __init__(
+        self, root: Union[str, Path], index_path: Optional[Union[str, Path]] = None
+    ) -> None:
+        """Arguments
+        ---------
+        root: path
+          the top level directory of the casdata tree
+        index_path: path, optional
+          where to store the index, defaults to a file within ``root``
+        """
+        self.root = Path(root)
+        self.index_path = (
+            Path(index_path) if index_path is not None else self.root / CATALOG_FILENAME
+        )
+        self._connection = sqlite3.connect(str(self.index_path))
+        self._connection.executescript(_SCHEMA)
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _scan(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """Yield the path relative to root and stat result of each header
+        file in the tree."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".ffh"):
+                    path = os.path.join(dirpath, filename)
+                    yield os.path.relpath(path, self.root), os.stat(path)
+
+    def update(self, workers: Optional[int] = 1) -> int:
+        """Bring the index up to date with the directory tree. Returns the
+        number of header files that were parsed. Headers are parsed in
+        ``workers`` processes, see :func:`parse_headers`."""
+        known = {
+            path: (mtime_ns, size)
+            for path, mtime_ns, size in self._connection.execute(
+                "SELECT path, mtime_ns, size FROM files"
+            )
+        }
+
+        changed = []
+        for path, stat in self._scan():
+            if known.pop(path, None) != (stat.st_mtime_ns, stat.st_size):
+                changed.append((path, stat))
+        table = parse_headers(
+            [os.path.join(self.root, path) for path, _ in changed], workers
+        )
+
+        def optional(value: Any) -> Any:
+            return None if value != value or value == -1 else value.item()
+
+        rows = [
+            (
+                path,
+                stat.st_mtime_ns,
+                stat.st_size,
+                optional(header["start"]),
+                optional(header["end"]),
+                optional(header["n_rows"]),
+                str(header["telem"]),
+                str(header["sensor"]),
+                str(header["coord"]),
+                str(header["res"]),
+                str(header["columns"]),
+            )
+            for (path, stat), header in zip(changed, table)
+        ]
+
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            # anything not seen during the scan has been removed
+            self._connection.executemany(
+                "DELETE FROM files WHERE path = ?", [(path,) for path in known]
+            )
+        return len(rows)
+
+    def entries(
+        self,
+        start: Any = None,
+        end: Any = None,
+        telem: Optional[str] = None,
+        sensor: Optional[str] = None,
+        coord: Optional[str] = None,
+        res: Optional[str] = None,
+    ) -> List[CatalogEntry]:
+        """Return the entries for files with data overlapping the interval
+        [``start``, ``end``] and matching any of the given file attributes,
+        ordered by start time."""
+        clauses: List[str] = []
+        values: List[Any] = []
+        if start is not None:
+            clauses.append("end_time >= ?")
+            values.append(as_unix(start))
+        if end is not None:
+            clauses.append("start_time <= ?")
+            values.append(as_unix(end))
+        for name, value in (
+            ("telem", telem),
+            ("sensor", sensor),
+            ("coord", coord),
+            ("res", res),
+        ):
+            if value is not None:
+                clauses.append(f"{name} = ?")
+                values.append(value.upper() if name != "res" else value)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        query = f"SELECT {_FIELDS} FROM files {where} ORDER BY start_time, path"
+        return [self._entry(row) for row in self._connection.execute(query, values)]
+
+    def _entry(self, row: Tuple[Any, ...]) -> CatalogEntry:
+        path, start, end, n_rows, telem, sensor, coord, res, columns = row
+        return CatalogEntry(
+            self.root / path,
+            start,
+            end,
+            n_rows,
+            telem,
+            sensor,
+            coord,
+            res,
+            columns.split(",") if columns else [],
+        )
+
+    def query(self, *args: Any, **kwargs: Any) -> List[Path]:
+        """Return the paths of the data files matching a selection. Accepts
+        the same arguments as :meth:`entries`."""
+        return [entry.data_path for entry in self.entries(*args, **kwargs)]
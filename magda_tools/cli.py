@@ -0,0 +1,432 @@
+"""The ``magda-tools`` command line interface for bulk processing of flat
+files.
+
+Input files are given as paths or glob patterns and/or selected from a
+:class:`Catalog` of a casdata tree. Commands that produce a file per
+input write them to an output directory as each input is processed, by
+a pool of worker processes (one per core by default). Completed inputs
+are recorded in a progress log within the output directory so that an
+interrupted run can be resumed by repeating the command, skipping inputs
+that are unchanged since they were processed. Each worker constructs
+the field model once and reuses it, along with cached timebases, for
+every file it processes.
+
+Run ``magda-tools --help`` for the available commands.
+"""
+
+import argparse
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+import csv
+import glob
+import hashlib
+import json
+from multiprocessing import get_context
+import os
+from pathlib import Path
+import sys
+from typing import Any, Callable, Dict, List, Optional, Sequence, TextIO
+
+import numpy as np
+
+PROGRESS_FILENAME = "magda_progress.jsonl"
+
+DEFAULT_GN0S = (21160.0, 1560.0, 2320.0)
+
+# state shared by the tasks run in a worker process, see _initialise
+_STATE: Dict[str, Any] = {}
+
+
+def _source_key(path: str) -> Dict[str, int]:
+    """The modification time and size of ``path``, used to detect inputs
+    modified since they were processed."""
+    stat = os.stat(path)
+    return dict(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+
+
+class Progress(object):
+    """A log of the inputs completed by a command, one JSON object per
+    line, appended to as each input completes. Only the entries of the
+    same command run with the same ``options`` count as completed."""
+
+    def __init__(
+        self,
+        path: Path,
+        command: str,
+        options: Dict[str, Any],
+        restart: bool = False,
+    ) -> None:
+        self.path = path
+        self.command = command
+        self.options = options
+        self.completed: Dict[str, Dict[str, Any]] = {}
+        if restart and path.exists():
+            path.unlink()
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a line truncated by an interrupted run
+                        continue
+                    if (
+                        record.get("command") == command
+                        and record.get("options") == options
+                    ):
+                        self.completed[record["path"]] = record
+
+    def is_complete(self, path: str, output: Path) -> bool:
+        """Return True if ``path`` was processed into ``output`` and has not
+        since been modified."""
+        record = self.completed.get(path)
+        if record is None or not output.exists():
+            return False
+        try:
+            source = _source_key(path)
+        except FileNotFoundError:
+            # reported as a failure when processed
+            return False
+        return all(record.get(k) == v for k, v in source.items())
+
+    def record(self, path: str, result: Dict[str, Any]) -> None:
+        """Record the completion of ``path`` with the ``result`` of its
+        processing."""
+        entry = dict(
+            command=self.command,
+            options=self.options,
+            path=path,
+            **_source_key(path),
+            **result,
+        )
+        self.completed[path] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _write_atomic(output: Path, write: Callable[[str], None]) -> None:
+    """Call ``write`` with a temporary path, with the same extension as
+    ``output``, and move the file written into place at ``output`` so that
+    interrupted writes leave no output."""
+    temporary = output.with_name(f"{output.stem}.tmp{output.suffix}")
+    write(str(temporary))
+    os.replace(temporary, output)
+
+
+def _initialise(options: Dict[str, Any]) -> None:
+    """Prepare the state reused by every task run in this process."""
+    _STATE.clear()
+    _STATE.update(options)
+    if "gn0s" in options:
+        from .model import BFieldModel
+
+        _STATE["model"] = BFieldModel(list(options["gn0s"]))
+
+
+def _convert(path: str, output: Path) -> Dict[str, Any]:
+    """Convert a flat file to the columnar cache format or an ``.npz`` of
+    its columns."""
+    from .data_file import DataFile
+
+    df = DataFile(path)
+    if _STATE["format"] == "cache":
+        df.to_cache(str(output.parent))
+    else:
+        columns = {c.name: np.asarray(c.data) for c in df.columns[1:]}
+        _write_atomic(
+            output,
+            lambda temporary: np.savez(temporary, unix_time=df.unix_time, **columns),
+        )
+    return dict(n_rows=df.n_rows)
+
+
+def _model_residuals(path: str, output: Path) -> Dict[str, Any]:
+    """Write the difference between the observed field in KRTP components
+    and that of the model, returning the root mean square residuals."""
+    from .calculate import SATURN_RADIUS_KM, position_properties
+    from .data_file import DataFile
+
+    df = DataFile(path)
+    model = _STATE["model"]
+    x, y, z = df.position_in("KG").T
+    position = position_properties(x, y, z, radius=SATURN_RADIUS_KM)
+    b_r, b_theta = model.field(position.distance, position.colatitude)
+    predicted = np.stack(
+        [b_r, b_theta, model.phi_hat(position.distance, position.colatitude)], 1
+    )
+    residual = df.field_in("KRTP") - predicted
+
+    _write_atomic(
+        output,
+        lambda temporary: np.savez(
+            temporary, unix_time=df.unix_time, residual=residual, predicted=predicted
+        ),
+    )
+    with np.errstate(invalid="ignore"):
+        rms = np.sqrt(np.nanmean(residual**2, axis=0))
+    return dict(n_rows=df.n_rows, rms=[float(v) for v in rms])
+
+
+def _resample(path: str, output: Path) -> Dict[str, Any]:
+    """Resample a flat file and save the result as ``.npz``."""
+    from .data_file import DataFile
+
+    resampled = DataFile(path).resample(
+        _STATE["cadence"], _STATE["columns"], _STATE["statistics"]
+    )
+
+    _write_atomic(output, lambda temporary: resampled.save(temporary, source=path))
+    return dict(n_bins=len(resampled))
+
+
+# the task run for each input by the per-file commands
+TASKS: Dict[str, Callable[[str, Path], Dict[str, Any]]] = {
+    "convert": _convert,
+    "model-residuals": _model_residuals,
+    "resample": _resample,
+}
+
+
+def _output_path(path: str, output_dir: Path, options: Dict[str, Any]) -> Path:
+    """The output written for the input ``path``, see :meth:`DataFile.to_cache`
+    for the name of caches."""
+    name = Path(path).name
+    if options.get("format") == "cache":
+        return output_dir / (name + ".cache")
+    return output_dir / (os.path.splitext(name)[0] + ".npz")
+
+
+def _run_task(command: str, path: str, output: str) -> Dict[str, Any]:
+    """Run the task of ``command`` on ``path``, returning its result or
+    the error raised."""
+    try:
+        return TASKS[command](path, Path(output))
+    except Exception as error:
+        return dict(error=f"{type(error).__name__}: {error}")
+
+
+def _default_index(root: str) -> Path:
+    """The catalog index of the casdata tree at ``root`` in the user cache
+    directory, leaving the tree itself untouched."""
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    digest = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:16]
+    path = Path(cache) / "magda_tools" / f"catalog_{digest}.sqlite"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _input_files(args: argparse.Namespace, suffix: str) -> List[str]:
+    """Return the input files selected by ``args`` with the file extension
+    ``suffix`` (.ffd or .ffh), in order and without duplicates."""
+    paths: List[str] = []
+    for pattern in args.paths:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            raise SystemExit(f"No files match {pattern}")
+        paths += matches
+    if args.catalog is not None:
+        from .catalog import Catalog
+
+        index = args.index if args.index is not None else _default_index(args.catalog)
+        with Catalog(args.catalog, index_path=index) as catalog:
+            catalog.update(workers=args.workers)
+            paths += [
+                str(p)
+                for p in catalog.query(
+                    args.start,
+                    args.end,
+                    telem=args.telem,
+                    sensor=args.sensor,
+                    coord=args.coord,
+                    res=args.res,
+                )
+            ]
+    return list(dict.fromkeys(os.path.splitext(p)[0] + suffix for p in paths))
+
+
+def _metadata(args: argparse.Namespace, out: TextIO) -> int:
+    """Write the metadata of the selected headers as CSV."""
+    from .data_file import HEADER_TABLE_FIELDS, parse_headers
+
+    table = parse_headers(_input_files(args, ".ffh"), workers=args.workers)
+    target = open(args.output, "w", newline="") if args.output else out
+    try:
+        writer = csv.writer(target)
+        writer.writerow(HEADER_TABLE_FIELDS)
+        writer.writerows(row.tolist() for row in table)
+    finally:
+        if target is not out:
+            target.close()
+    return 0
+
+
+def _run_files(args: argparse.Namespace, options: Dict[str, Any], out: TextIO) -> int:
+    """Run the per-file command ``args.command`` over the selected inputs,
+    skipping those already completed, and return the exit status."""
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    progress = Progress(
+        output_dir / PROGRESS_FILENAME, args.command, options, args.restart
+    )
+    inputs = _input_files(args, ".ffd")
+    outputs = [(path, _output_path(path, output_dir, options)) for path in inputs]
+    pending = [
+        (path, output)
+        for path, output in outputs
+        if not progress.is_complete(path, output)
+    ]
+    print(
+        f"{len(inputs) - len(pending)} of {len(inputs)} files already processed",
+        file=out,
+    )
+
+    failures = 0
+
+    def complete(path: str, result: Dict[str, Any]) -> None:
+        nonlocal failures
+        if "error" in result:
+            failures += 1
+            print(f"{path}: {result['error']}", file=sys.stderr)
+        else:
+            progress.record(path, result)
+            print(f"{path}: {json.dumps(result)}", file=out)
+
+    if args.workers == 1 or len(pending) <= 1:
+        _initialise(options)
+        for path, output in pending:
+            complete(path, _run_task(args.command, path, str(output)))
+    else:
+        with ProcessPoolExecutor(
+            args.workers,
+            mp_context=get_context("spawn"),
+            initializer=_initialise,
+            initargs=(options,),
+        ) as pool:
+            futures: Dict[Future, str] = {
+                pool.submit(_run_task, args.command, path, str(output)): path
+                for path, output in pending
+            }
+            for future in as_completed(futures):
+                complete(futures[future], future.result())
+    return 1 if failures else 0
+
+
+def _workers(value: str) -> Optional[int]:
+    workers = int(value)
+    return None if workers <= 0 else workers
+
+
+def _time(value: str) -> np.datetime64:
+    return np.datetime64(value)
+
+
+def parser() -> argparse.ArgumentParser:
+    """Return the argument parser of the command line interface."""
+    inputs = argparse.ArgumentParser(add_help=False)
+    group = inputs.add_argument_group("input selection")
+    group.add_argument(
+        "paths", nargs="*", help="flat files or glob patterns (e.g. 'y17/**/*.ffd')"
+    )
+    group.add_argument("--catalog", help="select files from this casdata tree")
+    group.add_argument(
+        "--index",
+        help="file holding the index of the catalog, by default in the user "
+        "cache directory",
+    )
+    group.add_argument("--start", type=_time, help="ISO start time of the selection")
+    group.add_argument("--end", type=_time, help="ISO end time of the selection")
+    for name in ("telem", "sensor", "coord", "res"):
+        group.add_argument(f"--{name}", help=f"select files by {name}")
+    inputs.add_argument(
+        "-j",
+        "--workers",
+        type=_workers,
+        default=None,
+        help="number of worker processes, by default one per core",
+    )
+
+    per_file = argparse.ArgumentParser(add_help=False, parents=[inputs])
+    per_file.add_argument(
+        "-o", "--output", required=True, help="directory to write outputs to"
+    )
+    per_file.add_argument(
+        "--restart",
+        action="store_true",
+        help="reprocess all inputs rather than resuming",
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="magda-tools", description="Bulk processing of MAGDA flat files."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    metadata = commands.add_parser(
+        "metadata", parents=[inputs], help="tabulate header metadata as CSV"
+    )
+    metadata.add_argument("-o", "--output", help="CSV file, by default stdout")
+
+    convert = commands.add_parser(
+        "convert", parents=[per_file], help="convert flat files for fast loading"
+    )
+    convert.add_argument(
+        "--format",
+        choices=("cache", "npz"),
+        default="cache",
+        help="a memory mappable cache (see DataFile.from_cache) or .npz",
+    )
+
+    residuals = commands.add_parser(
+        "model-residuals",
+        parents=[per_file],
+        help="difference between the observed and model field in KRTP",
+    )
+    residuals.add_argument(
+        "--gn0s",
+        type=float,
+        nargs="+",
+        default=list(DEFAULT_GN0S),
+        help="coefficients of the axisymmetric model in nT",
+    )
+
+    resample = commands.add_parser(
+        "resample", parents=[per_file], help="resample flat files to a cadence"
+    )
+    resample.add_argument(
+        "--cadence", required=True, help="bin width, e.g. 60, 1m or 1h"
+    )
+    resample.add_argument(
+        "--columns", nargs="+", help="columns to resample, by default all reals"
+    )
+    resample.add_argument(
+        "--statistics",
+        nargs="+",
+        default=["mean"],
+        choices=("mean", "min", "max", "std"),
+        help="statistics to calculate in each bin",
+    )
+    return parser
+
+
+def main(argv: Optional[Sequence[str]] = None, out: Optional[TextIO] = None) -> int:
+    """Run the command line interface with the arguments ``argv``, by
+    default those of the process, writing progress to ``out``, by default
+    stdout, and return the exit status."""
+    out = sys.stdout if out is None else out
+    args = parser().parse_args(argv)
+    if not args.paths and args.catalog is None:
+        raise SystemExit("No input files given, pass paths or --catalog")
+    if args.command == "metadata":
+        return _metadata(args, out)
+    options: Dict[str, Any] = {}
+    if args.command == "convert":
+        options = dict(format=args.format)
+    elif args.command == "model-residuals":
+        options = dict(gn0s=args.gn0s)
+    elif args.command == "resample":
+        options = dict(
+            cadence=args.cadence, columns=args.columns, statistics=args.statistics
+        )
+    return _run_files(args, options, out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
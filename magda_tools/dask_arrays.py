@@ -0,0 +1,166 @@
+"""Optional integration with dask for processing more data than fits in
+memory.
+
+The columns of many data files can be opened as lazily evaluated dask
+arrays whose chunks correspond to the files (or to runs of rows within
+them). The position calculations and field models accept these arrays
+and return lazy results, so that a computation over the whole mission
+is evaluated one chunk at a time by any dask scheduler.
+
+dask is not a requirement of this package and is only imported when
+these functions are used, install it with ``pip install dask[array]``.
+"""
+
+from importlib.util import find_spec
+import operator
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .data_file import DataFile, column_mapping
+from .status import STATUS_DTYPE
+from .time_conversion import epoch_seconds_to_unix
+
+
+def _dask() -> Tuple[Any, Any]:
+    """Import and return the ``dask`` and ``dask.array`` modules."""
+    if find_spec("dask") is None:
+        raise ImportError(
+            "Lazy arrays require dask to be installed (pip install dask[array])"
+        )
+    import dask
+    import dask.array
+
+    return dask, dask.array
+
+
+def is_dask_array(value: Any) -> bool:
+    """Return True if ``value`` is a dask array. dask is not imported."""
+    return type(value).__module__.partition(".")[0] == "dask"
+
+
+def map_samples(
+    function: Callable[..., Sequence[np.ndarray]],
+    arrays: Sequence[Any],
+    n_outputs: int,
+) -> Tuple[Any, ...]:
+    """Lazily apply ``function`` to corresponding chunks of the one
+    dimensional ``arrays``, which may be dask or numpy arrays of the same
+    length. ``function`` returns ``n_outputs`` arrays of the same length
+    as its inputs, which are returned as float64 dask arrays chunked like
+    the first dask array in ``arrays``."""
+    _, da = _dask()
+    chunks = next(a.chunks for a in arrays if is_dask_array(a))
+    arrays = [da.asarray(a).rechunk(chunks) for a in arrays]
+
+    def block(*blocks: np.ndarray) -> np.ndarray:
+        return np.stack([np.asarray(r, np.float64) for r in function(*blocks)])
+
+    stacked = da.map_blocks(
+        block,
+        *arrays,
+        new_axis=0,
+        chunks=((n_outputs,),) + chunks,
+        dtype=np.float64,
+    )
+    return tuple(stacked[i] for i in range(n_outputs))
+
+
+def _read_rows(path: str, dtype: np.dtype, start: int, count: int) -> np.ndarray:
+    """Read ``count`` records from ``start`` of the data file at ``path``
+    in native byte order."""
+    with open(path, "rb") as f:
+        f.seek(start * dtype.itemsize)
+        records = np.fromfile(f, dtype, count=count)
+    return records.astype(dtype.newbyteorder("="))
+
+
+def open_dask(
+    files: Iterable[Union[str, Path]],
+    columns: Optional[Sequence[str]] = None,
+    chunk_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Open the data files at the paths in ``files``, for instance as
+    returned by :meth:`Catalog.query`, as lazy dask arrays.
+
+    Returns a dictionary mapping each column name (and the generic
+    aliases accepted by :meth:`DataFile.__getitem__`) to a dask array
+    concatenating that column across the files in the order given. The
+    TIME column holds UTC unix seconds. Only the headers are read until
+    the arrays are computed.
+
+    Arguments
+    ---------
+    columns: sequence of str, optional
+      the columns to include in addition to TIME, by default all
+    chunk_size: int, optional
+      the maximum number of rows in a chunk, by default each file is a
+      single chunk. Chunks never span more than one file
+
+    Unlike :meth:`MagdaDataset.open` samples duplicated at file
+    boundaries are not removed, as finding them requires reading the
+    data.
+    """
+    dask, da = _dask()
+    files = [str(f) for f in files]
+    if not files:
+        raise ValueError("No data files provided")
+
+    layouts = []
+    for path in files:
+        metadata = DataFile._parse_header(os.path.splitext(path)[0] + ".ffh")
+        dtype = np.dtype([(c.name, ">" + c.type_) for c in metadata["columns"]])
+        n_rows = os.path.getsize(path) // dtype.itemsize
+        layouts.append((path, metadata, dtype, n_rows))
+
+    first_metadata = layouts[0][1]
+    names = [c.name for c in first_metadata["columns"]]
+    for path, metadata, _, _ in layouts[1:]:
+        if [c.name for c in metadata["columns"]] != names:
+            raise ValueError(f"Columns of {path} do not match those of {files[0]}")
+    selected = names[1:] if columns is None else list(columns)
+    for name in selected:
+        if name not in names[1:]:
+            raise ValueError(f"No column named {name} in data files")
+
+    pieces: Dict[str, List[Any]] = {name: [] for name in ["TIME"] + selected}
+    for path, metadata, dtype, n_rows in layouts:
+        native = dtype.newbyteorder("=")
+        step = chunk_size or max(n_rows, 1)
+        for start in range(0, n_rows, step):
+            count = min(step, n_rows - start)
+            records = dask.delayed(_read_rows)(path, dtype, start, count)
+            unix_time = dask.delayed(epoch_seconds_to_unix)(
+                dask.delayed(operator.getitem)(records, names[0]),
+                metadata["timebase_unix"],
+            )
+            pieces["TIME"].append(
+                da.from_delayed(unix_time, shape=(count,), dtype=np.float64)
+            )
+            for name in selected:
+                pieces[name].append(
+                    da.from_delayed(
+                        dask.delayed(operator.getitem)(records, name),
+                        shape=(count,),
+                        dtype=native[name],
+                    )
+                )
+
+    arrays = {
+        name: da.concatenate(parts) if parts else da.empty(0, np.float64)
+        for name, parts in pieces.items()
+    }
+    status = f"{first_metadata.get('sensor')}Status"
+    if first_metadata.get("coord") == "C" and status in arrays:
+        arrays[status] = arrays[status].map_blocks(
+            DataFile.decode_sensor_status, dtype=STATUS_DTYPE
+        )
+
+    aliases = column_mapping(
+        [c for c in first_metadata["columns"][1:] if c.name in selected]
+    )
+    result = {alias: arrays[column.name] for alias, column in aliases.items()}
+    result["TIME"] = result[names[0]] = arrays["TIME"]
+    return result
@@ -1,11 +1,51 @@
-from dataclasses import dataclass, field
+from bisect import bisect_left, bisect_right
+import copy
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import json
+from multiprocessing import get_context
 import os
+from pathlib import Path
 import re
-from typing import Any, Dict, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+import warnings
 
 import numpy as np
-from astropy.time import Time, TimeDelta
+
+from .resample import (
+    PYRAMID_CADENCES,
+    Resampled,
+    parse_cadence,
+    resample,
+    select_columns,
+)
+from .instrumentation import stage
+from .status import STATUS_DTYPE, StatusSegments
+from .transforms import TRANSFORM_BIN_SIZE, transform_positions, transform_vectors
+from .time_conversion import (
+    as_unix,
+    epoch_seconds_to_unix,
+    unix_to_datetime64,
+    utc_to_tai,
+)
+
+if TYPE_CHECKING:
+    from astropy.time import Time
 
 COLUMN_REGEX = re.compile(
     r"(?P<index>[0-9]{3})\s+(?P<name>[A-Z,a-z,0-9,_,/,(,)]{1,10})(\s+)?(?P<units>[a-z,A-Z]+)"
@@ -25,23 +65,224 @@ EPOCHS = dict(J2000=946727968, Y1958=-378691200, Y1966=-126230400)
 
 DATA_TYPES = {"T": "d", "R": "f", "I": "i"}
 
+# coordinate system suffixes of column names, e.g. BX_KSM, which are
+# dropped to give generic aliases such as BX
+COORDINATE_SYSTEMS = "C KRTP KSO KSM KG TIIS ENIS IAIS J3 JMXYZ GSE GSM RTN SC".split()
+
+FIELD_COMPONENTS = ("BX", "BY", "BZ")
+POSITION_COMPONENTS = ("X", "Y", "Z")
+
+# version of the layout written by DataFile.to_cache, caches with any
+# other version are rebuilt
+CACHE_VERSION = 2
+CACHE_METADATA = "metadata.json"
+
+
+HEADER_LINE_LENGTH = 72
+
+# items which, once read along with the columns, complete a header
+HEADER_ITEMS = frozenset(("start", "end", "n_rows", "timebase_unix"))
+
+MONTHS = {
+    name: number
+    for number, name in enumerate(
+        "JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC".split(), 1
+    )
+}
+
+
+@lru_cache(maxsize=None)
+def _timebase(unix: float) -> "Time":
+    """Return the astropy time of the timebase at ``unix`` seconds. Times
+    are cached as their construction (and the import of astropy) is
+    expensive relative to parsing a header."""
+    from astropy.time import Time
+
+    return Time(unix, format="unix", scale="utc")
+
+
+def _parse_header_time(value: str) -> datetime:
+    """Parse a time from a header file, e.g. ``2017 051 FEB 20 00:00:30.000``
+    (or with a two digit year 9X for the 1990s)."""
+    value = " ".join(value.split())
+    if value.startswith("9"):
+        value = "19" + value
+    try:
+        year, day_of_year, month, day, clock = value.split(" ")
+        hms, _, fraction = clock.partition(".")
+        hour, minute, second = hms.split(":")
+        result = datetime(
+            int(year),
+            MONTHS[month],
+            int(day),
+            int(hour),
+            int(minute),
+            int(second),
+            int(fraction.ljust(6, "0")[:6]),
+        )
+    except (KeyError, ValueError):
+        return datetime.strptime(value, MAGDA_TIME_FMT_MS)
+    if result.timetuple().tm_yday != int(day_of_year):
+        # strptime takes the date from the day of year
+        return datetime.strptime(value, MAGDA_TIME_FMT_MS)
+    return result
+
+
+class RowCountWarning(UserWarning):
+    """Warning issued when a data file contains a different number of rows
+    than indicated in its header file."""
+
+    def __init__(self, file_path: str, expected: int, actual: int) -> None:
+        super().__init__(file_path, expected, actual)
+        self.file_path = file_path
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self) -> str:
+        return (
+            f"Datafile {self.file_path} contains {self.actual} rows but its "
+            f"header file indicates {self.expected}"
+        )
+
 
 @dataclass
 class Column:
+    """A single named column of a MAGDA flat file.
+
+    The values of the column are accessed via ``data``. Where a
+    ``transform`` has been provided it is applied to the stored values
+    the first time ``data`` is accessed and the result replaces them,
+    allowing expensive conversions to be deferred until needed.
+    """
+
     index: int
     name: str
     source: str
     units: str
     type_: str
-    data: np.array = field(default_factory=lambda: np.array([]))
+    _data: np.ndarray = field(init=False, repr=False)
+    transform: Optional[Callable[[np.ndarray], Any]] = field(
+        init=False, repr=False, compare=False
+    )
+
+    def __init__(
+        self,
+        index: int,
+        name: str,
+        source: str,
+        units: str,
+        type_: str,
+        data: Any = None,
+        transform: Optional[Callable[[np.ndarray], Any]] = None,
+    ) -> None:
+        self.index = index
+        self.name = name
+        self.source = source
+        self.units = units
+        self.type_ = type_
+        self._data = np.array([]) if data is None else data
+        self.transform = transform
+
+    def with_data(
+        self, data: Any, transform: Optional[Callable[[np.ndarray], Any]] = None
+    ) -> "Column":
+        """Return a copy of this column holding ``data``, to which
+        ``transform`` is applied when accessed if given."""
+        return Column(
+            self.index, self.name, self.source, self.units, self.type_, data, transform
+        )
+
+    @property
+    def data(self) -> Any:
+        if self.transform is not None:
+            self._data = self.transform(self._data)
+            self.transform = None
+        return self._data
+
+    @data.setter
+    def data(self, value: Any) -> None:
+        self._data = value
+        self.transform = None
+
+    @property
+    def loaded(self) -> bool:
+        """True if any deferred transform has already been applied."""
+        return self.transform is None
+
+    @property
+    def raw(self) -> np.ndarray:
+        """The stored values without applying any deferred transform."""
+        return self._data
+
+    def load(self) -> None:
+        """Apply any deferred transform immediately."""
+        self.data
+
+
+def _native_byte_order(data: np.ndarray) -> np.ndarray:
+    """Return ``data`` converted to the native byte order."""
+    return data.astype(data.dtype.newbyteorder("="))
+
+
+def column_mapping(
+    columns: Sequence[Column], aliases: Optional[Dict[str, str]] = None
+) -> Dict[str, Column]:
+    """Return a dictionary mapping the name of each of ``columns`` to the
+    column, along with any ``aliases`` (alias to column name) and a
+    generic alias for each column name with a coordinate system suffix,
+    e.g. BX for BX_KSM. Generic aliases that would be ambiguous or
+    clash with a column name are omitted."""
+    mapping = {c.name: c for c in columns}
+    generic: Dict[str, List[Column]] = {}
+    for c in columns:
+        prefix, _, suffix = c.name.rpartition("_")
+        if prefix and suffix in COORDINATE_SYSTEMS:
+            generic.setdefault(prefix, []).append(c)
+    for alias, matches in generic.items():
+        if len(matches) == 1 and alias not in mapping:
+            mapping[alias] = matches[0]
+    for alias, name in (aliases or {}).items():
+        mapping.setdefault(alias, mapping[name])
+    return mapping
+
+
+def vector_view(arrays: Sequence[np.ndarray]) -> Optional[np.ndarray]:
+    """Return a read only ``(n, len(arrays))`` view onto the one
+    dimensional ``arrays`` if they are equally spaced fields of the same
+    type within one buffer, as are adjacent fields of a structured
+    array, otherwise None."""
+    first = arrays[0]
+    if first.base is None or any(
+        a.base is not first.base
+        or a.dtype != first.dtype
+        or a.shape != first.shape
+        or a.strides != first.strides
+        for a in arrays
+    ):
+        return None
+    addresses = [a.__array_interface__["data"][0] for a in arrays]
+    spacing = addresses[1] - addresses[0] if len(arrays) > 1 else first.itemsize
+    if np.any(np.diff(addresses) != spacing) or spacing <= 0:
+        return None
+    return np.lib.stride_tricks.as_strided(
+        first,
+        shape=(len(first), len(arrays)),
+        strides=(first.strides[0], spacing),
+        writeable=False,
+    )
 
 
 class DataFile(object):
-    def __init__(self, file_path: str, header_path: str = None):
+    def __init__(self, file_path: str, header_path: str = None, mmap: bool = False):
         """Parse a MAGDA flatfile at ``file_path``. If ``header_path`` is not
         provided it is assumed that there is a .ffh file colocated
         with the data file.
 
+        If ``mmap`` is True the data file is memory mapped rather than
+        read into memory. The data of each column is then a view onto
+        the mapped file and is only byte-swapped, converted or decoded
+        the first time it is accessed.
+
         """
         self.file_path = file_path
         self.header_path = (
@@ -50,10 +291,11 @@ class DataFile(object):
             else os.path.splitext(file_path)[0] + ".ffh"
         )
         # get information from header file
-        metadata = self.parse_header(self.header_path)
+        with stage("parse_header"):
+            metadata = self._parse_header(self.header_path)
         self.n_rows = metadata["n_rows"]
         self.columns = metadata["columns"]
-        self.timebase = metadata["timebase"]
+        self._timebase_unix = metadata["timebase_unix"]
         self.coord = metadata["coord"]
         self.sensor = metadata["sensor"]
         self.start = metadata["start"]
@@ -63,76 +305,517 @@ class DataFile(object):
 
         # read in actual data
         dt = np.dtype([(c.name, ">" + c.type_) for c in self.columns])
-        with open(self.file_path, "rb") as f:
-            data = np.fromfile(f, dt)
+        self.dtype = dt
+        if mmap:
+            with stage("memmap") as timer:
+                data = self._memmap(self.file_path, dt)
+                timer.add(rows=len(data))
+        else:
+            with stage("read") as timer, open(self.file_path, "rb") as f:
+                data = np.fromfile(f, dt)
+                timer.add(rows=len(data), bytes_read=data.nbytes)
+                timer.allocated(data)
 
         # some data files contain fewer lines than their
         # headers claim so check the actual array size
         actual_n_rows = len(data)
         if actual_n_rows != self.n_rows:
-            print(
-                f"Warning: Datafile {file_path} contains a different number "
-                "of rows than indicated in its header file"
+            warnings.warn(
+                RowCountWarning(str(file_path), self.n_rows, actual_n_rows),
+                stacklevel=2,
             )
             self.n_rows = actual_n_rows
 
-        for c in self.columns:
-            c.data = data[c.name]
+        # rename time column for consistency across different header files
+        self.columns[0].name = "TIME"
+        self._set_records(data, lazy=mmap)
+
+    def _set_records(self, records: np.ndarray, lazy: bool) -> None:
+        """Populate the columns from the structured array ``records``. If
+        ``lazy`` is True conversion of the column data is deferred until
+        it is accessed."""
+        self._index_columns()
+        if not lazy:
+            # converting all columns at once leaves them as fields of a
+            # single array so that vectors of components can be viewed
+            with stage("byte_order") as timer:
+                records = _native_byte_order(records)
+                timer.add(rows=len(records))
+                timer.allocated(records)
+        for c, name in zip(self.columns, records.dtype.names):
+            c.data = records[name]
+            if lazy:
+                c.transform = _native_byte_order
 
-        # convert times into objects and rename column for consistency
-        # across different header files
+        # convert times into objects. Construction of astropy times is
+        # expensive so it is deferred until the column is accessed.
         time_column = self.columns[0]
-        time_column.data = (
-            TimeDelta(time_column.data, format="sec", scale="tai") + self.timebase
-        )
-        time_column.name = "TIME"
+        self._tai_seconds = time_column._data
+        self._unix_time: Optional[np.ndarray] = None
+        time_column.transform = self._to_time
+        self._status_segments: Optional[StatusSegments] = None
 
         if self.coord == "C":
             # decode raw sensor status data into a status value indicating
             # the sensitivity range in which the sensor is operating
             sensor_status = self[f"{self.sensor}Status"]
-            sensor_status.data = self.decode_sensor_status(sensor_status.data)
+            sensor_status.transform = self.decode_sensor_status
+
+        if not lazy:
+            for c in self.columns[1:]:
+                c.load()
+
+    def _subset(self, records: np.ndarray) -> "DataFile":
+        """Return a copy of this DataFile holding only ``records``. The
+        metadata attributes other than ``n_rows`` still describe the
+        whole file."""
+        subset = copy.copy(self)
+        subset.columns = [replace(c) for c in self.columns]
+        subset.n_rows = len(records)
+        subset._set_records(records, lazy=False)
+        return subset
+
+    def _epoch_seconds(self, value: Any) -> float:
+        """Convert a time ``value`` into seconds since the timebase in the
+        TAI convention used by the time column."""
+        return float(utc_to_tai(as_unix(value)) - utc_to_tai(self._timebase_unix))
+
+    def _row_range(self, start: Any, end: Any) -> Tuple[int, int]:
+        """Return the indices of the first row at or after ``start`` and one
+        past the last row at or before ``end`` by binary search of the
+        time column on disk. Only the pages holding the rows visited by
+        the search are read."""
+        times = self._memmap(self.file_path, self.dtype)[self.dtype.descr[0][0]]
+        first = 0 if start is None else bisect_left(times, self._epoch_seconds(start))
+        last = (
+            len(times)
+            if end is None
+            else bisect_right(times, self._epoch_seconds(end), lo=first)
+        )
+        return first, last
+
+    def read_range(self, start: Any = None, end: Any = None) -> "DataFile":
+        """Return a DataFile holding only the rows with times between
+        ``start`` and ``end`` inclusive, reading only those rows from
+        disk. Times may be given as unix seconds, ``datetime`` (UTC),
+        ``numpy.datetime64`` or astropy ``Time`` values. Combine with
+        ``mmap=True`` to avoid reading the whole file on construction.
+        """
+        first, last = self._row_range(start, end)
+        with stage("read") as timer, open(self.file_path, "rb") as f:
+            f.seek(first * self.dtype.itemsize)
+            records = np.fromfile(f, self.dtype, count=last - first)
+            timer.add(rows=len(records), bytes_read=records.nbytes)
+            timer.allocated(records)
+        return self._subset(records)
+
+    def iter_chunks(
+        self, chunk_size: int = 100000, start: Any = None, end: Any = None
+    ) -> Iterator["DataFile"]:
+        """Yield successive DataFiles of at most ``chunk_size`` rows covering
+        the rows with times between ``start`` and ``end`` (by default the
+        whole file). Only one chunk is held in memory at a time."""
+        first, last = self._row_range(start, end)
+        with open(self.file_path, "rb") as f:
+            f.seek(first * self.dtype.itemsize)
+            for offset in range(first, last, chunk_size):
+                count = min(chunk_size, last - offset)
+                with stage("read") as timer:
+                    records = np.fromfile(f, self.dtype, count=count)
+                    timer.add(rows=len(records), bytes_read=records.nbytes)
+                    timer.allocated(records)
+                yield self._subset(records)
+
+    def write(
+        self,
+        file_path: str,
+        header_path: Optional[str] = None,
+        abstract: Sequence[str] = (),
+        chunk_size: int = 100000,
+    ) -> None:
+        """Write the rows of this DataFile to a new flat file at ``file_path``
+        with the same columns and timebase. The header is written to
+        ``header_path``, by default alongside, with ``abstract`` lines
+        of free text. See :class:`writer.FlatFileWriter` to write rows
+        incrementally or append to existing files."""
+        from .writer import FlatFileWriter, _epoch_name
+
+        columns = [replace(self.columns[0], name=self.dtype.descr[0][0])]
+        with FlatFileWriter(
+            file_path,
+            columns + self.columns[1:],
+            header_path,
+            epoch=_epoch_name(self._timebase_unix),
+            abstract=abstract,
+            chunk_size=chunk_size,
+        ) as writer:
+            writer.write_datafile(self)
+
+    @staticmethod
+    def _memmap(path: str, dtype: np.dtype) -> np.ndarray:
+        """Memory map the records of the data file at ``path``. Any trailing
+        partial record is ignored, as it would be by ``np.fromfile``."""
+        n_records = os.path.getsize(path) // dtype.itemsize
+        if n_records == 0:
+            # empty files can not be memory mapped
+            return np.empty(0, dtype)
+        return np.memmap(path, dtype, mode="r", shape=(n_records,))
+
+    @staticmethod
+    def _source_key(file_path: str, header_path: str) -> Dict[str, int]:
+        """The modification times and sizes identifying the contents of a
+        data file and its header."""
+        data_stat, header_stat = os.stat(file_path), os.stat(header_path)
+        return dict(
+            data_mtime_ns=data_stat.st_mtime_ns,
+            data_size=data_stat.st_size,
+            header_mtime_ns=header_stat.st_mtime_ns,
+            header_size=header_stat.st_size,
+        )
+
+    def identity(self, columns: Sequence[str] = ()) -> Dict[str, Any]:
+        """Return a JSON serialisable description identifying the rows of
+        this DataFile: the path of the data file, the modification times
+        and sizes of it and its header (see :meth:`to_cache`), and the
+        number of rows and times of the first and last.
+
+        The file identifies the values only as they were read, so the
+        values of the numeric ``columns`` are also included as digests
+        of their data, identifying any later changes to them.
+        """
+        rows = [self.n_rows]
+        if self.n_rows:
+            rows += [float(self._tai_seconds[0]), float(self._tai_seconds[-1])]
+        digests = {}
+        for name in columns:
+            data = np.asarray(self[name].data)
+            data = np.ascontiguousarray(data, data.dtype.newbyteorder("="))
+            digest = hashlib.sha256(data.dtype.str.encode())
+            digest.update(data.data)
+            digests[name] = digest.hexdigest()
+        return dict(
+            path=os.path.abspath(self.file_path),
+            source=self._source_key(self.file_path, self.header_path),
+            rows=rows,
+            columns=digests,
+        )
+
+    @staticmethod
+    def _cache_path(file_path: str, cache_dir: Optional[str]) -> str:
+        """The directory holding the cache of the data file at ``file_path``,
+        by default alongside the data file."""
+        if cache_dir is None:
+            return str(file_path) + ".cache"
+        return os.path.join(cache_dir, os.path.basename(file_path) + ".cache")
+
+    def _holds_file(self) -> bool:
+        """Return True if this DataFile holds every row of its data file with
+        the values as read, comparing them with the file on disk."""
+        records = self._memmap(self.file_path, self.dtype)
+        if len(records) != self.n_rows:
+            return False
+        status = self[f"{self.sensor}Status"] if self.coord == "C" else None
+        for c, name in zip(self.columns, records.dtype.names):
+            expected = records[name]
+            if c is self.columns[0]:
+                values = self._tai_seconds
+            elif status is not None and c is status:
+                values, expected = c.data, self.decode_sensor_status(expected)
+            else:
+                values = c.data
+            if not np.array_equal(
+                values, expected, equal_nan=expected.dtype.kind == "f"
+            ):
+                return False
+        return True
+
+    def to_cache(self, cache_dir: Optional[str] = None) -> str:
+        """Write the contents of this DataFile to a columnar cache and return
+        the path of the cache directory. The cache is created alongside
+        the data file unless ``cache_dir`` is given.
+
+        Each column is saved as a native-endian ``.npy`` file, the sensor
+        status being saved decoded, along with the numeric time axis and
+        a JSON file of metadata. The cache is tied to the modification
+        time and size of the data and header files, see
+        :meth:`from_cache`, so only a DataFile holding every row of the
+        data file with the values as read may be cached. A ValueError is
+        raised otherwise, e.g. for the results of :meth:`read_range`.
+        """
+        if not self._holds_file():
+            raise ValueError(
+                f"{self.file_path}: only DataFiles holding the whole data file "
+                "unmodified can be cached"
+            )
+        path = self._cache_path(self.file_path, cache_dir)
+        os.makedirs(path, exist_ok=True)
+        metadata_path = os.path.join(path, CACHE_METADATA)
+        # the metadata is written last so an interrupted write leaves no
+        # valid cache behind
+        if os.path.exists(metadata_path):
+            os.remove(metadata_path)
+
+        np.save(os.path.join(path, "time.npy"), np.asarray(self._tai_seconds, "=f8"))
+        np.save(os.path.join(path, "unix_time.npy"), self.unix_time)
+        for c in self.columns[1:]:
+            np.save(os.path.join(path, f"{c.index:03d}.npy"), np.asarray(c.data))
+
+        metadata = dict(
+            version=CACHE_VERSION,
+            source=self._source_key(self.file_path, self.header_path),
+            header_path=str(self.header_path),
+            n_rows=self.n_rows,
+            columns=[
+                dict(
+                    index=c.index,
+                    name=c.name,
+                    source=c.source,
+                    units=c.units,
+                    type_=c.type_,
+                )
+                for c in self.columns
+            ],
+            time_name=self.dtype.descr[0][0],
+            timebase=self._timebase_unix,
+            coord=self.coord,
+            sensor=self.sensor,
+            telem=self.telem,
+            res=self.res,
+            start=self.start.isoformat(),
+            end=self.end.isoformat(),
+        )
+        with open(metadata_path, "w") as f:
+            json.dump(metadata, f)
+        return path
+
+    @classmethod
+    def from_cache(
+        cls,
+        file_path: str,
+        header_path: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+    ) -> "DataFile":
+        """Load the data file at ``file_path`` from its cache, as written by
+        :meth:`to_cache`, with the arguments as for the constructor.
+
+        The cached columns are memory mapped so loading costs little more
+        than reading the metadata. If the cache is missing, was written
+        by another version of this package or the data or header file
+        has been modified since it was written, the data file is parsed
+        and the cache rebuilt.
+        """
+        header_path = (
+            header_path
+            if header_path is not None
+            else os.path.splitext(file_path)[0] + ".ffh"
+        )
+        path = cls._cache_path(file_path, cache_dir)
+        try:
+            with open(os.path.join(path, CACHE_METADATA)) as f:
+                metadata = json.load(f)
+        except FileNotFoundError:
+            metadata = {}
+        if metadata.get("version") != CACHE_VERSION or metadata.get(
+            "source"
+        ) != cls._source_key(file_path, header_path):
+            df = cls(file_path, header_path)
+            df.to_cache(cache_dir)
+            return df
+
+        df = cls.__new__(cls)
+        df.file_path = file_path
+        df.header_path = header_path
+        df.n_rows = metadata["n_rows"]
+        df.columns = [Column(**c) for c in metadata["columns"]]
+        df._timebase_unix = metadata["timebase"]
+        df.coord = metadata["coord"]
+        df.sensor = metadata["sensor"]
+        df.telem = metadata["telem"]
+        df.res = metadata["res"]
+        df.start = datetime.fromisoformat(metadata["start"])
+        df.end = datetime.fromisoformat(metadata["end"])
+        names = [metadata["time_name"]] + [c.name for c in df.columns[1:]]
+        df.dtype = np.dtype([(n, ">" + c.type_) for n, c in zip(names, df.columns)])
+        df._index_columns()
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        with stage("load_cache") as timer:
+            for c in df.columns[1:]:
+                c.data = load(f"{c.index:03d}.npy")
+            time_column = df.columns[0]
+            df._tai_seconds = time_column._data = load("time.npy")
+            df._unix_time = load("unix_time.npy")
+            timer.add(rows=df.n_rows)
+        time_column.transform = df._to_time
+        df._status_segments = None
+        return df
+
+    def resample(
+        self,
+        cadence: Union[str, float],
+        columns: Optional[Sequence[str]] = None,
+        statistics: Sequence[str] = ("mean",),
+    ) -> Resampled:
+        """Calculate ``statistics`` ("mean", "min", "max" or "std") of
+        ``columns`` (by default all real valued columns) in bins of
+        ``cadence``, given as seconds or a string such as "1m" or "1h".
+        Bins are aligned to the unix epoch and empty bins have NaN
+        statistics."""
+        return resample(
+            self.unix_time,
+            select_columns(self.columns, columns, self._columns_by_name),
+            cadence,
+            statistics,
+        )
+
+    def pyramid(
+        self,
+        cadences: Sequence[Union[str, float]] = PYRAMID_CADENCES,
+        columns: Optional[Sequence[str]] = None,
+        statistics: Sequence[str] = ("mean", "min", "max"),
+        cache_dir: Optional[str] = None,
+    ) -> List[Resampled]:
+        """Return the data resampled at each of ``cadences``, as for
+        :meth:`resample`, for display at a range of zoom levels.
+
+        The levels are saved in the cache directory of this file (see
+        :meth:`to_cache`) and reused while the data and header files,
+        the rows held and the values of the columns are unchanged (see
+        :meth:`identity`)."""
+        path = self._cache_path(self.file_path, cache_dir)
+        os.makedirs(path, exist_ok=True)
+        names = list(select_columns(self.columns, columns, self._columns_by_name))
+        key = json.dumps(
+            dict(
+                datafile=self.identity(names),
+                columns=None if columns is None else list(columns),
+                statistics=list(statistics),
+            )
+        )
+        levels = []
+        for cadence in cadences:
+            level_path = os.path.join(path, f"pyramid_{parse_cadence(cadence):g}s.npz")
+            if os.path.exists(level_path):
+                level, attributes = Resampled.load(level_path)
+                if attributes.get("key") == key:
+                    levels.append(level)
+                    continue
+            level = self.resample(cadence, columns, statistics)
+            level.save(level_path, key=key)
+            levels.append(level)
+        return levels
+
+    def to_dask(
+        self, columns: Optional[Sequence[str]] = None, chunk_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Return the columns of this data file as lazy dask arrays read
+        in chunks of ``chunk_size`` rows. Requires dask, see
+        :func:`dask_arrays.open_dask`."""
+        from .dask_arrays import open_dask
+
+        return open_dask([self.file_path], columns, chunk_size)
+
+    @property
+    def position_frame(self) -> str:
+        """The coordinate system of the position columns, which may differ
+        from that of the field (``coord``), e.g. KG for KRTP files."""
+        return self["X"].name.rpartition("_")[2]
+
+    def position_in(
+        self, frame: str, bin_size: float = TRANSFORM_BIN_SIZE
+    ) -> np.ndarray:
+        """Return the positions as an ``(n_rows, 3)`` array in the coordinate
+        system ``frame``, see :func:`transforms.transform_positions`."""
+        return transform_positions(
+            self.position_vector, self.unix_time, self.position_frame, frame, bin_size
+        )
+
+    def field_in(self, frame: str, bin_size: float = TRANSFORM_BIN_SIZE) -> np.ndarray:
+        """Return the magnetic field as an ``(n_rows, 3)`` array in the
+        coordinate system ``frame``, see
+        :func:`transforms.transform_vectors`."""
+        position_kg = None
+        if "KRTP" in (self.coord, frame.upper()):
+            position_kg = self.position_in("KG", bin_size)
+        return transform_vectors(
+            self.field_vector,
+            self.unix_time,
+            self.coord,
+            frame,
+            position_kg=position_kg,
+            bin_size=bin_size,
+        )
+
+    @property
+    def timebase(self) -> "Time":
+        """The epoch of the time column as an astropy ``Time``."""
+        return _timebase(self._timebase_unix)
+
+    def _to_time(self, data: np.ndarray) -> "Time":
+        """Convert raw TAI seconds since the timebase into astropy times."""
+        from astropy.time import TimeDelta
+
+        with stage("astropy_time") as timer:
+            timer.add(rows=len(data))
+            return TimeDelta(data, format="sec", scale="tai") + self.timebase
 
     @staticmethod
     def parse_header(path: str) -> Dict[str, Any]:
         """Return a dictionary of metadata items from the header file at
-        ``path`` describing the contents of a datafile.
+        ``path`` describing the contents of a datafile. The ``timebase``
+        of the time column is given as an astropy ``Time`` and as UTC unix
+        seconds by ``timebase_unix``.
         """
+        metadata = DataFile._parse_header(path)
+        if "timebase_unix" in metadata:
+            metadata["timebase"] = _timebase(metadata["timebase_unix"])
+        return metadata
+
+    @staticmethod
+    def _parse_header(path: str) -> Dict[str, Any]:
+        """Return the metadata of the header file at ``path`` as for
+        :meth:`parse_header` except for ``timebase``, avoiding the import
+        of astropy."""
         metadata: Dict[str, Any] = {"columns": []}
 
-        lines = []
         with open(path) as f:
-            while True:
-                line = f.read(72)
-                if line:
-                    lines.append(line)
-                else:
-                    break
-
-        for line in lines:
-            match = COLUMN_REGEX.search(line)
-            if match:
-                groups = match.groupdict()
-                column = Column(
-                    int(groups["index"].lstrip("0")) - 1,
-                    groups["name"],
-                    groups["source"],
-                    groups["units"],
-                    DATA_TYPES[groups["type"]],
-                )
-                metadata["columns"].append(column)
-            elif line.startswith(("LAST TIME", "FIRST TIME")):
+            text = f.read()
+
+        # the column definitions form a contiguous block so matching of
+        # the column regex stops once it has been passed
+        in_columns = True
+        for start in range(0, len(text), HEADER_LINE_LENGTH):
+            line = text[start : start + HEADER_LINE_LENGTH]
+            if in_columns:
+                match = COLUMN_REGEX.search(line)
+                if match:
+                    groups = match.groupdict()
+                    column = Column(
+                        int(groups["index"].lstrip("0")) - 1,
+                        groups["name"],
+                        groups["source"],
+                        groups["units"],
+                        DATA_TYPES[groups["type"]],
+                    )
+                    metadata["columns"].append(column)
+                    continue
+                in_columns = not metadata["columns"]
+            if line.startswith(("LAST TIME", "FIRST TIME")):
                 value = line.split(" = ")[1].strip()
-                value = " ".join(value.split())
-                if value.startswith("9"):
-                    value = "19" + value
                 key = "end" if line.startswith("LAST TIME") else "start"
-                metadata[key] = datetime.strptime(value, MAGDA_TIME_FMT_MS)
+                metadata[key] = _parse_header_time(value)
             elif line.startswith("NROWS"):
                 metadata["n_rows"] = int(line.split(" = ")[1].strip())
             elif line.startswith("EPOCH"):
-                timebase = int(EPOCHS[line.split(" = ")[1].strip()])
-                metadata["timebase"] = Time(timebase, format="unix", scale="utc")
+                metadata["timebase_unix"] = float(EPOCHS[line.split(" = ")[1].strip()])
+            else:
+                continue
+            # the remainder of the header is free text describing the
+            # processing history
+            if not in_columns and HEADER_ITEMS.issubset(metadata):
+                break
 
         match = MAGDA_NAME_ATTRIBUTE_REGEX.search(str(path))
         if match is not None:
@@ -148,20 +831,169 @@ class DataFile(object):
 
         return metadata
 
+    @property
+    def unix_time(self) -> np.ndarray:
+        """The time of each row as float64 UTC seconds since 1970-01-01
+        (ignoring leap seconds)."""
+        if self._unix_time is None:
+            with stage("unix_time") as timer:
+                self._unix_time = np.asarray(
+                    epoch_seconds_to_unix(self._tai_seconds, self._timebase_unix)
+                )
+                timer.add(rows=len(self._unix_time))
+                timer.allocated(self._unix_time)
+        return self._unix_time
+
+    @property
+    def datetime64(self) -> np.ndarray:
+        """The time of each row as UTC ``datetime64[ns]`` values."""
+        return unix_to_datetime64(self.unix_time)
+
     @property
     def n_cols(self):
         return len(self.columns)
 
+    def _index_columns(self) -> None:
+        """Build the mapping of names and aliases to columns used by
+        ``__getitem__``. Must be called whenever ``columns`` is replaced."""
+        self._columns_by_name = column_mapping(
+            self.columns, {self.dtype.descr[0][0]: "TIME"}
+        )
+
     def __getitem__(self, val: str) -> Column:
+        """Return the column named ``val``. Columns may also be looked up by
+        the original name of the time column and, where unambiguous, by
+        their name without a coordinate system suffix, e.g. BX for
+        BX_KSM."""
         try:
-            return [c for c in self.columns if c.name == val][0]
-        except IndexError:
+            return self._columns_by_name[val]
+        except KeyError:
             raise ValueError(f"No column named {val} in datafile")
 
+    def vector(self, names: Sequence[str]) -> np.ndarray:
+        """Return an ``(n_rows, len(names))`` array of the columns ``names``.
+
+        Where the columns are adjacent fields of the records read from
+        the data file this is a read only view without copying. For
+        memory mapped files it is then a view onto the file in its
+        (big-endian) byte order. Otherwise the columns are stacked."""
+        columns = [self[name] for name in names]
+        if all(c.transform in (None, _native_byte_order) for c in columns):
+            view = vector_view([c.raw for c in columns])
+            if view is not None:
+                return view
+        return np.column_stack([c.data for c in columns])
+
+    @property
+    def field_vector(self) -> np.ndarray:
+        """The magnetic field components as an ``(n_rows, 3)`` array, see
+        :meth:`vector`."""
+        return self.vector(FIELD_COMPONENTS)
+
+    @property
+    def position_vector(self) -> np.ndarray:
+        """The position components as an ``(n_rows, 3)`` array, see
+        :meth:`vector`."""
+        return self.vector(POSITION_COMPONENTS)
+
+    @property
+    def status_segments(self) -> StatusSegments:
+        """The run-length index of the decoded sensor status, built when
+        first accessed. Only available for ``coord == "C"`` files."""
+        if self._status_segments is None:
+            if self.coord != "C":
+                raise ValueError("Sensor status is only present in C files")
+            self._status_segments = StatusSegments.from_status(
+                self[f"{self.sensor}Status"].data, self.unix_time
+            )
+        return self._status_segments
+
     @staticmethod
     def decode_sensor_status(status: Union[np.ndarray, int]) -> Union[np.ndarray, int]:
         """Decode raw sensor status information into a status code. ``status``
-        can be a number of sequence of numbers.
+        can be a number of sequence of numbers. The codes are returned as
+        uint8 as they take values from 0 to 3.
         """
-        status = np.array(status)
-        return np.right_shift(np.bitwise_and(status.astype(int), 0xC0000000), 30)
+        with stage("decode_status") as timer:
+            status = np.array(status)
+            decoded = np.right_shift(
+                np.bitwise_and(status.astype(np.int64), 0xC0000000), 30
+            ).astype(STATUS_DTYPE)
+            timer.add(rows=decoded.size)
+            timer.allocated(decoded)
+        return decoded
+
+
+HEADER_TABLE_FIELDS = (
+    "path",
+    "start",
+    "end",
+    "n_rows",
+    "timebase",
+    "telem",
+    "sensor",
+    "coord",
+    "res",
+    "columns",
+)
+
+
+def _header_row(path: str) -> Tuple[Any, ...]:
+    """Return the metadata of the header file at ``path`` as a row of the
+    table returned by :func:`parse_headers`."""
+    metadata = DataFile._parse_header(path)
+    start, end = metadata.get("start"), metadata.get("end")
+    timebase = metadata.get("timebase_unix")
+    return (
+        str(path),
+        as_unix(start) if start is not None else np.nan,
+        as_unix(end) if end is not None else np.nan,
+        metadata.get("n_rows", -1),
+        timebase if timebase is not None else np.nan,
+        metadata.get("telem", ""),
+        metadata.get("sensor", ""),
+        metadata.get("coord", ""),
+        metadata.get("res", ""),
+        ",".join(c.name for c in metadata["columns"]),
+    )
+
+
+def parse_headers(
+    paths: Iterable[Union[str, Path]],
+    workers: Optional[int] = 1,
+    chunksize: int = 64,
+) -> np.ndarray:
+    """Parse many header files, returning their metadata as a structured
+    array with one row per path and the fields:
+
+    path, start, end, n_rows, timebase, telem, sensor, coord, res, columns
+
+    ``start``, ``end`` and ``timebase`` are UTC unix seconds (NaN if
+    missing), ``n_rows`` is -1 if missing and ``columns`` holds the
+    comma separated column names. Headers are parsed in a pool of
+    ``workers`` processes (by default in this process, or with one
+    process per CPU if None) in batches of ``chunksize``.
+    """
+    names = [str(p) for p in paths]
+    if workers == 1 or len(names) <= 1:
+        rows = [_header_row(p) for p in names]
+    else:
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+            rows = list(pool.map(_header_row, names, chunksize=chunksize))
+
+    def width(field: int) -> int:
+        return max([len(row[field]) for row in rows], default=0) or 1
+
+    dtype = [
+        ("path", f"U{width(0)}"),
+        ("start", "f8"),
+        ("end", "f8"),
+        ("n_rows", "i8"),
+        ("timebase", "f8"),
+        ("telem", "U2"),
+        ("sensor", "U3"),
+        ("coord", "U5"),
+        ("res", "U3"),
+        ("columns", f"U{width(9)}"),
+    ]
+    return np.array(rows, dtype=dtype)
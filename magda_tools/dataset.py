@@ -0,0 +1,279 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Sequence, Union
+import warnings
+
+import numpy as np
+
+from .data_file import (
+    FIELD_COMPONENTS,
+    POSITION_COMPONENTS,
+    Column,
+    DataFile,
+    column_mapping,
+    vector_view,
+)
+from .resample import PYRAMID_CADENCES, Resampled, resample, select_columns
+from .status import StatusSegments
+from .time_conversion import unix_to_datetime64
+
+
+@dataclass
+class _Part:
+    """The contents of a single data file prior to concatenation."""
+
+    file_path: str
+    unix_time: np.ndarray
+    columns: List[Column]
+    coord: str
+    sensor: str
+    telem: str
+    res: str
+    issued: List[warnings.WarningMessage]
+
+
+def _open_mapped(file_path: str) -> _Part:
+    """Memory map a data file, the column data is left as raw views onto
+    the file."""
+    df = DataFile(file_path, mmap=True)
+    return _Part(
+        file_path, df.unix_time, df.columns, df.coord, df.sensor, df.telem, df.res, []
+    )
+
+
+def _read(file_path: str) -> _Part:
+    """Read a data file in a worker process. Only native numpy arrays are
+    returned and any warnings are passed back to be issued by the parent."""
+    with warnings.catch_warnings(record=True) as issued:
+        warnings.simplefilter("always")
+        df = DataFile(file_path, mmap=True)
+    columns = [c.with_data(np.ascontiguousarray(c.raw)) for c in df.columns[1:]]
+    return _Part(
+        file_path,
+        df.unix_time,
+        [df.columns[0].with_data(np.array([]))] + columns,
+        df.coord,
+        df.sensor,
+        df.telem,
+        df.res,
+        issued,
+    )
+
+
+def _to_time(unix: np.ndarray) -> Any:
+    """Convert UTC unix seconds into astropy times."""
+    from astropy.time import Time
+
+    return Time(unix_to_datetime64(unix), scale="utc")
+
+
+class MagdaDataset(object):
+    """The columns of a sequence of MAGDA data files concatenated in time
+    order. Use :meth:`open` to construct a dataset.
+
+    Attributes
+    ----------
+    files: list of str
+      the data files contributing to the dataset, in time order
+    columns: list of Column
+      the concatenated columns, the first is always the TIME column
+    unix_time: array of floats
+      the time of each row as UTC unix seconds
+    """
+
+    def __init__(
+        self,
+        files: List[str],
+        columns: List[Column],
+        unix_time: np.ndarray,
+        coord: str,
+        sensor: str,
+        telem: str,
+        res: str,
+    ) -> None:
+        self.files = files
+        self.columns = columns
+        self.unix_time = unix_time
+        self.coord = coord
+        self.sensor = sensor
+        self.telem = telem
+        self.res = res
+        self.n_rows = len(unix_time)
+        self._columns_by_name = column_mapping(columns)
+        self._status_segments: Optional[StatusSegments] = None
+
+    @classmethod
+    def open(
+        cls,
+        files: Iterable[Union[str, Path]],
+        workers: Optional[int] = None,
+        processes: bool = False,
+    ) -> "MagdaDataset":
+        """Load and concatenate the data files at the paths in ``files``, for
+        instance as returned by :meth:`Catalog.query`.
+
+        Files are opened in a pool of ``workers`` threads, or processes if
+        ``processes`` is True. With threads each file is memory mapped and
+        copied directly into the preallocated output arrays. Samples at
+        the start of a file that duplicate times already covered by the
+        preceding file are dropped. Files reporting a different number of
+        rows to their header issue a ``RowCountWarning``.
+        """
+        files = [str(f) for f in files]
+        if not files:
+            raise ValueError("No data files provided")
+
+        executor: Executor
+        if processes:
+            # worker processes are spawned rather than forked as forking a
+            # process with running threads (e.g. numba's) can deadlock
+            executor = ProcessPoolExecutor(workers, mp_context=get_context("spawn"))
+            opener = _read
+        else:
+            executor = ThreadPoolExecutor(workers)
+            opener = _open_mapped
+
+        with executor:
+            parts = list(executor.map(opener, files))
+            for part in parts:
+                for issued in part.issued:
+                    warnings.warn_explicit(
+                        issued.message, issued.category, issued.filename, issued.lineno
+                    )
+
+            parts.sort(key=lambda part: part.unix_time[0] if len(part.unix_time) else 0)
+            names = [c.name for c in parts[0].columns]
+            for part in parts[1:]:
+                if [c.name for c in part.columns] != names:
+                    raise ValueError(
+                        f"Columns of {part.file_path} do not match those of "
+                        f"{parts[0].file_path}"
+                    )
+
+            # drop samples duplicating the end of the preceding file
+            first_rows = []
+            last_time = -np.inf
+            for part in parts:
+                first_rows.append(
+                    int(np.searchsorted(part.unix_time, last_time, side="right"))
+                )
+                if len(part.unix_time):
+                    last_time = max(last_time, part.unix_time[-1])
+
+            offsets = np.cumsum(
+                [0] + [len(p.unix_time) - f for p, f in zip(parts, first_rows)]
+            )
+            unix_time = np.empty(offsets[-1])
+            # the columns are fields of a single array so that vectors of
+            # components can be viewed without copying
+            records = np.empty(
+                offsets[-1],
+                [(c.name, c.raw.dtype.newbyteorder("=")) for c in parts[0].columns[1:]],
+            )
+            outputs = [records[c.name] for c in parts[0].columns[1:]]
+
+            def fill(i: int) -> None:
+                part, first = parts[i], first_rows[i]
+                rows = slice(offsets[i], offsets[i + 1])
+                unix_time[rows] = part.unix_time[first:]
+                for out, c in zip(outputs, part.columns[1:]):
+                    out[rows] = c.raw[first:]
+
+            # copying releases the GIL so is always done with threads
+            with ThreadPoolExecutor(workers) as copier:
+                list(copier.map(fill, range(len(parts))))
+
+        first = parts[0]
+        columns = [first.columns[0].with_data(unix_time, _to_time)]
+        columns += [c.with_data(out) for c, out in zip(first.columns[1:], outputs)]
+        dataset = cls(
+            [p.file_path for p in parts],
+            columns,
+            unix_time,
+            first.coord,
+            first.sensor,
+            first.telem,
+            first.res,
+        )
+        if dataset.coord == "C":
+            status = dataset[f"{dataset.sensor}Status"]
+            status.data = DataFile.decode_sensor_status(status.data)
+        return dataset
+
+    @property
+    def datetime64(self) -> np.ndarray:
+        """The time of each row as UTC ``datetime64[ns]`` values."""
+        return unix_to_datetime64(self.unix_time)
+
+    @property
+    def status_segments(self) -> StatusSegments:
+        """The run-length index of the decoded sensor status across all
+        files, see :attr:`DataFile.status_segments`."""
+        if self._status_segments is None:
+            if self.coord != "C":
+                raise ValueError("Sensor status is only present in C files")
+            self._status_segments = StatusSegments.from_status(
+                self[f"{self.sensor}Status"].data, self.unix_time
+            )
+        return self._status_segments
+
+    def resample(
+        self,
+        cadence: Union[str, float],
+        columns: Optional[Sequence[str]] = None,
+        statistics: Sequence[str] = ("mean",),
+    ) -> Resampled:
+        """Calculate statistics of the columns in bins of ``cadence``. See
+        :meth:`DataFile.resample`."""
+        return resample(
+            self.unix_time,
+            select_columns(self.columns, columns, self._columns_by_name),
+            cadence,
+            statistics,
+        )
+
+    def pyramid(
+        self,
+        cadences: Sequence[Union[str, float]] = PYRAMID_CADENCES,
+        columns: Optional[Sequence[str]] = None,
+        statistics: Sequence[str] = ("mean", "min", "max"),
+    ) -> List[Resampled]:
+        """Return the data resampled at each of ``cadences``. Unlike
+        :meth:`DataFile.pyramid` the levels are not cached."""
+        return [self.resample(c, columns, statistics) for c in cadences]
+
+    @property
+    def n_cols(self) -> int:
+        return len(self.columns)
+
+    def __getitem__(self, val: str) -> Column:
+        """Return the column named ``val``, see :meth:`DataFile.__getitem__`
+        for the aliases accepted."""
+        try:
+            return self._columns_by_name[val]
+        except KeyError:
+            raise ValueError(f"No column named {val} in dataset")
+
+    def vector(self, names: Sequence[str]) -> np.ndarray:
+        """Return an ``(n_rows, len(names))`` array of the columns ``names``,
+        a read only view without copying where possible."""
+        columns = [self[name] for name in names]
+        view = vector_view([c.data for c in columns])
+        if view is None:
+            return np.column_stack([c.data for c in columns])
+        return view
+
+    @property
+    def field_vector(self) -> np.ndarray:
+        """The magnetic field components as an ``(n_rows, 3)`` array."""
+        return self.vector(FIELD_COMPONENTS)
+
+    @property
+    def position_vector(self) -> np.ndarray:
+        """The position components as an ``(n_rows, 3)`` array."""
+        return self.vector(POSITION_COMPONENTS)
+
+    def __len__(self) -> int:
+        return self.n_rows
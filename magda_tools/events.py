@@ -0,0 +1,351 @@
+"""Detection of trajectory events: periapses and apoapses, equator
+crossings and boundaries between Saturn local time sectors.
+
+A trajectory is streamed through an :class:`EventFinder` in chunks, for
+example from a sequence of data files with :func:`find_events`. Events
+are found by vectorized detection of sign changes within each chunk,
+with the last samples of the previous chunk carried over so that events
+at chunk and file boundaries are not missed. The resulting
+:class:`EventTable` assigns each event to an orbit and can be saved, so
+that later jobs can read only the data of the orbits they need.
+
+Orbits are numbered from apoapsis to apoapsis. Distances and latitudes
+are calculated in the KG frame (aligned with the spin axis) and local
+times in the KSM frame.
+"""
+
+from dataclasses import dataclass
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .calculate import SATURN_RADIUS_KM, saturn_local_time_array
+from .catalog import Catalog
+from .data_file import DataFile
+from .transforms import transform_positions
+
+EVENT_KINDS = ("periapsis", "apoapsis", "ascending", "descending", "slt")
+
+EVENT_DTYPE = np.dtype(
+    [("time", "f8"), ("kind", "U10"), ("value", "f8"), ("orbit", "i8")]
+)
+
+# apsides closer than this are taken to be noise in the positions, e.g.
+# from the float32 precision of the position columns
+MIN_APSIS_SEPARATION: float = 6 * 3600.0
+
+
+@dataclass
+class EventTable:
+    """The events found along a trajectory.
+
+    Attributes
+    ----------
+    events: structured array
+      one row per event in time order with fields ``time`` (UTC unix
+      seconds), ``kind`` (one of :data:`EVENT_KINDS`), ``value`` and
+      ``orbit``. The value is the distance in Saturn radii for apsides,
+      zero for equator crossings (``ascending`` from south to north and
+      ``descending`` from north to south) and the local time in hours of
+      the sector boundary crossed for ``slt`` events
+    start, end: float
+      the times of the first and last samples of the trajectory
+    first_orbit: int
+      the number of the orbit in progress at the start of the trajectory
+    """
+
+    events: np.ndarray
+    start: float
+    end: float
+    first_orbit: int = 0
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def kind(self, kind: str) -> np.ndarray:
+        """Return the events of type ``kind``."""
+        if kind not in EVENT_KINDS:
+            raise ValueError(f"Unknown event kind {kind}")
+        return self.events[self.events["kind"] == kind]
+
+    def orbits(self) -> np.ndarray:
+        """Return a structured array with the ``orbit`` number, ``start`` and
+        ``end`` times and ``periapsis`` time (NaN if not covered) of each
+        orbit. The first and last orbits are bounded by the start and end
+        of the trajectory."""
+        bounds = np.concatenate(
+            [[self.start], self.kind("apoapsis")["time"], [self.end]]
+        )
+        orbits = np.zeros(
+            len(bounds) - 1,
+            [("orbit", "i8"), ("start", "f8"), ("end", "f8"), ("periapsis", "f8")],
+        )
+        orbits["orbit"] = self.first_orbit + np.arange(len(orbits))
+        orbits["start"] = bounds[:-1]
+        orbits["end"] = bounds[1:]
+        orbits["periapsis"] = np.nan
+        periapses = self.kind("periapsis")
+        orbits["periapsis"][periapses["orbit"] - self.first_orbit] = periapses["time"]
+        return orbits
+
+    def orbit_range(self, orbit: int) -> Tuple[float, float]:
+        """Return the start and end times of ``orbit``."""
+        orbits = self.orbits()
+        match = np.flatnonzero(orbits["orbit"] == orbit)
+        if not len(match):
+            raise ValueError(f"Orbit {orbit} is not covered by the events")
+        return float(orbits["start"][match[0]]), float(orbits["end"][match[0]])
+
+    def orbit_files(self, catalog: Catalog, orbit: int, **selection: Any) -> List[Path]:
+        """Return the paths of the data files in ``catalog`` with data within
+        ``orbit``, further selected by the arguments of
+        :meth:`Catalog.entries`."""
+        return catalog.query(*self.orbit_range(orbit), **selection)
+
+    def read_orbit(
+        self, catalog: Catalog, orbit: int, **selection: Any
+    ) -> List[DataFile]:
+        """Read the data of ``orbit`` from the files selected as for
+        :meth:`orbit_files`. Only the rows within the orbit are read."""
+        start, end = self.orbit_range(orbit)
+        return [
+            DataFile(str(path), mmap=True).read_range(start, end)
+            for path in catalog.query(start, end, **selection)
+        ]
+
+    def save(self, path: Union[str, Path], **attributes: str) -> None:
+        """Save to an ``.npz`` file at ``path``. Any string ``attributes``
+        are stored alongside for use when loading."""
+        header = dict(
+            start=self.start, end=self.end, first_orbit=self.first_orbit, **attributes
+        )
+        np.savez(path, header=json.dumps(header), events=self.events)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> Tuple["EventTable", Dict[str, str]]:
+        """Load from a file written by :meth:`save`, returning the events and
+        the attributes saved with them."""
+        with np.load(path) as contents:
+            header = json.loads(str(contents["header"]))
+            table = cls(
+                contents["events"],
+                header.pop("start"),
+                header.pop("end"),
+                header.pop("first_orbit"),
+            )
+        return table, header
+
+
+def _crossing_time(
+    t0: np.ndarray, t1: np.ndarray, v0: np.ndarray, v1: np.ndarray
+) -> np.ndarray:
+    """Return the times at which a quantity linearly interpolated from
+    ``v0`` at ``t0`` to ``v1`` at ``t1`` is zero."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.clip(np.nan_to_num(v0 / (v0 - v1)), 0, 1)
+    return t0 + fraction * (t1 - t0)
+
+
+def _wrap_hours(hours: np.ndarray) -> np.ndarray:
+    """Wrap a difference in local time into [-12, 12) hours."""
+    return (hours + 12) % 24 - 12
+
+
+def _separated(times: np.ndarray, min_separation: float) -> np.ndarray:
+    """Return a mask of the alternating extrema at ``times`` to keep when
+    discarding pairs of adjacent extrema closer than ``min_separation``,
+    which keeps the remainder alternating."""
+    kept: List[int] = []
+    for i, time in enumerate(times):
+        if kept and time - times[kept[-1]] < min_separation:
+            kept.pop()
+        else:
+            kept.append(i)
+    mask = np.zeros(len(times), bool)
+    mask[kept] = True
+    return mask
+
+
+class EventFinder(object):
+    """Finds events in a trajectory passed in successive chunks to
+    :meth:`update`. Call :meth:`finish` for the table of events."""
+
+    def __init__(
+        self,
+        sector_hours: float = 1.0,
+        min_separation: float = MIN_APSIS_SEPARATION,
+        first_orbit: int = 0,
+    ) -> None:
+        """Arguments
+        ---------
+        sector_hours: float
+          the width of the local time sectors whose boundaries are
+          reported, which should divide 24
+        min_separation: float
+          apsides separated by less than this many seconds are discarded
+          in pairs as noise
+        first_orbit: int
+          the number of the orbit in progress at the start of the
+          trajectory
+        """
+        self.sector_hours = sector_hours
+        self.min_separation = min_separation
+        self.first_orbit = first_orbit
+        self._events: List[np.ndarray] = []
+        self._start: Optional[float] = None
+        # the last samples of the previous chunk as time, distance,
+        # latitude and local time
+        self._tail = np.empty((4, 0))
+        # the sign of the last non-zero change in distance
+        self._last_sign = 0.0
+
+    def _append(
+        self, kind: str, time: np.ndarray, value: Union[float, np.ndarray]
+    ) -> None:
+        events = np.zeros(len(time), EVENT_DTYPE)
+        events["time"] = time
+        events["kind"] = kind
+        events["value"] = value
+        self._events.append(events)
+
+    def update(
+        self, unix_time: np.ndarray, positions: np.ndarray, frame: str = "KG"
+    ) -> None:
+        """Process the next chunk of the trajectory, the positions of shape
+        (n, 3) in ``frame`` at UTC unix times ``unix_time``. Samples not
+        after the last sample already processed, such as those
+        duplicated at file boundaries, are ignored."""
+        unix_time = np.asarray(unix_time, dtype=np.float64)
+        if self._tail.shape[1]:
+            keep = unix_time > self._tail[0, -1]
+            unix_time, positions = unix_time[keep], positions[keep]
+        if not len(unix_time):
+            return
+        if self._start is None:
+            self._start = float(unix_time[0])
+
+        kg = transform_positions(positions, unix_time, frame, "KG")
+        ksm = transform_positions(positions, unix_time, frame, "KSM")
+        distance = np.sqrt(np.einsum("ij,ij->i", kg, kg)) / SATURN_RADIUS_KM
+        # the sign of the latitude is that of z
+        north = kg[:, 2]
+        local_time = saturn_local_time_array(
+            unix_time, ksm[:, 0], ksm[:, 1], ksm[:, 2], units="hours"
+        )
+
+        samples = np.concatenate(
+            [self._tail, np.stack([unix_time, distance, north, local_time])], axis=1
+        )
+        self._find_apsides(samples)
+        self._find_crossings(samples)
+        self._tail = samples[:, -2:]
+
+    def _find_apsides(self, samples: np.ndarray) -> None:
+        """Find the extrema of distance from the changes in the sign of its
+        differences, skipping runs of equal values."""
+        time, distance = samples[0], samples[1]
+        # the difference between the first two samples of the tail was
+        # considered with the previous chunk
+        offset = max(self._tail.shape[1] - 1, 0)
+        sign = np.sign(np.diff(distance))
+        changed = np.flatnonzero(sign[offset:]) + offset
+        signs = np.concatenate([[self._last_sign], sign[changed]])
+        self._last_sign = signs[-1]
+        turns = np.flatnonzero((signs[1:] * signs[:-1]) < 0)
+        # the extremum is the sample at the start of the first difference
+        # of the opposite sign, refined by fitting a parabola to it and its
+        # neighbours
+        index = changed[turns]
+        index = index[index > 0]
+        before, at, after = distance[index - 1], distance[index], distance[index + 1]
+        curvature = before - 2 * at + after
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shift = np.clip(np.nan_to_num(0.5 * (before - after) / curvature), -1, 1)
+        step = np.where(
+            shift < 0, time[index] - time[index - 1], time[index + 1] - time[index]
+        )
+        extreme_time = time[index] + shift * step
+        extreme = at - 0.25 * (before - after) * shift
+        minimum = curvature > 0
+        self._append("periapsis", extreme_time[minimum], extreme[minimum])
+        self._append("apoapsis", extreme_time[~minimum], extreme[~minimum])
+
+    def _find_crossings(self, samples: np.ndarray) -> None:
+        """Find equator crossings and local time sector boundaries between
+        consecutive samples."""
+        time, north, local_time = samples[0], samples[2], samples[3]
+        # only the last sample of the tail is paired with the new samples
+        start = max(self._tail.shape[1] - 1, 0)
+        time, north, local_time = time[start:], north[start:], local_time[start:]
+
+        hemisphere = north >= 0
+        crossed = np.flatnonzero(hemisphere[1:] != hemisphere[:-1])
+        crossing_time = _crossing_time(
+            time[crossed], time[crossed + 1], north[crossed], north[crossed + 1]
+        )
+        ascending = hemisphere[crossed + 1]
+        self._append("ascending", crossing_time[ascending], 0.0)
+        self._append("descending", crossing_time[~ascending], 0.0)
+
+        n_sectors = int(round(24 / self.sector_hours))
+        sector = np.floor(local_time / self.sector_hours).astype(np.int64) % n_sectors
+        changed = np.flatnonzero(sector[1:] != sector[:-1])
+        before, after = local_time[changed], local_time[changed + 1]
+        forward = _wrap_hours(after - before) > 0
+        boundary = (
+            np.where(forward, sector[changed + 1], sector[changed]) * self.sector_hours
+        )
+        self._append(
+            "slt",
+            _crossing_time(
+                time[changed],
+                time[changed + 1],
+                _wrap_hours(before - boundary),
+                _wrap_hours(after - boundary),
+            ),
+            boundary % 24,
+        )
+
+    def update_datafile(self, df: DataFile) -> None:
+        """Process the trajectory of the data file ``df``."""
+        self.update(df.unix_time, df.position_vector, df.position_frame)
+
+    def finish(self) -> EventTable:
+        """Return the table of all events found, with noisy apsides removed
+        and the orbit of each event assigned."""
+        events = (
+            np.concatenate(self._events) if self._events else np.zeros(0, EVENT_DTYPE)
+        )
+        events = events[np.argsort(events["time"], kind="stable")]
+
+        apsis = np.flatnonzero(np.isin(events["kind"], ("periapsis", "apoapsis")))
+        keep = _separated(events["time"][apsis], self.min_separation)
+        events = np.delete(events, apsis[~keep])
+
+        apoapses = events["time"][events["kind"] == "apoapsis"]
+        events["orbit"] = self.first_orbit + np.searchsorted(
+            apoapses, events["time"], side="right"
+        )
+        start = np.nan if self._start is None else self._start
+        end = float(self._tail[0, -1]) if self._tail.shape[1] else np.nan
+        return EventTable(events, start, end, self.first_orbit)
+
+
+def find_events(
+    files: Iterable[Union[str, Path]],
+    chunk_size: int = 100000,
+    sector_hours: float = 1.0,
+    min_separation: float = MIN_APSIS_SEPARATION,
+    first_orbit: int = 0,
+) -> EventTable:
+    """Find the events along the trajectory of the data files at the paths
+    in ``files``, in time order (as returned by :meth:`Catalog.query`).
+    Each file is memory mapped and processed ``chunk_size`` rows at a
+    time. The remaining arguments are as for :class:`EventFinder`."""
+    finder = EventFinder(sector_hours, min_separation, first_orbit)
+    for path in files:
+        for chunk in DataFile(str(path), mmap=True).iter_chunks(chunk_size):
+            finder.update_datafile(chunk)
+    return finder.finish()
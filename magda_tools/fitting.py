@@ -0,0 +1,250 @@
+"""Least squares fitting of axisymmetric (g_n^0) field model coefficients.
+
+The r and theta components of the field of :class:`BFieldModel` are
+linear in its coefficients,
+
+  B_r = sum_n g_n (n + 1) r^-(n + 2) P_n(cos(theta))
+  B_theta = -sum_n g_n r^-(n + 2) dP_n(cos(theta))/dtheta
+
+so the contribution of each degree (the basis functions) is computed
+once for a trajectory and every fit to it is then a linear least squares
+problem. Fits to many segments of a trajectory, e.g. individual
+periapsis passes, are solved together by batched QR decompositions of
+their weighted design matrices.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .calculate import SATURN_RADIUS_KM, position_properties
+from .data_file import DataFile
+from .model import BFieldModel, legendre
+
+
+@dataclass
+class FitResult:
+    """The coefficients fitted to each segment of a trajectory.
+
+    Attributes
+    ----------
+    labels: array
+      the label of each segment, in sorted order
+    gn0s: array of floats
+      the fitted coefficients of shape (n_segments, degree)
+    n_samples: array of ints
+      the number of samples used in the fit of each segment
+    rms: array of floats
+      the root mean square residual of the r and theta components of
+      each segment
+    """
+
+    labels: np.ndarray
+    gn0s: np.ndarray
+    n_samples: np.ndarray
+    rms: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def models(self) -> List[BFieldModel]:
+        """Return a :class:`BFieldModel` for each segment."""
+        return [BFieldModel(list(gn0s)) for gn0s in self.gn0s]
+
+
+class AxisymmetricBasis(object):
+    """The r and theta field components of each degree of an axisymmetric
+    model with unit coefficient at a set of positions.
+
+    Attributes
+    ----------
+    degree: int
+      the number of terms of the model
+    b_r: array of floats
+      shape (n_samples, degree), the r component of each term
+    b_theta: array of floats
+      shape (n_samples, degree), the theta component of each term
+    """
+
+    def __init__(self, r: np.ndarray, theta: np.ndarray, degree: int) -> None:
+        """Arguments
+        ---------
+        r: array of floats
+          radial distances in planetary radii
+        theta: array of floats
+          co-latitudes in radians
+        degree: int
+          the number of coefficients to fit
+        """
+        inv_r = np.reciprocal(np.asarray(r, dtype=np.float64))
+        r_power = inv_r * inv_r
+        self.degree = degree
+        self.b_r = np.empty(inv_r.shape + (degree,))
+        self.b_theta = np.empty(inv_r.shape + (degree,))
+        for n, p, dp in legendre(degree, theta):
+            r_power = r_power * inv_r
+            np.multiply((n + 1) * r_power, p, out=self.b_r[..., n - 1])
+            np.multiply(-r_power, dp, out=self.b_theta[..., n - 1])
+
+    @classmethod
+    def from_datafile(cls, df: DataFile, degree: int) -> "AxisymmetricBasis":
+        """Construct the basis at the positions of the data file ``df``,
+        transformed into the KG frame if necessary."""
+        x, y, z = df.position_in("KG").T
+        position = position_properties(x, y, z, radius=SATURN_RADIUS_KM)
+        return cls(position.distance, position.colatitude, degree)
+
+    def __len__(self) -> int:
+        return len(self.b_r)
+
+    def predict(self, gn0s: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the r and theta field components for the coefficients
+        ``gn0s``, either one set or one per sample of shape
+        (n_samples, degree)."""
+        gn0s = np.asarray(gn0s, dtype=np.float64)
+        if gn0s.ndim == 1:
+            return self.b_r @ gn0s, self.b_theta @ gn0s
+        return (
+            np.einsum("nk,nk->n", self.b_r, gn0s),
+            np.einsum("nk,nk->n", self.b_theta, gn0s),
+        )
+
+    def fit(
+        self,
+        b_r: np.ndarray,
+        b_theta: np.ndarray,
+        weights: Optional[np.ndarray] = None,
+        segments: Optional[np.ndarray] = None,
+    ) -> FitResult:
+        """Fit coefficients to the observed r and theta field components.
+
+        Arguments
+        ---------
+        b_r, b_theta: arrays of floats
+          the observed field components at each sample
+        weights: array of floats, optional
+          the weight of each sample in the least squares fit, either of
+          shape (n_samples,) or (n_samples, 2) to weight the components
+          separately
+        segments: array, optional
+          a label for each sample, e.g. an orbit number. Coefficients are
+          fitted independently to the samples with each label. By
+          default all samples are fitted together
+
+        Samples with non-finite field values or weights, or weights that
+        are not positive, are ignored.
+
+        Returns
+        -------
+        FitResult
+        """
+        observed = np.stack(
+            [np.asarray(b_r, np.float64), np.asarray(b_theta, np.float64)], -1
+        )
+        if weights is None:
+            weights = np.ones_like(observed)
+        weights = np.broadcast_to(
+            np.asarray(weights, np.float64).reshape(len(observed), -1),
+            observed.shape,
+        )
+        with np.errstate(invalid="ignore"):
+            usable = np.isfinite(observed) & (weights > 0) & np.isfinite(weights)
+        weights = np.where(usable, weights, 0.0)
+        observed = np.where(usable, observed, 0.0)
+
+        if segments is None:
+            segments = np.zeros(len(observed), np.int64)
+        labels, inverse = np.unique(segments, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(labels) + 1))
+
+        # segments are padded to a common length to be solved together, so
+        # those of similar length (within a factor of two) are batched
+        lengths = np.diff(bounds)
+        batches = np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+        root_weights = np.sqrt(weights)
+        gn0s = np.empty((len(labels), self.degree))
+        for batch in np.unique(batches):
+            selected = np.flatnonzero(batches == batch)
+            gn0s[selected] = self._solve(
+                root_weights, observed, order, bounds[selected], lengths[selected]
+            )
+
+        predicted = np.stack(self.predict(gn0s[inverse]), -1)
+        squared = np.where(usable, (observed - predicted) ** 2, 0.0).sum(-1)
+        counts = np.bincount(inverse, usable.sum(-1), len(labels))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rms = np.sqrt(np.bincount(inverse, squared, len(labels)) / counts)
+        n_samples = np.bincount(inverse, usable.any(-1), len(labels)).astype(np.int64)
+        return FitResult(labels, gn0s, n_samples, rms)
+
+    def _solve(
+        self,
+        root_weights: np.ndarray,
+        observed: np.ndarray,
+        order: np.ndarray,
+        starts: np.ndarray,
+        lengths: np.ndarray,
+    ) -> np.ndarray:
+        """Solve the weighted least squares problems of the segments of
+        ``lengths`` samples starting at ``starts`` in ``order``, returning
+        their coefficients of shape (n_segments, degree)."""
+        degree = self.degree
+        n_segments = len(starts)
+        # at least as many rows as columns for square R factors
+        size = max(int(lengths.max()), degree // 2 + 1)
+        offsets = np.cumsum(lengths) - lengths
+        position = np.arange(lengths.sum()) - np.repeat(offsets, lengths)
+        rows = order[np.repeat(starts, lengths) + position]
+        padded = position + np.repeat(np.arange(n_segments) * size, lengths)
+
+        # the weighted design matrix of each segment with the weighted
+        # observations as its last column and the r and theta components of
+        # a sample as consecutive rows, padded with zero rows which do not
+        # change the solution
+        gathered = np.empty((len(rows), 2, degree + 1))
+        for component, basis in enumerate((self.b_r, self.b_theta)):
+            w = root_weights[rows, component]
+            np.multiply(basis[rows], w[:, None], out=gathered[:, component, :degree])
+            np.multiply(
+                observed[rows, component], w, out=gathered[:, component, degree]
+            )
+        if len(rows) == n_segments * size:
+            augmented = gathered
+        else:
+            augmented = np.zeros((n_segments * size, 2, degree + 1))
+            augmented[padded] = gathered
+        augmented = augmented.reshape(n_segments, 2 * size, degree + 1)
+
+        # scale the columns to improve the conditioning as the terms fall
+        # off with different powers of r
+        design = augmented[..., :degree]
+        norm = np.sqrt(np.einsum("sij,sij->sj", design, design))
+        scale = np.where(norm > 0, 1 / np.where(norm > 0, norm, 1.0), 0.0)
+        design *= scale[:, None, :]
+
+        # the R factor of the augmented matrix holds that of the design
+        # matrix and the projection of the observations onto its columns,
+        # without forming Q. The pseudo-inverse gives the minimum norm
+        # solution of segments with too few samples to determine every
+        # coefficient
+        r = np.asarray(np.linalg.qr(augmented, mode="r"))
+        solution = np.einsum(
+            "sij,sj->si", np.linalg.pinv(r[:, :degree, :degree]), r[:, :degree, degree]
+        )
+        return solution * scale
+
+
+def fit_datafile(
+    df: DataFile,
+    degree: int,
+    weights: Optional[np.ndarray] = None,
+    segments: Optional[np.ndarray] = None,
+) -> FitResult:
+    """Fit an axisymmetric model of ``degree`` terms to the field measured
+    in the data file ``df``, see :meth:`AxisymmetricBasis.fit`. The field
+    is transformed into KRTP components if necessary."""
+    basis = AxisymmetricBasis.from_datafile(df, degree)
+    field = df.field_in("KRTP")
+    return basis.fit(field[:, 0], field[:, 1], weights, segments)
@@ -0,0 +1,242 @@
+"""Opt-in timing and counting of the stages of loading and processing data.
+
+The expensive stages of :class:`DataFile`, :func:`position_properties`
+and the field models (parsing headers, reading data, converting times,
+decoding the sensor status, evaluating models...) each report a
+:class:`StageEvent` giving the time taken along with the rows processed,
+bytes read and arrays allocated. Events are passed to the handlers
+registered with :func:`add_handler`, or logged with :func:`log_stages`.
+When no handler is registered the stages are not timed, which costs a
+single check per stage.
+
+Use :func:`profile` to collect the events of a block of code::
+
+    with profile() as report:
+        df = DataFile(path)
+        model.process_datafile(df)
+    print(report)
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import logging
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageEvent:
+    """The cost of a single execution of a stage.
+
+    Attributes
+    ----------
+    name: str
+      the name of the stage
+    seconds: float
+      the wall clock time taken
+    rows: int
+      the number of rows (or samples) processed
+    bytes_read: int
+      the number of bytes read from disk
+    arrays: int
+      the number of arrays allocated
+    bytes_allocated: int
+      the total size of the arrays allocated
+    """
+
+    name: str
+    seconds: float = 0.0
+    rows: int = 0
+    bytes_read: int = 0
+    arrays: int = 0
+    bytes_allocated: int = 0
+
+
+Handler = Callable[[StageEvent], None]
+
+# replaced rather than mutated so that stages running in other threads
+# see a consistent set of handlers
+_handlers: Tuple[Handler, ...] = ()
+
+
+def add_handler(handler: Handler) -> Handler:
+    """Call ``handler`` with the :class:`StageEvent` of every stage
+    completed from now on. Returns ``handler`` so that this can be used
+    as a decorator."""
+    global _handlers
+    _handlers = _handlers + (handler,)
+    return handler
+
+
+def remove_handler(handler: Handler) -> None:
+    """Stop calling ``handler``, as registered by :func:`add_handler`."""
+    global _handlers
+    handlers = list(_handlers)
+    handlers.remove(handler)
+    _handlers = tuple(handlers)
+
+
+def enabled() -> bool:
+    """Return True if any handlers are registered."""
+    return bool(_handlers)
+
+
+def log_stages(
+    log: Optional[logging.Logger] = None, level: int = logging.DEBUG
+) -> Handler:
+    """Log every stage to ``log``, by default the logger of this module,
+    at ``level``. Returns the handler, which can be passed to
+    :func:`remove_handler` to stop logging."""
+    log = logger if log is None else log
+
+    def handler(event: StageEvent) -> None:
+        log.log(
+            level,
+            "%s: %.6f s, %d rows, %d bytes read, %d arrays (%d bytes) allocated",
+            event.name,
+            event.seconds,
+            event.rows,
+            event.bytes_read,
+            event.arrays,
+            event.bytes_allocated,
+            extra={"stage": event},
+        )
+
+    return add_handler(handler)
+
+
+class _Stage(object):
+    """Context manager timing a stage and emitting its event on exit."""
+
+    def __init__(self, name: str) -> None:
+        self.event = StageEvent(name)
+
+    def __enter__(self) -> "_Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.event.seconds = time.perf_counter() - self._start
+        for handler in _handlers:
+            handler(self.event)
+
+    def add(self, rows: int = 0, bytes_read: int = 0) -> None:
+        """Count ``rows`` processed and ``bytes_read`` in this stage."""
+        self.event.rows += rows
+        self.event.bytes_read += bytes_read
+
+    def allocated(self, *arrays: Optional[np.ndarray]) -> None:
+        """Count the allocation of ``arrays`` in this stage, None entries
+        are ignored."""
+        for a in arrays:
+            if a is not None:
+                self.event.arrays += 1
+                self.event.bytes_allocated += a.nbytes
+
+
+class _NullStage(object):
+    """Stand in for :class:`_Stage` when instrumentation is disabled."""
+
+    def __enter__(self) -> "_NullStage":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def add(self, rows: int = 0, bytes_read: int = 0) -> None:
+        pass
+
+    def allocated(self, *arrays: Optional[np.ndarray]) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name: str) -> Any:
+    """Return a context manager timing the stage ``name``. The object
+    returned on entry has ``add`` and ``allocated`` methods to count the
+    rows, bytes and arrays of the stage. If no handlers are registered
+    this does nothing."""
+    if not _handlers:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+@dataclass
+class StageSummary:
+    """The total cost of all executions of a stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    rows: int = 0
+    bytes_read: int = 0
+    arrays: int = 0
+    bytes_allocated: int = 0
+
+
+@dataclass
+class Profile:
+    """The events recorded by :func:`profile`."""
+
+    events: List[StageEvent] = field(default_factory=list)
+
+    def summary(self) -> Dict[str, StageSummary]:
+        """Return the totals of each stage in the order first seen."""
+        totals: Dict[str, StageSummary] = {}
+        for event in self.events:
+            total = totals.setdefault(event.name, StageSummary())
+            total.calls += 1
+            total.seconds += event.seconds
+            total.rows += event.rows
+            total.bytes_read += event.bytes_read
+            total.arrays += event.arrays
+            total.bytes_allocated += event.bytes_allocated
+        return totals
+
+    def report(self) -> str:
+        """Return the summary of each stage as a table, most expensive
+        first. Stages may be nested so their times need not add up."""
+        header = ("stage", "calls", "seconds", "rows", "read", "arrays", "allocated")
+        rows = [
+            (
+                name,
+                str(s.calls),
+                f"{s.seconds:.6f}",
+                str(s.rows),
+                str(s.bytes_read),
+                str(s.arrays),
+                str(s.bytes_allocated),
+            )
+            for name, s in sorted(
+                self.summary().items(), key=lambda item: -item[1].seconds
+            )
+        ]
+        widths = [max(len(r[i]) for r in [header] + rows) for i in range(len(header))]
+        lines = [
+            "  ".join(
+                v.ljust(w) if i == 0 else v.rjust(w)
+                for i, (v, w) in enumerate(zip(r, widths))
+            )
+            for r in [header] + rows
+        ]
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return self.report()
+
+
+@contextmanager
+def profile() -> Iterator[Profile]:
+    """Collect the events of the stages completed within the block into a
+    :class:`Profile`, which is yielded."""
+    report = Profile()
+    handler = add_handler(report.events.append)
+    try:
+        yield report
+    finally:
+        remove_handler(handler)
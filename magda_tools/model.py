@@ -1,20 +1,24 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
-from sympy.functions.elementary.trigonometric import cos
-from sympy.functions.special.polynomials import legendre
-from sympy.abc import theta, r
-from sympy import lambdify, diff, Mul
 
-from .calculate import distance, latitude, SATURN_RADIUS_KM
+from .calculate import position_properties, SATURN_RADIUS_KM
+from .dask_arrays import is_dask_array, map_samples
 from .data_file import DataFile
+from .instrumentation import stage
+from .model_cache import Components, ModelCache
 
 
-def r_prefix(degree: int) -> Mul:
+def r_prefix(degree: int) -> Any:
+    from sympy.abc import r
+
     return (degree + 1) * r ** -(degree + 2)
 
 
-def theta_prefix(degree: int) -> Mul:
+def theta_prefix(degree: int) -> Any:
+    from sympy.abc import r
+
     return -(r ** -(degree + 2))
 
 
@@ -23,10 +27,117 @@ def phi_hat(r: np.ndarray, theta: np.ndarray) -> np.ndarray:
     return np.zeros_like(r)
 
 
+def legendre(
+    degree: int, theta: Union[float, np.ndarray]
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """Yield ``(n, P_n(cos(theta)), dP_n(cos(theta))/dtheta)`` for each
+    degree n from 1 to ``degree`` using the Bonnet recurrence
+
+      (n + 1) P_{n+1}(x) = (2n + 1) x P_n(x) - n P_{n-1}(x)
+
+    and P'_{n+1}(x) = P'_{n-1}(x) + (2n + 1) P_n(x) for the derivatives, so
+    each degree costs only a few array operations.
+    """
+    theta = np.asarray(theta, dtype=np.float64)
+    x = np.cos(theta)
+    minus_sin = -np.sin(theta)
+    p_prev, p = np.ones_like(x), x
+    dp_prev, dp = np.zeros_like(x), np.ones_like(x)
+    for n in range(1, degree + 1):
+        yield n, p, minus_sin * dp
+        p_prev, p = p, ((2 * n + 1) * x * p - n * p_prev) / (n + 1)
+        dp_prev, dp = dp, dp_prev + (2 * n + 1) * p_prev
+
+
+def _map_chunks(
+    evaluate: Callable[[slice], None],
+    n_rows: int,
+    chunk_size: Optional[int],
+    workers: Optional[int],
+) -> None:
+    """Call ``evaluate`` for slices of at most ``chunk_size`` of ``n_rows``
+    rows, in a pool of ``workers`` threads if given."""
+    step = chunk_size or max(n_rows, 1)
+    chunks = [slice(i, i + step) for i in range(0, n_rows, step)]
+    if workers is not None and workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(evaluate, chunks))
+    else:
+        for rows in chunks:
+            evaluate(rows)
+
+
+def _process_cached(
+    process: Callable[..., Components],
+    df: DataFile,
+    cache: ModelCache,
+    model: str,
+    degree: int,
+    coefficients: Sequence[Any],
+    out: Optional[Components],
+    **kwargs: Any,
+) -> Components:
+    """Return the components calculated by ``process`` for ``df`` from
+    ``cache``, calculating and storing them if absent."""
+    key = cache.key(df, model, degree, coefficients, SATURN_RADIUS_KM)
+    cached = cache.get(key)
+    if cached is None:
+        result = process(df, out=out, **kwargs)
+        if out is not None:
+            result = result[0].copy(), result[1].copy(), result[2].copy()
+        cache.put(key, result)
+        return result if out is None else out
+    if out is None:
+        return cached
+    for o, c in zip(out, cached):
+        o[...] = c
+    return out
+
+
+def schmidt_legendre(
+    degree: int, theta: Union[float, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return arrays ``P`` and ``dP`` of shape ``(degree + 1, degree + 1) +
+    theta.shape`` holding the Schmidt semi-normalised associated Legendre
+    functions P_n^m(cos(theta)) and their derivatives with respect to
+    theta, indexed by ``[n, m]``. Entries with m > n are zero.
+
+    The functions are computed with the standard recurrences
+
+      P_n^n = sqrt((2n - 1) / 2n) sin(theta) P_{n-1}^{n-1}
+      P_n^m = ((2n - 1) cos(theta) P_{n-1}^m - sqrt((n - 1)^2 - m^2) P_{n-2}^m)
+              / sqrt(n^2 - m^2)
+
+    where the factor for P_1^1 is one.
+    """
+    theta = np.asarray(theta, dtype=np.float64)
+    cos, sin = np.cos(theta), np.sin(theta)
+    p = np.zeros((degree + 1, degree + 1) + theta.shape)
+    dp = np.zeros_like(p)
+    p[0, 0] = 1.0
+    for n in range(1, degree + 1):
+        factor = 1.0 if n == 1 else np.sqrt((2 * n - 1) / (2 * n))
+        p[n, n] = factor * sin * p[n - 1, n - 1]
+        dp[n, n] = factor * (cos * p[n - 1, n - 1] + sin * dp[n - 1, n - 1])
+        for m in range(n):
+            a = (2 * n - 1) / np.sqrt(n * n - m * m)
+            p[n, m] = a * cos * p[n - 1, m]
+            dp[n, m] = a * (cos * dp[n - 1, m] - sin * p[n - 1, m])
+            if n > m + 1:
+                b = np.sqrt(((n - 1) ** 2 - m * m) / (n * n - m * m))
+                p[n, m] -= b * p[n - 2, m]
+                dp[n, m] -= b * dp[n - 2, m]
+    return p, dp
+
+
 class BFieldModel(object):
     """Model of a magnetic field strength based on an nth degree spherical
     harmonic expansion.
 
+    The field is evaluated numerically using recurrence relations for the
+    Legendre polynomials. The equivalent symbolic expressions are built
+    with sympy on request and are retained as a reference implementation.
+
     Attributes
     ----------
     r_hat: vectorized function of r and theta
@@ -39,8 +150,6 @@ class BFieldModel(object):
       The symbolic representation of r_hat
     phi_hat: vectorized function of r and theta
       The field strength of the phi component, always returns zero
-    phi_model: sympy function
-      The symbolic representation of r_hat
     """
 
     def __init__(self, gn0s: List[float]) -> None:
@@ -52,34 +161,331 @@ class BFieldModel(object):
         """
 
         self.gn0s = gn0s
-        self.r_model = sum(
-            [
-                r_prefix(i + 1) * gn0s[i] * legendre(i + 1, cos(theta))
-                for i, gn0 in enumerate(gn0s)
-            ]
-        )
-        self.r_hat = lambdify([r, theta], self.r_model, "numpy")
+        self.phi_hat = phi_hat
+        self._r_model: Any = None
+        self._theta_model: Any = None
+
+    @property
+    def degree(self) -> int:
+        return len(self.gn0s)
+
+    @property
+    def r_model(self) -> Any:
+        if self._r_model is None:
+            from sympy import cos, legendre
+            from sympy.abc import theta
+
+            self._r_model = sum(
+                [
+                    r_prefix(i + 1) * gn0 * legendre(i + 1, cos(theta))
+                    for i, gn0 in enumerate(self.gn0s)
+                ]
+            )
+        return self._r_model
+
+    @property
+    def theta_model(self) -> Any:
+        if self._theta_model is None:
+            from sympy import cos, diff, legendre
+            from sympy.abc import theta
+
+            self._theta_model = sum(
+                [
+                    theta_prefix(i + 1) * gn0 * diff(legendre(i + 1, cos(theta)), theta)
+                    for i, gn0 in enumerate(self.gn0s)
+                ]
+            )
+        return self._theta_model
+
+    def reference_functions(self) -> Tuple[Callable, Callable]:
+        """Return the r and theta field components as functions of r and
+        theta lambdified from the symbolic model. These are much slower to
+        construct than the numerical evaluation but are useful as a
+        reference."""
+        from sympy import lambdify
+        from sympy.abc import r, theta
 
-        self.theta_model = sum(
-            [
-                theta_prefix(i + 1) * gn0s[i] * diff(legendre(i + 1, cos(theta)), theta)
-                for i, gn0 in enumerate(gn0s)
-            ]
+        return (
+            lambdify([r, theta], self.r_model, "numpy"),
+            lambdify([r, theta], self.theta_model, "numpy"),
         )
-        self.theta_hat = lambdify([r, theta], self.theta_model, "numpy")
 
-        self.phi_hat = phi_hat
+    def field(
+        self,
+        r: Union[float, np.ndarray],
+        theta: Union[float, np.ndarray],
+        out: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the r and theta field components at radial distances ``r``
+        (in planetary radii) and co-latitudes ``theta`` (in radians),
+        evaluating all degrees in a single pass. The results are written
+        to the arrays in ``out`` if provided. If ``r`` or ``theta`` is a
+        dask array the components are returned as lazy dask arrays."""
+        if is_dask_array(r) or is_dask_array(theta):
+            b_r, b_theta = map_samples(self.field, [r, theta], 2)
+            return b_r, b_theta
+        with stage("model_field") as timer:
+            inv_r = np.reciprocal(np.asarray(r, dtype=np.float64))
+            # r^-(n + 2) for the current degree n, as an array even for a
+            # scalar r so that it can be updated in place
+            r_power = np.asarray(inv_r * inv_r)
+            if out is None:
+                shape = np.broadcast(inv_r, theta).shape
+                out = np.empty(shape), np.empty(shape)
+                timer.allocated(*out)
+            b_r, b_theta = out
+            b_r[...] = 0
+            b_theta[...] = 0
+            term = np.empty_like(b_r)
+            timer.add(rows=b_r.size)
+            timer.allocated(term)
+            for n, p, dp in legendre(self.degree, theta):
+                g = self.gn0s[n - 1]
+                np.multiply(r_power, inv_r, out=r_power)
+                np.multiply(r_power, p, out=term)
+                term *= (n + 1) * g
+                b_r += term
+                np.multiply(r_power, dp, out=term)
+                term *= g
+                b_theta -= term
+            return b_r, b_theta
+
+    def r_hat(
+        self, r: Union[float, np.ndarray], theta: Union[float, np.ndarray]
+    ) -> np.ndarray:
+        """The field strength of the r (range) component."""
+        return self.field(r, theta)[0]
+
+    def theta_hat(
+        self, r: Union[float, np.ndarray], theta: Union[float, np.ndarray]
+    ) -> np.ndarray:
+        """The field strength of the theta (co-latitude) component."""
+        return self.field(r, theta)[1]
+
+    def process_datafile(
+        self,
+        df: DataFile,
+        chunk_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+        cache: Optional[ModelCache] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the three field components (r^hat, theta^hat and phi^hat respectively)
+        calculated from the positions stored in the Magda DataFile ``df``.
+
+        If ``chunk_size`` is given the positions are processed that many
+        rows at a time so that temporary arrays are bounded by the chunk
+        size rather than the length of the file. Chunks are evaluated in
+        a pool of ``workers`` threads if given. The results are written to
+        the three arrays in ``out`` if provided.
+
+        If a :class:`ModelCache` is given as ``cache`` the components are
+        taken from it when the same file has been evaluated with the same
+        coefficients, and stored in it otherwise. Components are then
+        returned as read only arrays unless ``out`` is provided.
+        """
+        if cache is not None:
+            return _process_cached(
+                self.process_datafile,
+                df,
+                cache,
+                type(self).__name__,
+                self.degree,
+                [self.gn0s],
+                out,
+                chunk_size=chunk_size,
+                workers=workers,
+            )
+        x, y, z = df["X_KG"].data, df["Y_KG"].data, df["Z_KG"].data
+        n_rows = len(x)
+        if out is None:
+            out = np.empty(n_rows), np.empty(n_rows), np.empty(n_rows)
+        r_out, theta_out, phi_out = out
+
+        def evaluate(rows: slice) -> None:
+            position = position_properties(
+                x[rows], y[rows], z[rows], radius=SATURN_RADIUS_KM
+            )
+            r, theta = position.distance, position.colatitude
+            self.field(r, theta, out=(r_out[rows], theta_out[rows]))
+            phi_out[rows] = self.phi_hat(r, theta)
+
+        _map_chunks(evaluate, n_rows, chunk_size, workers)
+        return r_out, theta_out, phi_out
+
+
+class SphericalHarmonicModel(object):
+    """Model of a magnetic field based on a full spherical harmonic
+    expansion with Schmidt semi-normalised coefficients g_n^m and h_n^m,
+    allowing for non-axisymmetric fields.
+
+    The associated Legendre functions for the most recent batch of
+    co-latitudes passed to :meth:`field` are cached so that repeated
+    evaluations over the same positions skip the recurrence.
+
+    Attributes
+    ----------
+    g: array of floats
+      the g_n^m coefficients indexed by ``[n, m]``
+    h: array of floats
+      the h_n^m coefficients indexed by ``[n, m]``
+    """
+
+    def __init__(self, g: np.ndarray, h: Optional[np.ndarray] = None) -> None:
+        """Arguments
+        ---------
+        g: square array of numbers
+          the g_n^m coefficients indexed by ``[n, m]``, the array size
+          determines the degree of the model. Row 0 and entries with
+          m > n are ignored
+        h: square array of numbers, optional
+          the h_n^m coefficients, of the same shape as ``g``. Taken to be
+          zero if not provided
+        """
+        self.g = np.asarray(g, dtype=np.float64)
+        self.h = np.zeros_like(self.g) if h is None else np.asarray(h, dtype=np.float64)
+        if self.g.ndim != 2 or self.g.shape[0] != self.g.shape[1]:
+            raise ValueError("Coefficients must be a square array indexed by [n, m]")
+        if self.h.shape != self.g.shape:
+            raise ValueError("g and h coefficient arrays must have the same shape")
+        self._cached_theta: Optional[np.ndarray] = None
+        self._cached_legendre: Tuple[np.ndarray, np.ndarray]
+
+    @classmethod
+    def from_gn0s(cls, gn0s: List[float]) -> "SphericalHarmonicModel":
+        """Construct the axisymmetric model equivalent to
+        ``BFieldModel(gn0s)``."""
+        g = np.zeros((len(gn0s) + 1, len(gn0s) + 1))
+        g[1:, 0] = gn0s
+        return cls(g)
 
     @property
     def degree(self) -> int:
-        return len(self.gn0s)
+        return self.g.shape[0] - 1
+
+    def _legendre(self, theta: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cached = self._cached_theta
+        if (
+            cached is None
+            or cached.shape != theta.shape
+            or not np.array_equal(cached, theta)
+        ):
+            self._cached_legendre = schmidt_legendre(self.degree, theta)
+            self._cached_theta = theta.copy()
+        return self._cached_legendre
 
-    def process_datafile(self, df: DataFile):
+    def field(
+        self,
+        r: Union[float, np.ndarray],
+        theta: Union[float, np.ndarray],
+        phi: Union[float, np.ndarray],
+        out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return the r, theta and phi field components at radial distances
+        ``r`` (in planetary radii), co-latitudes ``theta`` and longitudes
+        ``phi`` (in radians). The results are written to the arrays in
+        ``out`` if provided. The phi component is set to zero exactly on
+        the spin axis where it is undefined. If any of the coordinates is
+        a dask array the components are returned as lazy dask arrays."""
+        if any(is_dask_array(v) for v in (r, theta, phi)):
+            b_r, b_theta, b_phi = map_samples(self.field, [r, theta, phi], 3)
+            return b_r, b_theta, b_phi
+        theta = np.asarray(theta, dtype=np.float64)
+        with stage("spherical_harmonic_field") as timer:
+            result = self._field(r, theta, phi, self._legendre(theta), out)
+            timer.add(rows=result[0].size)
+            if out is None:
+                timer.allocated(*result)
+        return result
+
+    def _field(
+        self,
+        r: Union[float, np.ndarray],
+        theta: np.ndarray,
+        phi: Union[float, np.ndarray],
+        legendre: Tuple[np.ndarray, np.ndarray],
+        out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        p, dp = legendre
+        inv_r = np.reciprocal(np.asarray(r, dtype=np.float64))
+        phi = np.asarray(phi, dtype=np.float64)
+        if out is None:
+            shape = np.broadcast(inv_r, theta, phi).shape
+            out = np.empty(shape), np.empty(shape), np.empty(shape)
+        b_r, b_theta, b_phi = out
+        b_r[...] = 0
+        b_theta[...] = 0
+        b_phi[...] = 0
+
+        # cos(m phi) and sin(m phi) for all orders
+        cos_m = [np.ones_like(phi), np.cos(phi)]
+        sin_m = [np.zeros_like(phi), np.sin(phi)]
+        for m in range(2, self.degree + 1):
+            cos_m.append(2 * cos_m[1] * cos_m[m - 1] - cos_m[m - 2])
+            sin_m.append(2 * cos_m[1] * sin_m[m - 1] - sin_m[m - 2])
+
+        # (1 / r)^(n + 2) for the current degree n
+        r_power = inv_r * inv_r
+        for n in range(1, self.degree + 1):
+            r_power = r_power * inv_r
+            for m in range(n + 1):
+                g, h = self.g[n, m], self.h[n, m]
+                if g == 0 and h == 0:
+                    continue
+                angular = r_power * (g * cos_m[m] + h * sin_m[m])
+                b_r += (n + 1) * angular * p[n, m]
+                b_theta -= angular * dp[n, m]
+                if m:
+                    b_phi += (m * r_power) * (g * sin_m[m] - h * cos_m[m]) * p[n, m]
+
+        sin_theta = np.sin(theta)
+        on_axis = sin_theta == 0
+        np.divide(b_phi, np.where(on_axis, 1.0, sin_theta), out=b_phi)
+        b_phi[np.broadcast_to(on_axis, b_phi.shape)] = 0
+        return b_r, b_theta, b_phi
+
+    def process_datafile(
+        self,
+        df: DataFile,
+        chunk_size: Optional[int] = 65536,
+        workers: Optional[int] = None,
+        out: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None,
+        cache: Optional[ModelCache] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Return the three field components (r^hat, theta^hat and phi^hat respectively)
-        calculated from the positions stored in the Magda DataFile ``df``."""
-        xyz = df["X_KG"].data, df["Y_KG"].data, df["Z_KG"].data
-        r = distance(*xyz, radius=SATURN_RADIUS_KM)
-        lat = latitude(*xyz)
-        theta = (90.0 - lat) / 180 * np.pi
+        calculated from the KG positions stored in the Magda DataFile ``df``.
+        The arguments are as for :meth:`BFieldModel.process_datafile`
+        except that positions are processed in chunks by default to
+        bound the size of the Legendre function tables.
+        """
+        if cache is not None:
+            return _process_cached(
+                self.process_datafile,
+                df,
+                cache,
+                type(self).__name__,
+                self.degree,
+                [self.g, self.h],
+                out,
+                chunk_size=chunk_size,
+                workers=workers,
+            )
+        x, y, z = df["X_KG"].data, df["Y_KG"].data, df["Z_KG"].data
+        n_rows = len(x)
+        if out is None:
+            out = np.empty(n_rows), np.empty(n_rows), np.empty(n_rows)
+        r_out, theta_out, phi_out = out
+
+        def evaluate(rows: slice) -> None:
+            position = position_properties(
+                x[rows], y[rows], z[rows], radius=SATURN_RADIUS_KM
+            )
+            r, theta = position.distance, position.colatitude
+            phi = np.arctan2(y[rows], x[rows])
+            legendre = schmidt_legendre(self.degree, theta)
+            self._field(
+                r, theta, phi, legendre, (r_out[rows], theta_out[rows], phi_out[rows])
+            )
 
-        return self.r_hat(r, theta), self.theta_hat(r, theta), self.phi_hat(r, theta)
+        _map_chunks(evaluate, n_rows, chunk_size, workers)
+        return r_out, theta_out, phi_out
@@ -0,0 +1,222 @@
+"""Caching of the field components evaluated by the models.
+
+The same trajectories are often evaluated against the same model in many
+jobs. A :class:`ModelCache` passed to ``process_datafile`` of
+:class:`BFieldModel` or :class:`SphericalHarmonicModel` stores the field
+components keyed by the identity of the data file (its path,
+modification time and size, the rows held and a digest of the positions
+evaluated, see :meth:`DataFile.identity`) and the model (its type,
+degree, coefficients and the planetary radius), so that later
+evaluations skip the position calculations and Legendre recurrences.
+
+Results are kept in memory, least recently used first out once a size
+limit is exceeded, and optionally in a directory on disk, which may be
+shared by many processes and is similarly limited in size.
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .instrumentation import stage
+
+if TYPE_CHECKING:
+    from .data_file import DataFile
+
+# incremented whenever the evaluation of the models changes in a way that
+# invalidates cached results
+MODEL_CACHE_VERSION = 2
+
+# the columns of the positions at which the models are evaluated
+POSITION_COLUMNS = ("X_KG", "Y_KG", "Z_KG")
+
+Components = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class ModelCache(object):
+    """An in-memory and optional disk cache of model field components.
+
+    Components returned from the cache are read only arrays, those on
+    disk being memory mapped. The key of a data file includes a digest of
+    its positions, so positions modified after reading are evaluated
+    afresh.
+
+    Attributes
+    ----------
+    hits: int
+      the number of lookups found in the cache
+    misses: int
+      the number of lookups not found in the cache
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 2**20,
+        directory: Optional[str] = None,
+        max_disk_bytes: Optional[int] = None,
+    ) -> None:
+        """Arguments
+        ---------
+        max_bytes: int
+          the maximum total size of the components held in memory
+        directory: path, optional
+          the directory in which to also store components on disk
+        max_disk_bytes: int, optional
+          the maximum total size of the files in ``directory``, by default
+          unlimited
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Components]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes(self) -> int:
+        """The total size of the components held in memory."""
+        return self._nbytes
+
+    @staticmethod
+    def key(
+        df: "DataFile",
+        model: str,
+        degree: int,
+        coefficients: Sequence[Any],
+        radius: float,
+    ) -> str:
+        """Return the key of the components of ``model`` (the name of its
+        type) with ``degree`` and ``coefficients`` (a sequence of arrays)
+        evaluated at the positions of ``df`` in units of ``radius``."""
+        identity = dict(
+            version=MODEL_CACHE_VERSION,
+            datafile=df.identity(POSITION_COLUMNS),
+            model=model,
+            degree=degree,
+            coefficients=[
+                np.asarray(c, dtype=np.float64).tolist() for c in coefficients
+            ],
+            radius=radius,
+        )
+        encoded = json.dumps(identity, sort_keys=True).encode()
+        return hashlib.sha256(encoded).hexdigest()
+
+    def _path(self, key: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, key + ".npy")
+
+    def _touch(self, key: str) -> None:
+        """Mark the file of ``key`` as most recently used for eviction from
+        disk. The time is set explicitly as file system timestamps may be
+        too coarse to order successive uses."""
+        if self.directory is not None:
+            now = time.time_ns()
+            try:
+                os.utime(self._path(key), ns=(now, now))
+            except FileNotFoundError:
+                pass
+
+    def get(self, key: str) -> Optional[Components]:
+        """Return the components stored under ``key``, or None if absent."""
+        with self._lock:
+            components = self._entries.get(key)
+            if components is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if components is not None:
+            self._touch(key)
+            return components
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                with stage("model_cache_load") as timer:
+                    stacked = np.load(path, mmap_mode="r")
+                    timer.add(rows=stacked.shape[1])
+            except (FileNotFoundError, ValueError):
+                pass
+            else:
+                components = (stacked[0], stacked[1], stacked[2])
+                self._touch(key)
+                self._remember(key, components)
+                with self._lock:
+                    self.hits += 1
+                return components
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, components: Components) -> None:
+        """Store ``components`` under ``key``. The arrays are held rather
+        than copied and are made read only."""
+        for c in components:
+            c.flags.writeable = False
+        self._remember(key, components)
+        if self.directory is not None:
+            path = self._path(key)
+            temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                np.save(f, np.stack(components))
+            os.replace(temporary, path)
+            self._touch(key)
+            self._evict_disk()
+
+    def _remember(self, key: str, components: Components) -> None:
+        """Hold ``components`` in memory, evicting the least recently used
+        entries to stay within the size limit."""
+        nbytes = sum(c.nbytes for c in components)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= sum(c.nbytes for c in previous)
+            self._entries[key] = components
+            self._nbytes += nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= sum(c.nbytes for c in evicted)
+
+    def _evict_disk(self) -> None:
+        """Remove the least recently used files from the directory until
+        within its size limit."""
+        if self.max_disk_bytes is None:
+            return
+        assert self.directory is not None
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npy"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # removed by another process sharing the directory
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        """Remove all entries from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".npy"):
+                    os.remove(entry.path)
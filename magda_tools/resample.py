@@ -0,0 +1,301 @@
+"""Vectorized downsampling of time series, as used to summarise or plot
+long intervals of data.
+
+Samples are grouped into bins of a fixed cadence aligned to the unix
+epoch, so that bins from different files or resolutions line up, and
+each statistic is computed in a single ``reduceat`` pass over the
+sorted time axis. Bins containing no samples (data gaps) have a count
+of zero and NaN statistics.
+"""
+
+from dataclasses import dataclass
+import json
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .time_conversion import unix_to_datetime64
+
+CADENCE_UNITS = dict(s=1, m=60, h=3600, d=86400)
+
+STATISTICS = ("mean", "min", "max", "std")
+
+# cadences of the levels of a pyramid of resampled data
+PYRAMID_CADENCES = ("1m", "10m", "1h")
+
+
+def parse_cadence(cadence: Union[str, float]) -> float:
+    """Return the length in seconds of ``cadence``, either a number of
+    seconds or a string such as ``"30s"``, ``"1m"``, ``"1h"`` or
+    ``"1d"``."""
+    if isinstance(cadence, str):
+        try:
+            seconds = float(cadence[:-1]) * CADENCE_UNITS[cadence[-1]]
+        except (KeyError, ValueError):
+            raise ValueError(f"Invalid cadence {cadence!r}")
+    else:
+        seconds = float(cadence)
+    if not seconds > 0:
+        raise ValueError(f"Cadence must be positive, got {cadence!r}")
+    return seconds
+
+
+@dataclass
+class Resampled:
+    """Statistics of one or more columns over bins of a fixed cadence.
+
+    Attributes
+    ----------
+    cadence: float
+      the length of each bin in seconds
+    unix_time: array of floats
+      the start of each bin as UTC unix seconds
+    count: array of ints
+      the number of samples falling in each bin
+    columns: list of str
+      the names of the resampled columns
+    values: dict
+      maps each statistic to an array of shape (n_bins, n_columns)
+    """
+
+    cadence: float
+    unix_time: np.ndarray
+    count: np.ndarray
+    columns: List[str]
+    values: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.unix_time)
+
+    @property
+    def datetime64(self) -> np.ndarray:
+        """The start of each bin as UTC ``datetime64[ns]`` values."""
+        return unix_to_datetime64(self.unix_time)
+
+    def column(self, name: str, statistic: str = "mean") -> np.ndarray:
+        """Return ``statistic`` of the column ``name`` for each bin."""
+        try:
+            index = self.columns.index(name)
+        except ValueError:
+            raise ValueError(f"No column named {name} in resampled data")
+        try:
+            return self.values[statistic][:, index]
+        except KeyError:
+            raise ValueError(f"Statistic {statistic} was not calculated")
+
+    def save(self, path: str, **attributes: str) -> None:
+        """Save to an ``.npz`` file at ``path``. Any string ``attributes``
+        are stored alongside for use when loading."""
+        header = dict(cadence=self.cadence, columns=self.columns, **attributes)
+        np.savez(
+            path,
+            header=json.dumps(header),
+            unix_time=self.unix_time,
+            count=self.count,
+            **{f"value_{k}": v for k, v in self.values.items()},
+        )
+
+    @classmethod
+    def load(cls, path: str) -> Tuple["Resampled", Dict[str, str]]:
+        """Load from a file written by :meth:`save`, returning the resampled
+        data and the attributes saved with it."""
+        with np.load(path) as contents:
+            header = json.loads(str(contents["header"]))
+            resampled = cls(
+                header.pop("cadence"),
+                contents["unix_time"],
+                contents["count"],
+                header.pop("columns"),
+                {
+                    k[len("value_") :]: contents[k]
+                    for k in contents.files
+                    if k.startswith("value_")
+                },
+            )
+        return resampled, header
+
+
+def _segments(bins: np.ndarray) -> np.ndarray:
+    """Return the index of the first element of each run of equal values
+    in the sorted array ``bins``."""
+    return np.concatenate(([0], np.flatnonzero(np.diff(bins)) + 1))
+
+
+def _first_match(
+    values: np.ndarray, targets: np.ndarray, starts: np.ndarray, counts: np.ndarray
+) -> np.ndarray:
+    """Return the index of the first element of each segment of ``values``,
+    beginning at ``starts`` and of length ``counts``, equal to the
+    segment's value in ``targets``. Segments without a match (those
+    entirely NaN) give their first index."""
+    matches = np.flatnonzero(values == np.repeat(targets, counts))
+    found = np.searchsorted(matches, starts)
+    first = matches[np.minimum(found, len(matches) - 1)] if len(matches) else starts
+    return np.where(first < starts + counts, first, starts)
+
+
+def bin_statistics(
+    unix_time: np.ndarray,
+    values: np.ndarray,
+    cadence: Union[str, float],
+    statistics: Sequence[str] = ("mean",),
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """Calculate ``statistics`` of ``values`` in bins of ``cadence``.
+
+    Arguments
+    ---------
+    unix_time: array of floats
+      the sorted time of each sample as UTC unix seconds
+    values: array
+      the samples, either one dimensional or of shape (n_samples,
+      n_columns) to resample several columns in one pass
+    cadence: str or float
+      the bin length, see :func:`parse_cadence`
+    statistics: sequence of str
+      any of "mean", "min", "max" and "std" (the population standard
+      deviation)
+
+    Returns
+    -------
+    The start time of each bin between the first and last sample, the
+    number of samples in each bin and a dictionary mapping each
+    statistic to an array with a leading dimension of the number of
+    bins. Empty bins have NaN statistics.
+    """
+    seconds = parse_cadence(cadence)
+    for statistic in statistics:
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unknown statistic {statistic}")
+    unix_time = np.asarray(unix_time, dtype=np.float64)
+    values = np.asarray(values)
+    if len(unix_time) != len(values):
+        raise ValueError("Times and values must be the same length")
+
+    if not len(unix_time):
+        empty = np.empty((0,) + values.shape[1:])
+        return np.empty(0), np.empty(0, np.int64), {s: empty for s in statistics}
+
+    bins = np.floor(unix_time / seconds).astype(np.int64)
+    first_bin = bins[0]
+    n_bins = bins[-1] - first_bin + 1
+    starts = _segments(bins)
+    occupied = bins[starts] - first_bin
+
+    count = np.zeros(n_bins, np.int64)
+    count[occupied] = np.diff(np.append(starts, len(bins)))
+    bin_count = count[occupied].reshape((-1,) + (1,) * (values.ndim - 1))
+
+    results: Dict[str, np.ndarray] = {}
+    mean = np.empty(0)
+    if "mean" in statistics or "std" in statistics:
+        mean = np.add.reduceat(values, starts, axis=0, dtype=np.float64) / bin_count
+    for statistic in statistics:
+        if statistic == "mean":
+            binned = mean
+        elif statistic == "min":
+            binned = np.minimum.reduceat(values, starts, axis=0)
+        elif statistic == "max":
+            binned = np.maximum.reduceat(values, starts, axis=0)
+        else:
+            deviation: np.ndarray = values - np.repeat(mean, bin_count.ravel(), axis=0)
+            binned = np.sqrt(np.add.reduceat(deviation**2, starts, axis=0) / bin_count)
+        result = np.full((n_bins,) + values.shape[1:], np.nan)
+        result[occupied] = binned
+        results[statistic] = result
+
+    unix_bins = (first_bin + np.arange(n_bins)) * seconds
+    return unix_bins, count, results
+
+
+def select_columns(
+    columns: Sequence[Any],
+    names: Optional[Sequence[str]] = None,
+    by_name: Optional[Mapping[str, Any]] = None,
+) -> Dict[str, np.ndarray]:
+    """Return the data of the Columns called ``names`` from ``columns``,
+    by default all columns of real values. Names are looked up in
+    ``by_name`` if given, a mapping of names and aliases to columns as
+    returned by :func:`data_file.column_mapping`, and the data is keyed
+    by the names as given."""
+    if names is None:
+        return {c.name: c.data for c in columns[1:] if c.type_ == "f"}
+    if by_name is None:
+        by_name = {c.name: c for c in columns}
+    try:
+        return {name: by_name[name].data for name in names}
+    except KeyError as error:
+        raise ValueError(f"No column named {error.args[0]}")
+
+
+def resample(
+    unix_time: np.ndarray,
+    columns: Dict[str, np.ndarray],
+    cadence: Union[str, float],
+    statistics: Sequence[str] = ("mean",),
+) -> Resampled:
+    """Calculate ``statistics`` of each of the named ``columns`` in bins
+    of ``cadence``. See :func:`bin_statistics`."""
+    names = list(columns)
+    if names:
+        values = np.column_stack([columns[name] for name in names])
+    else:
+        values = np.empty((len(unix_time), 0))
+    unix_bins, count, results = bin_statistics(unix_time, values, cadence, statistics)
+    return Resampled(parse_cadence(cadence), unix_bins, count, names, results)
+
+
+def minmax_decimate(
+    unix_time: np.ndarray,
+    values: np.ndarray,
+    n_pixels: int,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce ``values`` to the minimum and maximum sample within each of
+    ``n_pixels`` equal intervals between ``start`` and ``end`` (by
+    default the first and last sample) for plotting. A line drawn through
+    the result covers the same pixels as one through every sample.
+
+    The two samples of each interval are returned in time order with
+    their original times. Where intervals contain no samples a point with
+    a NaN value is inserted so that plotted lines are broken across the
+    gap. Returns the decimated times and values.
+    """
+    unix_time = np.asarray(unix_time, dtype=np.float64)
+    values = np.asarray(values)
+    if values.ndim != 1 or len(values) != len(unix_time):
+        raise ValueError("Values must be one dimensional and match the times")
+    if n_pixels < 1:
+        raise ValueError("At least one pixel is required")
+
+    first = 0 if start is None else np.searchsorted(unix_time, start, side="left")
+    last = len(unix_time) if end is None else np.searchsorted(unix_time, end, "right")
+    times, values = unix_time[first:last], values[first:last]
+    if not len(times):
+        return times, values.astype(np.float64)
+    start = times[0] if start is None else start
+    end = times[-1] if end is None else end
+
+    width = (end - start) / n_pixels
+    if width > 0:
+        pixels = np.floor((times - start) / width).astype(np.int64)
+        np.clip(pixels, 0, n_pixels - 1, out=pixels)
+    else:
+        pixels = np.zeros(len(times), np.int64)
+
+    starts = _segments(pixels)
+    counts = np.diff(np.append(starts, len(pixels)))
+    lowest = _first_match(values, np.fmin.reduceat(values, starts), starts, counts)
+    highest = _first_match(values, np.fmax.reduceat(values, starts), starts, counts)
+    indices = np.empty(2 * len(starts), np.int64)
+    indices[0::2] = np.minimum(lowest, highest)
+    indices[1::2] = np.maximum(lowest, highest)
+
+    out_times = times[indices]
+    out_values = values[indices].astype(np.float64)
+    gaps = np.flatnonzero(np.diff(pixels[starts]) > 1) + 1
+    if len(gaps):
+        gap_times = (out_times[2 * gaps - 1] + out_times[2 * gaps]) / 2
+        out_times = np.insert(out_times, 2 * gaps, gap_times)
+        out_values = np.insert(out_values, 2 * gaps, np.nan)
+    return out_times, out_values
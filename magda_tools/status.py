@@ -0,0 +1,130 @@
+"""Run-length index of the sensor status of ``coord == "C"`` data.
+
+The decoded sensor status gives the sensitivity range in which the
+magnetometer was operating and changes only rarely, so it is stored as
+the runs of rows with the same status. Masks, range change times and the
+column data within each range are then derived from the runs without
+looping over the rows.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+STATUS_DTYPE = np.uint8
+
+
+@dataclass
+class StatusSegments:
+    """The runs of consecutive rows with the same sensor status.
+
+    Attributes
+    ----------
+    starts: array of ints
+      the index of the first row of each segment
+    stops: array of ints
+      one past the index of the last row of each segment
+    values: array of uint8
+      the status of each segment
+    start_time: array of floats
+      the unix time of the first row of each segment
+    stop_time: array of floats
+      the unix time of the last row of each segment
+    """
+
+    starts: np.ndarray
+    stops: np.ndarray
+    values: np.ndarray
+    start_time: np.ndarray
+    stop_time: np.ndarray
+
+    @classmethod
+    def from_status(
+        cls, status: np.ndarray, unix_time: Optional[np.ndarray] = None
+    ) -> "StatusSegments":
+        """Construct the segments of the decoded ``status`` of each row. If
+        the row times ``unix_time`` are not given the segment times are
+        NaN."""
+        status = np.asarray(status)
+        n_rows = len(status)
+        changes = np.flatnonzero(np.diff(status)) + 1
+        starts = np.concatenate([[0], changes]) if n_rows else changes
+        stops = np.concatenate([changes, [n_rows]]) if n_rows else changes
+        if unix_time is None:
+            start_time = stop_time = np.full(len(starts), np.nan)
+        else:
+            unix_time = np.asarray(unix_time)
+            start_time = unix_time[starts]
+            stop_time = unix_time[stops - 1]
+        return cls(
+            starts.astype(np.int64),
+            stops.astype(np.int64),
+            status[starts].astype(STATUS_DTYPE),
+            start_time,
+            stop_time,
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.stops[-1]) if len(self) else 0
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """The number of rows in each segment."""
+        return self.stops - self.starts
+
+    @property
+    def changes(self) -> np.ndarray:
+        """The indices of the rows at which the status changes."""
+        return self.starts[1:]
+
+    @property
+    def change_times(self) -> np.ndarray:
+        """The unix times of the rows at which the status changes."""
+        return self.start_time[1:]
+
+    @property
+    def ranges(self) -> np.ndarray:
+        """The distinct status values present, in ascending order."""
+        return np.unique(self.values)
+
+    def status(self) -> np.ndarray:
+        """Return the status of every row as a uint8 array."""
+        return np.repeat(self.values, self.lengths)
+
+    def at(self, rows: Union[int, np.ndarray]) -> Union[int, np.ndarray]:
+        """Return the status of the rows with indices ``rows``."""
+        return self.values[np.searchsorted(self.starts, rows, side="right") - 1]
+
+    def segments(self, value: Union[int, Sequence[int]]) -> np.ndarray:
+        """Return the indices of the segments with the status ``value``, or
+        any of the statuses in ``value`` if it is a sequence."""
+        return np.flatnonzero(np.isin(self.values, value))
+
+    def mask(self, value: Union[int, Sequence[int]]) -> np.ndarray:
+        """Return a boolean array that is True for each row with the status
+        ``value``, or any of the statuses in ``value``."""
+        return np.repeat(np.isin(self.values, value), self.lengths)
+
+    def views(
+        self, data: np.ndarray, value: Union[int, Sequence[int]]
+    ) -> List[np.ndarray]:
+        """Return a view of ``data``, an array with a row for each row of
+        the file, for each segment with the status ``value``."""
+        selected = self.segments(value)
+        return [
+            data[start:stop]
+            for start, stop in zip(self.starts[selected], self.stops[selected])
+        ]
+
+    def select(self, data: np.ndarray, value: Union[int, Sequence[int]]) -> np.ndarray:
+        """Return the rows of ``data`` with the status ``value``. This is a
+        view if the rows form a single segment and a copy otherwise."""
+        selected = self.segments(value)
+        if len(selected) == 1:
+            return data[self.starts[selected[0]] : self.stops[selected[0]]]
+        return data[self.mask(value)]
@@ -0,0 +1,154 @@
+"""Vectorized conversion between the TAI based time stamps stored in
+MAGDA flat files and numeric UTC representations.
+
+Times are handled as float64 seconds since 1970-01-01 00:00:00 in the
+unix convention (i.e. ignoring leap seconds), which avoids the cost of
+constructing astropy ``Time`` objects for every sample. The TAI-UTC
+offsets are taken from a precomputed table equivalent to that used by
+ERFA (and therefore astropy).
+"""
+
+from datetime import datetime, timezone
+import sys
+from typing import Any, Union
+
+import numpy as np
+
+SECS_PER_DAY: int = 86400
+
+# Modified Julian Date of the unix epoch
+MJD_UNIX_EPOCH: int = 40587
+
+# Table of TAI-UTC offsets, one row per change, as
+# (year, month, offset in seconds, reference MJD, drift in seconds per day).
+# Before 1972 UTC drifted with respect to TAI, the offset at a date is
+# then offset + (MJD - reference MJD) * drift.
+TAI_UTC_TABLE = (
+    (1960, 1, 1.4178180, 37300.0, 0.0012960),
+    (1961, 1, 1.4228180, 37300.0, 0.0012960),
+    (1961, 8, 1.3728180, 37300.0, 0.0012960),
+    (1962, 1, 1.8458580, 37665.0, 0.0011232),
+    (1963, 11, 1.9458580, 37665.0, 0.0011232),
+    (1964, 1, 3.2401300, 38761.0, 0.0012960),
+    (1964, 4, 3.3401300, 38761.0, 0.0012960),
+    (1964, 9, 3.4401300, 38761.0, 0.0012960),
+    (1965, 1, 3.5401300, 38761.0, 0.0012960),
+    (1965, 3, 3.6401300, 38761.0, 0.0012960),
+    (1965, 7, 3.7401300, 38761.0, 0.0012960),
+    (1965, 9, 3.8401300, 38761.0, 0.0012960),
+    (1966, 1, 4.3131700, 39126.0, 0.0025920),
+    (1968, 2, 4.2131700, 39126.0, 0.0025920),
+    (1972, 1, 10.0, 0.0, 0.0),
+    (1972, 7, 11.0, 0.0, 0.0),
+    (1973, 1, 12.0, 0.0, 0.0),
+    (1974, 1, 13.0, 0.0, 0.0),
+    (1975, 1, 14.0, 0.0, 0.0),
+    (1976, 1, 15.0, 0.0, 0.0),
+    (1977, 1, 16.0, 0.0, 0.0),
+    (1978, 1, 17.0, 0.0, 0.0),
+    (1979, 1, 18.0, 0.0, 0.0),
+    (1980, 1, 19.0, 0.0, 0.0),
+    (1981, 7, 20.0, 0.0, 0.0),
+    (1982, 7, 21.0, 0.0, 0.0),
+    (1983, 7, 22.0, 0.0, 0.0),
+    (1985, 7, 23.0, 0.0, 0.0),
+    (1988, 1, 24.0, 0.0, 0.0),
+    (1990, 1, 25.0, 0.0, 0.0),
+    (1991, 1, 26.0, 0.0, 0.0),
+    (1992, 7, 27.0, 0.0, 0.0),
+    (1993, 7, 28.0, 0.0, 0.0),
+    (1994, 7, 29.0, 0.0, 0.0),
+    (1996, 1, 30.0, 0.0, 0.0),
+    (1997, 7, 31.0, 0.0, 0.0),
+    (1999, 1, 32.0, 0.0, 0.0),
+    (2006, 1, 33.0, 0.0, 0.0),
+    (2009, 1, 34.0, 0.0, 0.0),
+    (2012, 7, 35.0, 0.0, 0.0),
+    (2015, 7, 36.0, 0.0, 0.0),
+    (2017, 1, 37.0, 0.0, 0.0),
+)
+
+_UTC_STARTS = np.array(
+    [
+        np.datetime64(f"{year:04d}-{month:02d}-01", "s").astype(np.int64)
+        for year, month, *_ in TAI_UTC_TABLE
+    ],
+    dtype=np.float64,
+)
+_OFFSETS = np.array([row[2] for row in TAI_UTC_TABLE])
+_REF_MJDS = np.array([row[3] for row in TAI_UTC_TABLE])
+_DRIFTS = np.array([row[4] for row in TAI_UTC_TABLE])
+
+# the TAI-UTC offset applying at the start of each table entry expressed
+# as a constant plus a term linear in unix UTC seconds
+_CONSTANTS = _OFFSETS + (MJD_UNIX_EPOCH - _REF_MJDS) * _DRIFTS
+_RATES = _DRIFTS / SECS_PER_DAY
+_TAI_STARTS = _UTC_STARTS + _CONSTANTS + _RATES * _UTC_STARTS
+# the end of each table entry in UTC, the start of the next
+_UTC_ENDS = np.append(_UTC_STARTS[1:], np.inf)
+
+
+def tai_minus_utc(unix: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """Return the offset TAI-UTC in seconds applying at the UTC time(s)
+    ``unix``. Dates before 1960 have an offset of zero."""
+    unix = np.asarray(unix, dtype=np.float64)
+    idx = np.searchsorted(_UTC_STARTS, unix, side="right") - 1
+    offset = np.where(idx >= 0, _CONSTANTS[idx] + _RATES[idx] * unix, 0.0)
+    return offset if offset.ndim else float(offset)
+
+
+def utc_to_tai(unix: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """Convert UTC unix seconds to TAI seconds in the same convention."""
+    return unix + tai_minus_utc(unix)
+
+
+def tai_to_utc(tai: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """Convert TAI seconds since 1970-01-01 00:00:00 TAI to UTC unix
+    seconds. This is the inverse of :func:`utc_to_tai`. Times within a
+    leap second, which unix time can not represent, are mapped to the
+    end of the preceding second so that the result increases
+    monotonically with ``tai``."""
+    tai = np.asarray(tai, dtype=np.float64)
+    idx = np.searchsorted(_TAI_STARTS, tai, side="right") - 1
+    valid = idx >= 0
+    unix = np.where(valid, (tai - _CONSTANTS[idx]) / (1 + _RATES[idx]), tai)
+    np.minimum(unix, np.where(valid, _UTC_ENDS[idx], _UTC_STARTS[0]), out=unix)
+    return unix if unix.ndim else float(unix)
+
+
+def epoch_seconds_to_unix(
+    seconds: Union[float, np.ndarray], timebase: float
+) -> Union[float, np.ndarray]:
+    """Convert ``seconds`` of TAI elapsed since the UTC unix time
+    ``timebase``, as stored in the time column of a MAGDA flat file, into
+    UTC unix seconds."""
+    return tai_to_utc(utc_to_tai(timebase) + np.asarray(seconds, dtype=np.float64))
+
+
+def unix_to_datetime64(unix: Union[float, np.ndarray]) -> np.ndarray:
+    """Convert UTC unix seconds into numpy ``datetime64[ns]`` values."""
+    ns = np.round(np.asarray(unix, dtype=np.float64) * 1e9).astype(np.int64)
+    return ns.astype("datetime64[ns]")
+
+
+def is_astropy_time(value: Any) -> bool:
+    """Return True if ``value`` is an astropy ``Time``. astropy is not
+    imported, if it has not been then ``value`` can not be a ``Time``."""
+    time_module = sys.modules.get("astropy.time")
+    return time_module is not None and isinstance(value, time_module.Time)
+
+
+def as_unix(value: Any) -> float:
+    """Return the UTC unix time for ``value`` which may be a number of
+    unix seconds, a ``datetime`` (naive values are taken to be UTC, as
+    returned by ``DataFile.parse_header``), a ``numpy.datetime64`` or an
+    astropy ``Time``."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, np.datetime64):
+        return float(value.astype("datetime64[ns]").astype(np.int64)) / 1e9
+    if hasattr(value, "unix"):
+        return float(value.unix)
+    return float(value)
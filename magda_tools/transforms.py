@@ -0,0 +1,354 @@
+"""Vectorized transformation of positions and vectors between the Saturn
+centred coordinate systems used by MAGDA data files.
+
+Cartesian frames
+----------------
+KG
+  Kronographic, fixed to Saturn and rotating with it (IAU_SATURN)
+KSO
+  Kronocentric Solar Orbital, X towards the Sun and Z along the normal
+  to Saturn's orbital plane
+KSM
+  Kronocentric Solar Magnetospheric, X towards the Sun and Z such that
+  the spin axis lies in the X-Z plane
+J2000
+  the inertial Earth mean equator and equinox of J2000
+
+KRTP is the spherical (r, theta, phi) system of KG. Vectors in KRTP are
+components along the local spherical unit vectors and so require the
+KG position at which they were measured.
+
+Each transformation is a rotation whose slowly varying part (the pole
+of Saturn and direction of the Sun) is computed once per time bin,
+``bin_size`` seconds long, and combined with Saturn's rotation about its
+spin axis evaluated at every sample. The pole and rotation of Saturn
+follow the IAU 2009 recommendations. The Sun direction uses the
+approximate Keplerian elements of Standish (valid 1800-2050), accurate
+to a few hundredths of a degree over the Cassini mission.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .time_conversion import SECS_PER_DAY, utc_to_tai
+
+FRAMES = ("KG", "KSO", "KSM", "KRTP", "J2000")
+
+CARTESIAN_FRAMES = ("KG", "KSO", "KSM", "J2000")
+
+# default length in seconds of the time bins over which the slowly varying
+# part of each rotation is taken to be constant
+TRANSFORM_BIN_SIZE: float = 3600.0
+
+# number of samples rotated at a time, limiting the size of the stack of
+# rotation matrices held in memory
+TRANSFORM_BLOCK_SIZE: int = 65536
+
+# TT - TAI in seconds, TDB is taken to equal TT
+TT_MINUS_TAI: float = 32.184
+
+# J2000.0 (2000-01-01 12:00:00 TT) in TT seconds since 1970-01-01
+J2000_TT: float = 946728000.0
+
+DAYS_PER_CENTURY: float = 36525.0
+
+# mean obliquity of the ecliptic at J2000 in degrees
+OBLIQUITY: float = 23.43928
+
+# IAU 2009 Saturn pole right ascension and declination (degrees, and
+# degrees per Julian century) and prime meridian (degrees, and degrees
+# per day)
+SATURN_POLE_RA = (40.589, -0.036)
+SATURN_POLE_DEC = (83.537, -0.004)
+SATURN_W = (38.90, 810.7939024)
+
+# Keplerian elements of Saturn relative to the mean ecliptic and equinox
+# of J2000 and their rates per Julian century: semi-major axis (au),
+# eccentricity, inclination, mean longitude, longitude of perihelion and
+# longitude of the ascending node (degrees)
+SATURN_ELEMENTS = dict(
+    a=(9.53667594, -0.00125060),
+    e=(0.05386179, -0.00050991),
+    I=(2.48599187, 0.00193609),
+    L=(49.95424423, 1222.49362201),
+    perihelion=(92.59887831, -0.41897216),
+    node=(113.66242448, -0.28867794),
+)
+
+
+def _check_frame(frame: str) -> str:
+    frame = frame.upper()
+    if frame not in FRAMES:
+        raise ValueError(f"Unsupported frame {frame}, must be one of {FRAMES}")
+    return frame
+
+
+def days_since_j2000(unix_time: np.ndarray) -> np.ndarray:
+    """Return the TDB days since J2000.0 of the UTC unix times."""
+    tt = np.asarray(utc_to_tai(np.asarray(unix_time, dtype=np.float64))) + TT_MINUS_TAI
+    return (tt - J2000_TT) / SECS_PER_DAY
+
+
+def _rotation_x(angle: np.ndarray) -> np.ndarray:
+    """Stack of matrices rotating the frame (not the vector) by ``angle``
+    radians about X."""
+    c, s = np.cos(angle), np.sin(angle)
+    zero, one = np.zeros_like(angle), np.ones_like(angle)
+    return np.stack(
+        [
+            np.stack([one, zero, zero], -1),
+            np.stack([zero, c, s], -1),
+            np.stack([zero, -s, c], -1),
+        ],
+        -2,
+    )
+
+
+def _rotation_z(angle: np.ndarray) -> np.ndarray:
+    """Stack of matrices rotating the frame by ``angle`` radians about Z."""
+    c, s = np.cos(angle), np.sin(angle)
+    zero, one = np.zeros_like(angle), np.ones_like(angle)
+    return np.stack(
+        [
+            np.stack([c, s, zero], -1),
+            np.stack([-s, c, zero], -1),
+            np.stack([zero, zero, one], -1),
+        ],
+        -2,
+    )
+
+
+def _ecliptic_to_equatorial(v: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,...j->...i", _rotation_x(np.radians(-OBLIQUITY)), v)
+
+
+def saturn_pole(days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the right ascension and declination of Saturn's north pole
+    in radians at ``days`` since J2000."""
+    centuries = np.asarray(days) / DAYS_PER_CENTURY
+    ra = SATURN_POLE_RA[0] + SATURN_POLE_RA[1] * centuries
+    dec = SATURN_POLE_DEC[0] + SATURN_POLE_DEC[1] * centuries
+    return np.radians(ra), np.radians(dec)
+
+
+def saturn_rotation(days: np.ndarray) -> np.ndarray:
+    """Return the angle of Saturn's prime meridian (System III) in radians
+    at ``days`` since J2000."""
+    degrees = SATURN_W[0] + SATURN_W[1] * np.asarray(days, dtype=np.float64)
+    return np.radians(degrees % 360.0)
+
+
+def saturn_orbit(days: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the heliocentric position of Saturn in au and the unit normal
+    to its orbital plane, as arrays of shape (..., 3) in J2000 equatorial
+    coordinates, at ``days`` since J2000."""
+    centuries = np.asarray(days, dtype=np.float64) / DAYS_PER_CENTURY
+    elements = {k: v[0] + v[1] * centuries for k, v in SATURN_ELEMENTS.items()}
+    e = elements["e"]
+    inclination = np.radians(elements["I"])
+    node = np.radians(elements["node"])
+    argument = np.radians(elements["perihelion"]) - node
+    mean_anomaly = np.radians(elements["L"] - elements["perihelion"])
+
+    anomaly = mean_anomaly + e * np.sin(mean_anomaly)
+    for _ in range(5):
+        anomaly -= (anomaly - e * np.sin(anomaly) - mean_anomaly) / (
+            1 - e * np.cos(anomaly)
+        )
+    orbital = np.stack(
+        [
+            elements["a"] * (np.cos(anomaly) - e),
+            elements["a"] * np.sqrt(1 - e * e) * np.sin(anomaly),
+            np.zeros_like(anomaly),
+        ],
+        -1,
+    )
+    # rotate from the orbital plane into the ecliptic, the frame (rather
+    # than vector) rotations are applied in reverse
+    to_ecliptic = np.swapaxes(
+        _rotation_z(argument) @ _rotation_x(inclination) @ _rotation_z(node), -1, -2
+    )
+    position = np.einsum("...ij,...j->...i", to_ecliptic, orbital)
+    normal = to_ecliptic[..., :, 2]
+    return _ecliptic_to_equatorial(position), _ecliptic_to_equatorial(normal)
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def _slow_matrices(frame: str, days: np.ndarray) -> np.ndarray:
+    """Return matrices of shape (len(days), 3, 3) rotating from J2000 to
+    ``frame``, excluding Saturn's rotation in the case of KG."""
+    if frame == "J2000":
+        return np.broadcast_to(np.eye(3), (len(days), 3, 3))
+    if frame == "KG":
+        ra, dec = saturn_pole(days)
+        return _rotation_x(np.pi / 2 - dec) @ _rotation_z(np.pi / 2 + ra)
+
+    position, normal = saturn_orbit(days)
+    x = -_unit(position)
+    if frame == "KSM":
+        ra, dec = saturn_pole(days)
+        pole = np.stack(
+            [np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], -1
+        )
+        y = _unit(np.cross(pole, x))
+        z = np.cross(x, y)
+    else:
+        z = _unit(normal - np.sum(normal * x, -1, keepdims=True) * x)
+        y = np.cross(z, x)
+    return np.stack([x, y, z], -2)
+
+
+def rotation_matrices(
+    unix_time: np.ndarray,
+    from_frame: str,
+    to_frame: str,
+    bin_size: float = TRANSFORM_BIN_SIZE,
+) -> np.ndarray:
+    """Return the matrices of shape (n, 3, 3) rotating vectors from the
+    Cartesian ``from_frame`` to ``to_frame`` at each of the UTC unix
+    times ``unix_time``. The rotations between frames that do not rotate
+    with Saturn are computed once per time bin of ``bin_size`` seconds.
+    """
+    from_frame, to_frame = _check_frame(from_frame), _check_frame(to_frame)
+    for frame in (from_frame, to_frame):
+        if frame not in CARTESIAN_FRAMES:
+            raise ValueError(f"Rotation matrices are not defined for {frame}")
+    unix_time = np.atleast_1d(np.asarray(unix_time, dtype=np.float64))
+
+    if from_frame == to_frame:
+        return np.broadcast_to(np.eye(3), (len(unix_time), 3, 3)).copy()
+
+    bins, inverse = np.unique(np.floor(unix_time / bin_size), return_inverse=True)
+    bin_days = days_since_j2000((bins + 0.5) * bin_size)
+    slow = _slow_matrices(to_frame, bin_days) @ np.swapaxes(
+        _slow_matrices(from_frame, bin_days), -1, -2
+    )
+    matrices = slow[inverse]
+    if "KG" in (from_frame, to_frame):
+        spin = _rotation_z(saturn_rotation(days_since_j2000(unix_time)))
+        if to_frame == "KG":
+            matrices = spin @ matrices
+        else:
+            matrices = matrices @ np.swapaxes(spin, -1, -2)
+    return matrices
+
+
+def _spherical_basis(position_kg: np.ndarray) -> np.ndarray:
+    """Return matrices of shape (n, 3, 3) whose rows are the unit vectors
+    r, theta and phi in KG at each of the KG ``position_kg``."""
+    x, y, z = np.moveaxis(np.asarray(position_kg, dtype=np.float64), -1, 0)
+    rho = np.hypot(x, y)
+    r = np.hypot(rho, z)
+    sin_theta, cos_theta = rho / r, z / r
+    # on the spin axis phi is taken to be zero
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos_phi = np.where(rho > 0, x / rho, 1.0)
+        sin_phi = np.where(rho > 0, y / rho, 0.0)
+    return np.stack(
+        [
+            np.stack([sin_theta * cos_phi, sin_theta * sin_phi, cos_theta], -1),
+            np.stack([cos_theta * cos_phi, cos_theta * sin_phi, -sin_theta], -1),
+            np.stack([-sin_phi, cos_phi, np.zeros_like(x)], -1),
+        ],
+        -2,
+    )
+
+
+def _apply(matrices: np.ndarray, vectors: np.ndarray, out: np.ndarray) -> None:
+    np.einsum("nij,nj->ni", matrices, vectors, out=out)
+
+
+def transform_vectors(
+    vectors: np.ndarray,
+    unix_time: np.ndarray,
+    from_frame: str,
+    to_frame: str,
+    position_kg: Optional[np.ndarray] = None,
+    bin_size: float = TRANSFORM_BIN_SIZE,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Rotate ``vectors``, an array of shape (n, 3) such as magnetic field
+    measurements, from ``from_frame`` to ``to_frame`` at the UTC unix
+    times ``unix_time``.
+
+    Transforming to or from KRTP requires ``position_kg``, the (n, 3) KG
+    positions defining the local spherical unit vectors. The result is
+    written to ``out`` if provided. Samples are processed in blocks so
+    only a limited stack of rotation matrices is held at once.
+    """
+    from_frame, to_frame = _check_frame(from_frame), _check_frame(to_frame)
+    vectors = np.asarray(vectors)
+    unix_time = np.asarray(unix_time, dtype=np.float64)
+    if vectors.shape != (len(unix_time), 3):
+        raise ValueError("Vectors must have shape (n, 3) matching the times")
+    if "KRTP" in (from_frame, to_frame) and position_kg is None:
+        raise ValueError("KG positions are required to transform KRTP vectors")
+    if out is None:
+        out = np.empty(vectors.shape)
+
+    cartesian_from = "KG" if from_frame == "KRTP" else from_frame
+    cartesian_to = "KG" if to_frame == "KRTP" else to_frame
+    for start in range(0, len(unix_time), TRANSFORM_BLOCK_SIZE):
+        block = slice(start, start + TRANSFORM_BLOCK_SIZE)
+        matrices = rotation_matrices(
+            unix_time[block], cartesian_from, cartesian_to, bin_size
+        )
+        if from_frame == "KRTP":
+            basis = _spherical_basis(position_kg[block])  # type: ignore
+            matrices = matrices @ np.swapaxes(basis, -1, -2)
+        if to_frame == "KRTP":
+            basis = _spherical_basis(position_kg[block])  # type: ignore
+            matrices = basis @ matrices
+        _apply(matrices, vectors[block], out[block])
+    return out
+
+
+def cartesian_to_spherical(position: np.ndarray) -> np.ndarray:
+    """Convert Cartesian positions of shape (n, 3) into (r, theta, phi)
+    with the co-latitude theta and east longitude phi in radians."""
+    x, y, z = np.moveaxis(np.asarray(position, dtype=np.float64), -1, 0)
+    r = np.sqrt(x * x + y * y + z * z)
+    return np.stack(
+        [r, np.arctan2(np.hypot(x, y), z), np.arctan2(y, x) % (2 * np.pi)], -1
+    )
+
+
+def spherical_to_cartesian(position: np.ndarray) -> np.ndarray:
+    """Convert (r, theta, phi) positions of shape (n, 3) into Cartesian
+    positions, the inverse of :func:`cartesian_to_spherical`."""
+    r, theta, phi = np.moveaxis(np.asarray(position, dtype=np.float64), -1, 0)
+    return np.stack(
+        [
+            r * np.sin(theta) * np.cos(phi),
+            r * np.sin(theta) * np.sin(phi),
+            r * np.cos(theta),
+        ],
+        -1,
+    )
+
+
+def transform_positions(
+    positions: np.ndarray,
+    unix_time: np.ndarray,
+    from_frame: str,
+    to_frame: str,
+    bin_size: float = TRANSFORM_BIN_SIZE,
+) -> np.ndarray:
+    """Transform Saturn centred ``positions`` of shape (n, 3) from
+    ``from_frame`` to ``to_frame`` at the UTC unix times ``unix_time``.
+    Positions in KRTP are (r, theta, phi) in the units of the Cartesian
+    positions and radians."""
+    from_frame, to_frame = _check_frame(from_frame), _check_frame(to_frame)
+    if from_frame == "KRTP":
+        positions, from_frame = spherical_to_cartesian(positions), "KG"
+    cartesian_to = "KG" if to_frame == "KRTP" else to_frame
+    result = transform_vectors(
+        positions, unix_time, from_frame, cartesian_to, bin_size=bin_size
+    )
+    if to_frame == "KRTP":
+        return cartesian_to_spherical(result)
+    return result
@@ -0,0 +1,348 @@
+"""Writing of MAGDA flat files.
+
+:class:`FlatFileWriter` streams rows to a data file (``.ffd``) in the
+big-endian record layout read by :class:`DataFile`, a chunk at a time
+through a preallocated record buffer, and keeps the header file
+(``.ffh``) consistent with what has been written. Existing flat files
+can be appended to without reading their data back.
+
+The coordinate system, sensor and so on of a flat file are taken from
+its name when read, so files to be read with :class:`DataFile` should
+follow the MAGDA naming convention, e.g. ``17051_mrdcd_sdfgmc_krtp_1m``.
+"""
+
+from datetime import datetime, timezone
+import os
+import textwrap
+from typing import TYPE_CHECKING, Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from .data_file import (
+    DATA_TYPES,
+    EPOCHS,
+    HEADER_LINE_LENGTH,
+    MONTHS,
+    Column,
+    DataFile,
+    column_mapping,
+)
+from .instrumentation import stage
+from .time_conversion import epoch_seconds_to_unix, utc_to_tai
+
+if TYPE_CHECKING:
+    from numpy.typing import ArrayLike
+
+# the header type code of each record type, the inverse of DATA_TYPES
+TYPE_CODES = {type_: code for code, type_ in DATA_TYPES.items()}
+
+MISSING_DATA_FLAG = 1.0e34
+
+MONTH_NAMES = {number: name for name, number in MONTHS.items()}
+
+COLUMN_TABLE_HEADING = "  # NAME      UNITS     SOURCE                    TYPE  LOC"
+
+
+def format_header_time(unix: float, milliseconds: bool = True) -> str:
+    """Format the UTC unix time ``unix`` as in a header file, e.g.
+    ``2017 051 FEB 20 00:00:30.000``."""
+    value = datetime.fromtimestamp(round(unix, 3), timezone.utc)
+    text = f"{value:%Y %j} {MONTH_NAMES[value.month]} {value.day:2d} {value:%H:%M:%S}"
+    if milliseconds:
+        text += f".{value.microsecond // 1000:03d}"
+    return text
+
+
+def _header_line(text: str) -> str:
+    return text.ljust(HEADER_LINE_LENGTH)[:HEADER_LINE_LENGTH]
+
+
+def _column_line(column: Column, loc: int) -> str:
+    return _header_line(
+        f"{column.index + 1:03d} {column.name:<10}{column.units:<10}"
+        f"{column.source:<26}{TYPE_CODES[column.type_]}{loc:>8d}"
+    )
+
+
+def _epoch_name(timebase: float) -> str:
+    """Return the name of the epoch with UTC unix time ``timebase``."""
+    for name, unix in EPOCHS.items():
+        if unix == timebase:
+            return name
+    raise ValueError(f"No epoch with timebase {timebase}")
+
+
+def _encode_sensor_status(status: np.ndarray) -> np.ndarray:
+    """Return raw sensor status values that decode to ``status``, see
+    :meth:`DataFile.decode_sensor_status`."""
+    return np.left_shift(np.asarray(status, dtype=np.int64), 30).astype(np.int32)
+
+
+class FlatFileWriter(object):
+    """Writer of a MAGDA flat file, for use as a context manager::
+
+        with FlatFileWriter(path, columns) as writer:
+            for unix_time, values in chunks:
+                writer.write(values, unix_time=unix_time)
+
+    Rows are written to the data file as they are given and the header
+    is rewritten with the number of rows and time range on
+    :meth:`flush` and :meth:`close`. Should writing be interrupted the
+    header describes the rows written as of the last flush, so the data
+    file may only hold more rows than the header indicates (see
+    :class:`RowCountWarning`).
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        columns: Optional[Sequence[Column]] = None,
+        header_path: Optional[str] = None,
+        append: bool = False,
+        epoch: str = "J2000",
+        abstract: Sequence[str] = (),
+        chunk_size: int = 100000,
+    ) -> None:
+        """Arguments
+        ---------
+        file_path: path
+          the data file to write
+        columns: sequence of Column
+          the columns of the file, the first holding the time as TAI
+          seconds since the ``epoch`` (type "d"). Others are of type "f"
+          (R) or "i" (I). Their indices are assigned in order. May be
+          omitted when appending to an existing file.
+        header_path: path, optional
+          the header file to write, by default the data file with the
+          extension .ffh
+        append: bool
+          if True and the file exists the rows written are appended to it,
+          otherwise any existing file is replaced
+        epoch: str
+          the timebase of the time column (J2000, Y1958 or Y1966), for new
+          files
+        abstract: sequence of str
+          lines of free text describing the file, for new files
+        chunk_size: int
+          the number of rows packed into the record buffer at a time
+        """
+        self.file_path = file_path
+        self.header_path = (
+            header_path
+            if header_path is not None
+            else os.path.splitext(file_path)[0] + ".ffh"
+        )
+        self.chunk_size = chunk_size
+        self.first_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+
+        if append and os.path.exists(self.header_path):
+            self._open_existing(columns)
+        else:
+            if columns is None:
+                raise ValueError("The columns of a new flat file must be given")
+            if epoch not in EPOCHS:
+                raise ValueError(f"Unknown epoch {epoch}")
+            self._set_columns(columns)
+            self.timebase_unix = float(EPOCHS[epoch])
+            self.n_rows = 0
+            self._keep_first_time = False
+            self._lines = self._new_header(epoch, abstract)
+            append = False
+
+        self._time_offset = utc_to_tai(self.timebase_unix)
+        self._buffer = np.empty(chunk_size, self.dtype)
+        self._file = open(self.file_path, "ab" if append else "wb")
+        self._write_header()
+
+    def _set_columns(self, columns: Sequence[Column]) -> None:
+        self.columns = [
+            Column(i, c.name, c.source, c.units, c.type_) for i, c in enumerate(columns)
+        ]
+        for c in self.columns:
+            if c.type_ not in TYPE_CODES:
+                raise ValueError(f"Column {c.name} has unknown type {c.type_}")
+        if self.columns[0].type_ != "d":
+            raise ValueError("The first column must hold the time (type 'd')")
+        self.dtype = np.dtype([(c.name, ">" + c.type_) for c in self.columns])
+        self._columns_by_name = column_mapping(
+            self.columns, {"TIME": self.columns[0].name}
+        )
+
+    def _open_existing(self, columns: Optional[Sequence[Column]]) -> None:
+        """Prepare to append to the existing flat file, reading only its
+        header and first and last records."""
+        metadata = DataFile._parse_header(self.header_path)
+        self._set_columns(metadata["columns"])
+        if columns is not None and [(c.name, c.type_) for c in columns] != [
+            (c.name, c.type_) for c in self.columns
+        ]:
+            raise ValueError(f"Columns differ from those of {self.file_path}")
+        self.timebase_unix = metadata["timebase_unix"]
+        with open(self.header_path) as f:
+            text = f.read()
+        self._lines = [
+            text[i : i + HEADER_LINE_LENGTH]
+            for i in range(0, len(text), HEADER_LINE_LENGTH)
+        ]
+
+        size = os.path.getsize(self.file_path) if os.path.exists(self.file_path) else 0
+        if size % self.dtype.itemsize:
+            raise ValueError(
+                f"{self.file_path} does not hold a whole number of records"
+            )
+        self.n_rows = size // self.dtype.itemsize
+        # the existing start time is kept, as the header times of files
+        # from the MAGDA pipeline need not match the time column exactly
+        self._keep_first_time = self.n_rows > 0
+        if self.n_rows:
+            records = np.memmap(self.file_path, self.dtype, mode="r")
+            time_name = self.columns[0].name
+            self.first_time = float(records[time_name][0])
+            self.last_time = float(records[time_name][-1])
+            del records
+
+    def _new_header(self, epoch: str, abstract: Sequence[str]) -> List[str]:
+        now = format_header_time(datetime.now(timezone.utc).timestamp(), False)
+        lines = [
+            f"DATA  = {os.path.splitext(os.path.basename(self.file_path))[0]}",
+            f"CDATE = {now}      UPDATE ={now}",
+            f"RECL  = {self.dtype.itemsize:>5d}",
+            f"NCOLS = {len(self.columns):>5d}",
+            f"NROWS = {0:>10d}",
+            "OPSYS = UNKNOWN",
+            f"EPOCH = {epoch}",
+            COLUMN_TABLE_HEADING,
+        ]
+        lines += [
+            _column_line(c, self.dtype.fields[c.name][1])  # type: ignore
+            for c in self.columns
+        ]
+        lines += [
+            "ABSTRACT",
+            "FIRST TIME         = ",
+            "LAST TIME          = ",
+            f"MISSING DATA FLAG  = {MISSING_DATA_FLAG: .6E}",
+        ]
+        for paragraph in abstract:
+            lines += textwrap.wrap(paragraph, HEADER_LINE_LENGTH) or [""]
+        lines.append("END")
+        return [_header_line(line) for line in lines]
+
+    def _set_header_item(self, prefix: str, text: str) -> None:
+        for i, line in enumerate(self._lines):
+            if line.startswith(prefix):
+                self._lines[i] = _header_line(text)
+                return
+
+    def _write_header(self) -> None:
+        """Rewrite the header with the current row count and time range.
+        The header is replaced atomically so it is never partially
+        written."""
+        self._set_header_item("NROWS", f"NROWS = {self.n_rows:>10d}")
+        # the time range of an empty file is given as the epoch
+        for prefix, seconds in (
+            ("FIRST TIME", self.first_time),
+            ("LAST TIME", self.last_time),
+        ):
+            if prefix == "FIRST TIME" and self._keep_first_time:
+                continue
+            unix = epoch_seconds_to_unix(
+                0.0 if seconds is None else seconds, self.timebase_unix
+            )
+            self._set_header_item(
+                prefix, f"{prefix:<19}= {format_header_time(float(unix))}"
+            )
+        for i, line in enumerate(self._lines):
+            if line.startswith("CDATE") and "UPDATE =" in line:
+                now = format_header_time(datetime.now(timezone.utc).timestamp(), False)
+                self._lines[i] = _header_line(
+                    line[: line.index("UPDATE =") + len("UPDATE =")] + now
+                )
+        temporary = self.header_path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write("".join(self._lines))
+        os.replace(temporary, self.header_path)
+
+    def __enter__(self) -> "FlatFileWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def write(
+        self,
+        values: Mapping[str, "ArrayLike"],
+        unix_time: Optional["ArrayLike"] = None,
+    ) -> None:
+        """Append rows to the file. ``values`` maps the name (or generic
+        alias, e.g. BX for BX_KSM) of every column to an array of its
+        values for the rows. The times are given either as UTC unix
+        seconds ``unix_time`` or in ``values`` as TAI seconds since the
+        epoch (under the name of the time column or "TIME"). Rows must be
+        in time order."""
+        time_name = self.columns[0].name
+        arrays: Dict[str, np.ndarray] = {}
+        for key, value in values.items():
+            try:
+                column = self._columns_by_name[key]
+            except KeyError:
+                raise ValueError(f"No column named {key} in {self.file_path}")
+            arrays[column.name] = np.asarray(value)
+        if unix_time is not None:
+            arrays[time_name] = np.asarray(
+                utc_to_tai(np.asarray(unix_time, dtype=np.float64)) - self._time_offset
+            )
+        missing = [c.name for c in self.columns if c.name not in arrays]
+        if missing:
+            raise ValueError(f"No values given for columns {', '.join(missing)}")
+        n_rows = len(arrays[time_name])
+        if any(len(a) != n_rows for a in arrays.values()):
+            raise ValueError("Values must be given for the same number of rows")
+        if n_rows == 0:
+            return
+
+        time = arrays[time_name]
+        if np.any(np.diff(time) < 0) or (
+            self.last_time is not None and time[0] < self.last_time
+        ):
+            raise ValueError("Rows must be written in time order")
+
+        with stage("write") as timer:
+            for offset in range(0, n_rows, len(self._buffer)):
+                rows = slice(offset, offset + len(self._buffer))
+                buffer = self._buffer[: len(time[rows])]
+                for name, array in arrays.items():
+                    buffer[name] = array[rows]
+                buffer.tofile(self._file)
+            timer.add(rows=n_rows)
+
+        if self.first_time is None:
+            self.first_time = float(time[0])
+        self.last_time = float(time[-1])
+        self.n_rows += n_rows
+
+    def write_datafile(self, df: DataFile) -> None:
+        """Append all rows of ``df``, which must have the same columns as
+        this file. Columns not yet loaded (e.g. of memory mapped files or
+        chunks from :meth:`DataFile.iter_chunks`) are copied as stored
+        without conversion. Decoded sensor status values are encoded
+        again, see :meth:`DataFile.decode_sensor_status`."""
+        values: Dict[str, np.ndarray] = {"TIME": df._tai_seconds}
+        for c in df.columns[1:]:
+            if c.loaded and c.name.endswith("Status") and df.coord == "C":
+                values[c.name] = _encode_sensor_status(c.data)
+            else:
+                values[c.name] = c.data if c.loaded else c.raw
+        self.write(values)
+
+    def flush(self) -> None:
+        """Flush the rows written to disk and update the header."""
+        self._file.flush()
+        self._write_header()
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
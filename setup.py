@@ -27,5 +27,7 @@ setup(
     python_requires=">=3.7",
     install_requires=requirements,
     tests_require=requirements_dev,
+    extras_require={"dask": ["dask[array]"]},
+    entry_points={"console_scripts": ["magda-tools=magda_tools.cli:main"]},
     project_urls={"Source": "https://github.com/ImperialCollegeLondon/magda_tools"},
 )
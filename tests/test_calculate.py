@@ -1,5 +1,8 @@
+from importlib.util import find_spec
 import os
-from unittest import TestCase
+from unittest import TestCase, skipIf
+
+import numpy as np
 
 import magda_tools
 
@@ -39,6 +42,32 @@ class TestCalculations(TestCase):
         for t, c in zip(target_values, calculated):
             self.assertAlmostEqual(t, c.sec, places=3)
 
+    def test_saturn_local_time_array(self):
+        """Test the numeric local time against the astropy based function."""
+        xyz = [self.df[f"{c}_KSM"].data for c in "XYZ"]
+        target = magda_tools.saturn_local_time(self.df["TIME"].data, *xyz).sec
+
+        seconds = magda_tools.saturn_local_time_array(self.df.unix_time, *xyz)
+        np.testing.assert_allclose(seconds, target, atol=1e-6)
+        hours = magda_tools.saturn_local_time_array(
+            self.df.datetime64, *xyz, units="hours"
+        )
+        np.testing.assert_allclose(hours, target / 3600, atol=1e-9)
+
+        # results can be written into an existing array
+        out = np.empty(self.df.n_rows)
+        again = magda_tools.saturn_local_time_array(self.df.unix_time, *xyz, out=out)
+        self.assertIs(again, out)
+
+        # interpolation of the seasonal term
+        interpolated = magda_tools.saturn_local_time_array(
+            self.df.unix_time, *xyz, lambda_step=86400.0
+        )
+        np.testing.assert_allclose(interpolated, target, atol=1e-2)
+
+        with self.assertRaises(ValueError):
+            magda_tools.saturn_local_time_array(self.df.unix_time, *xyz, units="days")
+
     def test_latitude(self):
         """Test conversion of time and positional coordinates into
         saturn local time."""
@@ -62,3 +91,41 @@ class TestCalculations(TestCase):
         )
         for t, c in zip(target_values, calculated):
             self.assertAlmostEqual(t, c, places=3)
+
+    def test_position_properties(self):
+        """Test that the fused calculation matches the separate functions."""
+        xyz = self.df["X_KSM"].data, self.df["Y_KSM"].data, self.df["Z_KSM"].data
+        result = magda_tools.position_properties(
+            *xyz, self.df.unix_time, radius=magda_tools.SATURN_RADIUS_KM
+        )
+        np.testing.assert_allclose(
+            result.distance,
+            magda_tools.distance(*xyz, radius=magda_tools.SATURN_RADIUS_KM),
+            rtol=1e-6,
+        )
+        latitude = magda_tools.latitude(*xyz)
+        np.testing.assert_allclose(result.latitude, latitude, atol=1e-4)
+        np.testing.assert_allclose(
+            result.colatitude, (90 - latitude) / 180 * np.pi, atol=1e-6
+        )
+        local_time = magda_tools.saturn_local_time(self.df["TIME"].data, *xyz)
+        np.testing.assert_allclose(result.local_time, local_time.sec, atol=1e-2)
+
+        # results can be written into existing arrays and times omitted
+        out = magda_tools.PositionProperties(
+            *(np.empty(self.df.n_rows) for _ in range(3)), None
+        )
+        again = magda_tools.position_properties(*xyz, out=out)
+        self.assertIs(again.distance, out.distance)
+        self.assertIsNone(again.local_time)
+        np.testing.assert_allclose(again.latitude, result.latitude)
+
+    @skipIf(find_spec("numba") is None, "numba is not installed")
+    def test_position_properties_numba(self):
+        xyz = self.df["X_KSM"].data, self.df["Y_KSM"].data, self.df["Z_KSM"].data
+        target = magda_tools.position_properties(*xyz, self.df.datetime64)
+        result = magda_tools.position_properties(
+            *xyz, self.df.datetime64, backend="numba"
+        )
+        for r, t in zip(result, target):
+            np.testing.assert_allclose(r, t, rtol=1e-10)
@@ -0,0 +1,68 @@
+from datetime import datetime
+import os
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from magda_tools import Catalog
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+
+
+class TestCatalog(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "casdata"
+        shutil.copytree(CASDATA, self.root)
+        self.catalog = Catalog(self.root)
+        self.catalog.update()
+
+    def tearDown(self):
+        self.catalog.close()
+        self.tmp.cleanup()
+
+    def test_scan(self):
+        self.assertEqual(len(self.catalog), 3)
+        entry = self.catalog.entries(coord="kg")[0]
+        self.assertEqual(entry.n_rows, 1426)
+        self.assertEqual(entry.sensor, "FGM")
+        self.assertEqual(entry.res, "1m")
+        self.assertEqual(entry.columns[1], "BX_KG")
+        self.assertEqual(
+            entry.data_path,
+            self.root / "y08/08100/processed/08100_mrdcd_hkfgmn_kg_1m.ffd",
+        )
+
+    def test_query(self):
+        """Test selection of files by time interval and file attributes"""
+        paths = self.catalog.query(
+            datetime(2017, 2, 20, 12), datetime(2017, 2, 20, 13), coord="KSM", res="1m"
+        )
+        self.assertEqual(
+            paths, [self.root / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"]
+        )
+
+        self.assertEqual(len(self.catalog.query(datetime(2017, 2, 20, 12))), 2)
+        self.assertEqual(len(self.catalog.query(end=datetime(2017, 2, 19))), 1)
+        self.assertEqual(
+            self.catalog.query(datetime(2017, 3, 1), datetime(2017, 3, 2)), []
+        )
+
+    def test_incremental_update(self):
+        """Test that only modified header files are parsed again and that
+        removed files are dropped from the index."""
+        self.assertEqual(self.catalog.update(), 0)
+
+        header = self.root / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffh"
+        stat = header.stat()
+        os.utime(header, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertEqual(self.catalog.update(), 1)
+
+        header.unlink()
+        self.assertEqual(self.catalog.update(), 0)
+        self.assertEqual(len(self.catalog), 2)
+
+        # the index persists between instances
+        with Catalog(self.root) as catalog:
+            self.assertEqual(len(catalog), 2)
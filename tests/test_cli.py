@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import os
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from magda_tools import DataFile, Resampled
+from magda_tools.catalog import CATALOG_FILENAME
+from magda_tools.cli import PROGRESS_FILENAME, main
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+
+
+class TestCLI(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.root = Path(self.tmp.name) / "casdata"
+        shutil.copytree(CASDATA, self.root)
+        self.pattern = str(self.root / "**" / "*.ffd")
+        self.output = Path(self.tmp.name) / "output"
+        self.cache = Path(self.tmp.name) / "cache"
+        environ = patch.dict(os.environ, XDG_CACHE_HOME=str(self.cache))
+        environ.start()
+        self.addCleanup(environ.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, *args):
+        out = io.StringIO()
+        status = main(list(args), out=out)
+        return status, out.getvalue()
+
+    def progress(self):
+        with open(self.output / PROGRESS_FILENAME) as f:
+            return [json.loads(line) for line in f]
+
+    def test_metadata(self):
+        path = Path(self.tmp.name) / "headers.csv"
+        status, _ = self.run_cli("metadata", self.pattern, "-o", str(path), "-j", "1")
+        self.assertEqual(status, 0)
+        with open(path) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 3)
+        self.assertTrue(all(row["path"].endswith(".ffh") for row in rows))
+        self.assertEqual(sorted(row["coord"] for row in rows), ["KG", "KRTP", "KSM"])
+
+    def test_catalog(self):
+        """Test selection of the inputs from a catalog"""
+        status, out = self.run_cli(
+            "metadata", "--catalog", str(self.root), "--coord", "KSM", "-j", "1"
+        )
+        self.assertEqual(status, 0)
+        rows = list(csv.DictReader(io.StringIO(out)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["coord"], "KSM")
+        # the index is kept out of the data tree
+        self.assertFalse((self.root / CATALOG_FILENAME).exists())
+        self.assertEqual(len(list(self.cache.glob("magda_tools/*.sqlite"))), 1)
+
+        index = Path(self.tmp.name) / "index.sqlite"
+        args = ["metadata", "--catalog", str(self.root), "--index", str(index)]
+        status, out = self.run_cli(*args, "-j", "1")
+        self.assertEqual(status, 0)
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(out)))), 3)
+        self.assertTrue(index.exists())
+
+    def test_convert(self):
+        status, _ = self.run_cli("convert", self.pattern, "-o", str(self.output))
+        self.assertEqual(status, 0)
+        for path in self.root.glob("**/*.ffd"):
+            cached = DataFile.from_cache(str(path), cache_dir=str(self.output))
+            # loaded from the cache rather than parsing the file
+            self.assertIsInstance(cached.unix_time, np.memmap)
+            np.testing.assert_array_equal(
+                cached.unix_time, DataFile(str(path)).unix_time
+            )
+
+    def test_model_residuals(self):
+        path = self.root / "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd"
+        status, _ = self.run_cli(
+            "model-residuals", str(path), "-o", str(self.output), "-j", "1"
+        )
+        self.assertEqual(status, 0)
+        df = DataFile(str(path))
+        with np.load(self.output / "17051_mrdcd_sdfgmc_krtp_1m.npz") as result:
+            np.testing.assert_allclose(
+                result["residual"] + result["predicted"], df.field_vector
+            )
+        (record,) = self.progress()
+        self.assertEqual(len(record["rms"]), 3)
+
+    def test_resume(self):
+        """Test that completed inputs are skipped unless modified, their
+        output is removed or the options change"""
+        args = ["resample", "--cadence", "1h", self.pattern, "-o", str(self.output)]
+        self.assertEqual(self.run_cli(*args, "-j", "2")[0], 0)
+        self.assertEqual(len(self.progress()), 3)
+        resampled, attributes = Resampled.load(
+            str(self.output / "17051_mrdcd_sdfgmc_ksm_1m.npz")
+        )
+        self.assertEqual(len(resampled), 25)
+        self.assertTrue(attributes["source"].endswith("ksm_1m.ffd"))
+
+        _, out = self.run_cli(*args, "-j", "1")
+        self.assertIn("3 of 3 files already processed", out)
+
+        os.remove(self.output / "17051_mrdcd_sdfgmc_ksm_1m.npz")
+        path = self.root / "y08/08100/processed/08100_mrdcd_hkfgmn_kg_1m.ffd"
+        os.utime(path, ns=(0, 0))
+        _, out = self.run_cli(*args, "-j", "1")
+        self.assertIn("1 of 3 files already processed", out)
+
+        args[2] = "10m"
+        _, out = self.run_cli(*args, "-j", "1")
+        self.assertIn("0 of 3 files already processed", out)
+        _, out = self.run_cli(*args, "-j", "1", "--restart")
+        self.assertIn("0 of 3 files already processed", out)
+        self.assertEqual(len(self.progress()), 3)
+
+    def test_failure(self):
+        """Test that failed inputs are reported and not marked complete"""
+        path = self.root / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"
+        os.remove(path.with_suffix(".ffh"))
+        status, _ = self.run_cli(
+            "model-residuals", self.pattern, "-o", str(self.output), "-j", "1"
+        )
+        self.assertEqual(status, 1)
+        self.assertEqual(len(self.progress()), 2)
+
+    def test_missing_data_file(self):
+        """Test that a catalogued header without its data file is reported
+        as a failure of that input alone, also when resuming"""
+        path = self.root / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"
+        args = ["resample", "--cadence", "1h", "--catalog", str(self.root)]
+        args += ["-o", str(self.output), "-j", "1"]
+        self.assertEqual(self.run_cli(*args)[0], 0)
+        os.remove(path)
+        status, out = self.run_cli(*args)
+        self.assertEqual(status, 1)
+        self.assertIn("2 of 3 files already processed", out)
+        self.assertEqual(len(self.progress()), 3)
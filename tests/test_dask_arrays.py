@@ -0,0 +1,89 @@
+from importlib.util import find_spec
+from pathlib import Path
+from unittest import TestCase, skipIf, skipUnless
+
+import numpy as np
+
+from magda_tools import (
+    BFieldModel,
+    DataFile,
+    SphericalHarmonicModel,
+    open_dask,
+    position_properties,
+)
+from magda_tools.dask_arrays import is_dask_array
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+KSM_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"
+KRTP_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd"
+
+HAS_DASK = find_spec("dask") is not None
+
+
+@skipIf(HAS_DASK, "dask is installed")
+class TestWithoutDask(TestCase):
+    def test_missing(self):
+        self.assertFalse(is_dask_array(np.zeros(3)))
+        with self.assertRaises(ImportError):
+            open_dask([KSM_FILE])
+
+
+@skipUnless(HAS_DASK, "dask is not installed")
+class TestDaskArrays(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = DataFile(KSM_FILE)
+
+    def test_open(self):
+        """Test that chunks follow the file and chunk size and the computed
+        columns match the data file."""
+        columns = open_dask([KSM_FILE, KSM_FILE], chunk_size=500)
+        n_rows = self.df.n_rows
+        self.assertEqual(columns["BX_KSM"].chunks, ((500, 500, 438) * 2,))
+        self.assertIs(columns["BX"], columns["BX_KSM"])
+        self.assertIs(columns["TIME_TAI"], columns["TIME"])
+
+        np.testing.assert_array_equal(
+            columns["BZ_KSM"][n_rows:].compute(), self.df["BZ_KSM"].data
+        )
+        np.testing.assert_array_equal(
+            columns["TIME"][:n_rows].compute(), self.df.unix_time
+        )
+        self.assertEqual(
+            set(self.df.to_dask(["X_KSM"])), {"TIME", "TIME_TAI", "X_KSM", "X"}
+        )
+        with self.assertRaises(ValueError):
+            open_dask([KSM_FILE, KRTP_FILE])
+        with self.assertRaises(ValueError):
+            open_dask([KSM_FILE], columns=["BX_KG"])
+
+    def test_lazy_calculations(self):
+        """Test that position properties and model fields of dask arrays are
+        lazy and match the results for numpy arrays."""
+        columns = open_dask([KRTP_FILE], chunk_size=400)
+        df = DataFile(KRTP_FILE)
+        x, y, z = (df[name].data for name in ("X_KG", "Y_KG", "Z_KG"))
+
+        lazy = position_properties(
+            columns["X"], columns["Y"], columns["Z"], columns["TIME"], radius=60268.0
+        )
+        expected = position_properties(x, y, z, df.unix_time, radius=60268.0)
+        for lazy_value, value in zip(lazy, expected):
+            self.assertTrue(is_dask_array(lazy_value))
+            np.testing.assert_allclose(lazy_value.compute(), value)
+
+        model = BFieldModel([21160.0, 1560.0, 2320.0])
+        b_r, b_theta = model.field(lazy.distance, lazy.colatitude)
+        self.assertTrue(is_dask_array(b_r))
+        for lazy_value, value in zip(
+            (b_r, b_theta), model.field(expected.distance, expected.colatitude)
+        ):
+            np.testing.assert_allclose(lazy_value.compute(), value)
+
+        harmonic = SphericalHarmonicModel.from_gn0s([21160.0, 1560.0, 2320.0])
+        phi = np.arctan2(y, x)
+        lazy_field = harmonic.field(lazy.distance, lazy.colatitude, phi)
+        for lazy_value, value in zip(
+            lazy_field, harmonic.field(expected.distance, expected.colatitude, phi)
+        ):
+            np.testing.assert_allclose(lazy_value.compute(), value)
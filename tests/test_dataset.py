@@ -0,0 +1,81 @@
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import DataFile, MagdaDataset, RowCountWarning
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+KSM_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"
+
+
+class TestMagdaDataset(TestCase):
+    @classmethod
+    def setUpClass(self):
+        self.df = DataFile(KSM_FILE)
+
+    def setUp(self):
+        # split the test file into two parts which share a boundary sample
+        self.tmp = TemporaryDirectory()
+        records = np.fromfile(KSM_FILE, self.df.dtype)
+        self.files = []
+        for name, rows in (("a", slice(0, 700)), ("b", slice(699, None))):
+            path = Path(self.tmp.name) / f"17051_mrdcd_sdfgmc_ksm_1m_{name}.ffd"
+            records[rows].tofile(path)
+            shutil.copy(KSM_FILE.with_suffix(".ffh"), path.with_suffix(".ffh"))
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self, dataset):
+        self.assertEqual(dataset.n_rows, self.df.n_rows)
+        self.assertEqual(dataset.files, [str(f) for f in self.files])
+        self.assertEqual(dataset.coord, "KSM")
+        self.assertTrue(np.array_equal(dataset.unix_time, self.df.unix_time))
+        for c in self.df.columns[1:]:
+            self.assertTrue(np.array_equal(dataset[c.name].data, c.data), c.name)
+            self.assertTrue(dataset[c.name].data.dtype.isnative)
+        self.assertEqual(
+            dataset["TIME"].data[-1].datetime, self.df["TIME"].data[-1].datetime
+        )
+
+    def test_open(self):
+        """Test that files are concatenated in time order with the duplicated
+        boundary sample removed and row count mismatches reported."""
+        with self.assertWarns(RowCountWarning) as caught:
+            dataset = MagdaDataset.open(reversed(self.files), workers=2)
+        self.assertEqual(caught.warning.expected, 1438)
+        self.check(dataset)
+
+    def test_open_processes(self):
+        with self.assertWarns(RowCountWarning):
+            dataset = MagdaDataset.open(self.files, workers=2, processes=True)
+        self.check(dataset)
+
+    def test_vector(self):
+        with self.assertWarns(RowCountWarning):
+            dataset = MagdaDataset.open(self.files)
+        field = dataset.field_vector
+        self.assertTrue(np.shares_memory(field, dataset["BX_KSM"].data))
+        self.assertTrue(np.array_equal(field, self.df.field_vector))
+        self.assertIs(dataset["X"], dataset["X_KSM"])
+
+    def test_resample(self):
+        with self.assertWarns(RowCountWarning):
+            dataset = MagdaDataset.open(self.files)
+        expected = self.df.resample("1h", statistics=("mean", "std"))
+        resampled = dataset.resample("1h", statistics=("mean", "std"))
+        self.assertEqual(resampled.columns, expected.columns)
+        np.testing.assert_array_equal(resampled.count, expected.count)
+        for statistic in ("mean", "std"):
+            np.testing.assert_array_equal(
+                resampled.values[statistic], expected.values[statistic]
+            )
+
+    def test_mismatched_columns(self):
+        krtp = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd"
+        with self.assertRaises(ValueError):
+            MagdaDataset.open([KSM_FILE, krtp])
@@ -0,0 +1,151 @@
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import Catalog, SATURN_RADIUS_KM
+from magda_tools.events import EventFinder, EventTable, find_events
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+
+START = 1.4e9
+
+
+def kepler_orbit(unix_time, semi_major, eccentricity, period):
+    """Return positions on an orbit inclined by 30 degrees to the x-y plane
+    with periapsis on the x axis at the first time."""
+    mean_anomaly = 2 * np.pi * (unix_time - unix_time[0]) / period
+    anomaly = mean_anomaly.copy()
+    for _ in range(50):
+        anomaly = mean_anomaly + eccentricity * np.sin(anomaly)
+    x = semi_major * (np.cos(anomaly) - eccentricity)
+    y = semi_major * np.sqrt(1 - eccentricity**2) * np.sin(anomaly)
+    inclination = np.radians(30)
+    return np.stack([x, y * np.cos(inclination), y * np.sin(inclination)], axis=1)
+
+
+class TestEvents(TestCase):
+    def setUp(self):
+        self.period = 10 * 86400.0
+        self.unix_time = START + np.arange(0, 4.2 * self.period, 60.0)
+        self.positions = kepler_orbit(
+            self.unix_time, 15 * SATURN_RADIUS_KM, 0.7, self.period
+        ).astype(np.float32)
+
+    def find(self, chunk_size, frame="KG", **kwargs):
+        finder = EventFinder(**kwargs)
+        for start in range(0, len(self.unix_time), chunk_size):
+            rows = slice(start, start + chunk_size)
+            finder.update(self.unix_time[rows], self.positions[rows], frame)
+        return finder.finish()
+
+    def test_apsides(self):
+        table = self.find(10000)
+        periapses = table.kind("periapsis")
+        np.testing.assert_allclose(
+            (periapses["time"] - START) / self.period, [1, 2, 3, 4], atol=1e-5
+        )
+        np.testing.assert_allclose(periapses["value"], 4.5, rtol=1e-6)
+        apoapses = table.kind("apoapsis")
+        np.testing.assert_allclose(
+            (apoapses["time"] - START) / self.period, [0.5, 1.5, 2.5, 3.5], atol=1e-3
+        )
+        np.testing.assert_allclose(apoapses["value"], 25.5, rtol=1e-6)
+
+        # orbits run from apoapsis to apoapsis
+        orbits = table.orbits()
+        np.testing.assert_array_equal(orbits["orbit"], [0, 1, 2, 3, 4])
+        self.assertEqual(orbits["start"][0], self.unix_time[0])
+        self.assertEqual(orbits["end"][-1], self.unix_time[-1])
+        np.testing.assert_array_equal(orbits["start"][1:], apoapses["time"])
+        self.assertTrue(np.isnan(orbits["periapsis"][0]))
+        np.testing.assert_array_equal(orbits["periapsis"][1:], periapses["time"])
+        np.testing.assert_array_equal(table.kind("periapsis")["orbit"], [1, 2, 3, 4])
+        self.assertEqual(table.orbit_range(2), tuple(orbits[2][["start", "end"]]))
+        with self.assertRaises(ValueError):
+            table.orbit_range(5)
+
+    def test_equator(self):
+        table = self.find(10000)
+        # the orbit crosses the equator at periapsis and apoapsis
+        np.testing.assert_allclose(
+            (table.kind("ascending")["time"] - START) / self.period,
+            [1, 2, 3, 4],
+            atol=1e-6,
+        )
+        np.testing.assert_allclose(
+            (table.kind("descending")["time"] - START) / self.period,
+            [0.5, 1.5, 2.5, 3.5],
+            atol=1e-6,
+        )
+
+    def test_chunks(self):
+        """Test that events do not depend on how the trajectory is chunked,
+        including chunks with duplicated samples"""
+        self.unix_time = self.unix_time[::30]
+        self.positions = self.positions[::30]
+        whole = self.find(len(self.unix_time))
+        for chunk_size in (2, 7, 500):
+            chunked = self.find(chunk_size)
+            np.testing.assert_array_equal(chunked.events["kind"], whole.events["kind"])
+            np.testing.assert_allclose(chunked.events["time"], whole.events["time"])
+
+        finder = EventFinder()
+        finder.update(self.unix_time[:1000], self.positions[:1000], "KG")
+        finder.update(self.unix_time[900:], self.positions[900:], "KG")
+        overlapped = finder.finish()
+        np.testing.assert_allclose(overlapped.events["time"], whole.events["time"])
+
+    def test_local_time(self):
+        # an equatorial circular orbit in KSM sweeps through all local
+        # times at a constant rate, starting at noon
+        phase = 2 * np.pi * (self.unix_time - START) / self.period
+        self.positions = np.stack(
+            [np.cos(phase), np.sin(phase), np.zeros_like(phase)], axis=1
+        ) * (10 * SATURN_RADIUS_KM)
+        table = self.find(10000, frame="KSM", sector_hours=3.0)
+        sectors = table.kind("slt")
+        self.assertEqual(len(sectors), 4 * 8 + 1)
+        np.testing.assert_array_equal(
+            sectors["value"][:9], [15, 18, 21, 0, 3, 6, 9, 12, 15]
+        )
+        # the seasonal term distorts local time away from the axes
+        np.testing.assert_allclose(
+            (sectors["time"][:8] - START) / self.period,
+            (np.arange(8) + 1) / 8,
+            atol=1e-2,
+        )
+        np.testing.assert_allclose(
+            (sectors["time"][1:8:2] - START) / self.period, [0.25, 0.5, 0.75, 1]
+        )
+
+    def test_save(self):
+        table = self.find(10000, first_orbit=10)
+        self.assertEqual(table.orbits()["orbit"][0], 10)
+        with TemporaryDirectory() as directory:
+            path = Path(directory) / "events.npz"
+            table.save(path, source="test")
+            loaded, attributes = EventTable.load(path)
+        self.assertEqual(attributes, {"source": "test"})
+        np.testing.assert_array_equal(loaded.events, table.events)
+        self.assertEqual(loaded.start, table.start)
+        self.assertEqual(loaded.end, table.end)
+        self.assertEqual(loaded.first_orbit, 10)
+
+    def test_catalog(self):
+        with TemporaryDirectory() as directory:
+            root = Path(directory) / "casdata"
+            shutil.copytree(CASDATA, root)
+            with Catalog(root) as catalog:
+                catalog.update()
+                paths = catalog.query(coord="KSM")
+                table = find_events(paths, chunk_size=100)
+                # the test data covers a single day without apsides
+                self.assertEqual(len(table.orbits()), 1)
+                self.assertTrue(len(table.kind("slt")))
+                self.assertEqual(table.orbit_files(catalog, 0, coord="KSM"), paths)
+                (df,) = table.read_orbit(catalog, 0, coord="KSM")
+                self.assertEqual(df.unix_time[0], table.start)
+                self.assertEqual(df.unix_time[-1], table.end)
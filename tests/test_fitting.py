@@ -0,0 +1,87 @@
+import os
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import BFieldModel, DataFile
+from magda_tools.fitting import AxisymmetricBasis, fit_datafile
+
+CASDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/casdata")
+KRTP_FILE = os.path.join(CASDATA, "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd")
+
+
+class TestFitting(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.r = rng.uniform(2.0, 20.0, 3000)
+        self.theta = rng.uniform(0.1, 3.0, 3000)
+        self.gn0s = [21160.0, 1560.0, 2320.0]
+        self.b_r, self.b_theta = BFieldModel(self.gn0s).field(self.r, self.theta)
+
+    def test_basis(self):
+        basis = AxisymmetricBasis(self.r, self.theta, 3)
+        b_r, b_theta = basis.predict(self.gn0s)
+        np.testing.assert_allclose(b_r, self.b_r)
+        np.testing.assert_allclose(b_theta, self.b_theta)
+
+    def test_fit(self):
+        basis = AxisymmetricBasis(self.r, self.theta, 3)
+        result = basis.fit(self.b_r, self.b_theta)
+        self.assertEqual(len(result), 1)
+        np.testing.assert_allclose(result.gn0s[0], self.gn0s)
+        self.assertLess(result.rms[0], 1e-6)
+        self.assertEqual(result.n_samples[0], 3000)
+        self.assertEqual(result.models()[0].gn0s, list(result.gn0s[0]))
+
+    def test_fit_weights(self):
+        # corrupted samples with zero weight and non-finite samples do not
+        # affect the fit
+        b_r = self.b_r.copy()
+        b_r[:100] += 1000.0
+        b_r[100:110] = np.nan
+        weights = np.ones(len(b_r))
+        weights[:100] = 0.0
+        basis = AxisymmetricBasis(self.r, self.theta, 3)
+        result = basis.fit(b_r, self.b_theta, weights)
+        np.testing.assert_allclose(result.gn0s[0], self.gn0s)
+        # nor the number of samples and residual
+        self.assertEqual(result.n_samples[0], 2900)
+        self.assertLess(result.rms[0], 1e-6)
+
+        # per component weights
+        weights = np.ones((len(b_r), 2))
+        weights[:110, 0] = 0.0
+        result = basis.fit(b_r, self.b_theta, weights)
+        np.testing.assert_allclose(result.gn0s[0], self.gn0s)
+
+    def test_fit_segments(self):
+        segments = np.arange(3000) // 1000
+        other = [20000.0, 0.0, 1000.0]
+        b_r, b_theta = BFieldModel(other).field(self.r, self.theta)
+        b_r = np.where(segments == 1, b_r, self.b_r)
+        b_theta = np.where(segments == 1, b_theta, self.b_theta)
+        basis = AxisymmetricBasis(self.r, self.theta, 3)
+        result = basis.fit(b_r, b_theta, segments=segments)
+        np.testing.assert_array_equal(result.labels, [0, 1, 2])
+        np.testing.assert_array_equal(result.n_samples, [1000, 1000, 1000])
+        np.testing.assert_allclose(
+            result.gn0s, [self.gn0s, other, self.gn0s], atol=1e-6
+        )
+
+    def test_fit_segment_lengths(self):
+        """Test segments of very different lengths, including one with fewer
+        samples than coefficients"""
+        segments = np.repeat([0, 1, 2, 3], [1, 9, 90, 2900])
+        basis = AxisymmetricBasis(self.r, self.theta, 3)
+        result = basis.fit(self.b_r, self.b_theta, segments=segments)
+        np.testing.assert_array_equal(result.n_samples, [1, 9, 90, 2900])
+        np.testing.assert_allclose(result.gn0s[1:], [self.gn0s] * 3)
+        # the two components of the single sample are fitted exactly
+        self.assertLess(result.rms[0], 1e-6)
+
+    def test_fit_datafile(self):
+        df = DataFile(KRTP_FILE)
+        result = fit_datafile(df, 1)
+        # the field measured near Saturn is dominated by the dipole
+        self.assertGreater(result.gn0s[0, 0], 15000.0)
+        self.assertLess(result.gn0s[0, 0], 25000.0)
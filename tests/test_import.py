@@ -0,0 +1,58 @@
+import subprocess
+import sys
+from textwrap import dedent
+from unittest import TestCase
+
+import magda_tools
+
+# generous bound on the time to import the package and read a header,
+# excluding numpy, to catch heavy dependencies being imported eagerly
+IMPORT_BUDGET_S = 0.5
+
+HEAVY_MODULES = ("astropy", "sympy", "dask", "numba")
+
+
+def run(code):
+    """Run ``code`` in a fresh interpreter and return its output."""
+    result = subprocess.run(
+        [sys.executable, "-c", dedent(code)],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+class TestImport(TestCase):
+    def test_lazy_dependencies(self):
+        output = run(f"""
+            import sys
+            from pathlib import Path
+            import magda_tools
+            from magda_tools import DataFile, distance, parse_headers
+            path = Path({magda_tools.__file__!r}).parent.parent
+            header = path / "tests/data/casdata/y17/17051/processed"
+            DataFile(str(header / "17051_mrdcd_sdfgmc_ksm_1m.ffd")).unix_time
+            parse_headers([header / "17051_mrdcd_sdfgmc_ksm_1m.ffh"])
+            distance(1.0, 2.0, 3.0)
+            print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))
+            """)
+        self.assertEqual(output, "")
+
+    def test_import_time(self):
+        output = run("""
+            import time
+            import numpy
+            start = time.perf_counter()
+            import magda_tools
+            from magda_tools import DataFile, position_properties
+            print(time.perf_counter() - start)
+            """)
+        self.assertLess(float(output), IMPORT_BUDGET_S)
+
+    def test_exports(self):
+        for name in magda_tools.__all__:
+            self.assertTrue(hasattr(magda_tools, name), name)
+        self.assertIn("DataFile", dir(magda_tools))
+        with self.assertRaises(AttributeError):
+            magda_tools.not_a_name
@@ -0,0 +1,84 @@
+import logging
+import os
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import BFieldModel, DataFile, position_properties
+from magda_tools import instrumentation
+from magda_tools.instrumentation import (
+    StageEvent,
+    add_handler,
+    log_stages,
+    profile,
+    remove_handler,
+    stage,
+)
+
+CASDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/casdata")
+KRTP_FILE = os.path.join(CASDATA, "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd")
+
+
+class TestInstrumentation(TestCase):
+    def test_disabled(self):
+        self.assertFalse(instrumentation.enabled())
+        self.assertIs(stage("a"), stage("b"))
+        with stage("a") as timer:
+            timer.add(rows=1)
+            timer.allocated(np.empty(1))
+
+    def test_handler(self):
+        events = []
+        handler = add_handler(events.append)
+        try:
+            self.assertTrue(instrumentation.enabled())
+            with stage("test") as timer:
+                timer.add(rows=10, bytes_read=80)
+                timer.allocated(np.empty(10), None)
+        finally:
+            remove_handler(handler)
+        self.assertFalse(instrumentation.enabled())
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertIsInstance(event, StageEvent)
+        self.assertEqual(event.name, "test")
+        self.assertGreaterEqual(event.seconds, 0)
+        self.assertEqual(event.rows, 10)
+        self.assertEqual(event.bytes_read, 80)
+        self.assertEqual(event.arrays, 1)
+        self.assertEqual(event.bytes_allocated, 80)
+
+    def test_profile(self):
+        with profile() as report:
+            df = DataFile(KRTP_FILE)
+            df.unix_time
+            df["TIME"].data
+            x, y, z = df["X_KG"].data, df["Y_KG"].data, df["Z_KG"].data
+            position = position_properties(x, y, z, radius=60268.0)
+            BFieldModel([21160.0]).field(position.distance, position.colatitude)
+        summary = report.summary()
+        for name in (
+            "parse_header",
+            "read",
+            "byte_order",
+            "unix_time",
+            "astropy_time",
+            "position_properties",
+            "model_field",
+        ):
+            self.assertIn(name, summary)
+            self.assertEqual(summary[name].calls, 1)
+        self.assertEqual(summary["read"].rows, df.n_rows)
+        self.assertEqual(summary["read"].bytes_read, os.path.getsize(KRTP_FILE))
+        self.assertEqual(summary["position_properties"].arrays, 3)
+        self.assertIn("model_field", report.report())
+        self.assertFalse(instrumentation.enabled())
+
+    def test_log_stages(self):
+        handler = log_stages(level=logging.INFO)
+        try:
+            with self.assertLogs("magda_tools.instrumentation", logging.INFO) as logs:
+                DataFile(KRTP_FILE)
+        finally:
+            remove_handler(handler)
+        self.assertTrue(any("read:" in line for line in logs.output))
@@ -4,7 +4,8 @@ from unittest.mock import patch
 
 import numpy as np
 
-from magda_tools import BFieldModel, DataFile
+from magda_tools import BFieldModel, DataFile, SphericalHarmonicModel
+from magda_tools.model import schmidt_legendre
 
 CASDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/casdata")
 
@@ -42,3 +43,138 @@ class TestModel(TestCase):
             (np.abs(theta_hat_values - target_theta_hat_values) < 1e-5).all()
         )
         self.assertTrue((np.abs(phi_hat_values - target_phi_hat_values) < 1e-5).all())
+
+
+class TestNumericModel(TestCase):
+    def test_matches_symbolic_reference(self):
+        """Test the numerical evaluation against the lambdified sympy
+        expressions for a range of model degrees."""
+        rng = np.random.default_rng(0)
+        r = rng.uniform(1.0, 30.0, 1000)
+        theta = rng.uniform(0.0, np.pi, 1000)
+        for degree in (1, 2, 5, 10):
+            model = BFieldModel(list(rng.uniform(-2e4, 2e4, degree)))
+            r_hat, theta_hat = model.reference_functions()
+            np.testing.assert_allclose(
+                model.r_hat(r, theta), r_hat(r, theta), rtol=1e-10, atol=1e-10
+            )
+            np.testing.assert_allclose(
+                model.theta_hat(r, theta), theta_hat(r, theta), rtol=1e-10, atol=1e-10
+            )
+
+    def test_scalar(self):
+        """Test evaluation with a scalar r, alone or with an array of theta,
+        against the symbolic reference."""
+        model = BFieldModel([21160.0, 1560.0, 2320.0])
+        r_hat, theta_hat = model.reference_functions()
+        theta = np.array([0.5, 1.0])
+        self.assertAlmostEqual(float(model.r_hat(2.0, 0.5)), r_hat(2.0, 0.5))
+        self.assertAlmostEqual(float(model.theta_hat(2.0, 0.5)), theta_hat(2.0, 0.5))
+        b_r, b_theta = model.field(2.0, theta)
+        np.testing.assert_allclose(b_r, r_hat(2.0, theta))
+        np.testing.assert_allclose(b_theta, theta_hat(2.0, theta))
+
+    def test_poles(self):
+        """The theta component vanishes along the spin axis."""
+        model = BFieldModel([21160.0, 1560.0, 2320.0])
+        r_hat, theta_hat = model.field(np.array([2.0, 2.0]), np.array([0, np.pi]))
+        np.testing.assert_allclose(theta_hat, 0, atol=1e-12)
+        self.assertAlmostEqual(r_hat[0], 2 * 21160 / 8 + 3 * 1560 / 16 + 4 * 2320 / 32)
+
+    def test_chunked_process_datafile(self):
+        """Test that chunked and threaded evaluation into preallocated
+        buffers gives the same result as evaluating the whole file."""
+        df = DataFile(
+            os.path.join(CASDATA, "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd")
+        )
+        model = BFieldModel([21160.0, 1560.0, 2320.0])
+        expected = model.process_datafile(df)
+
+        out = tuple(np.empty(df.n_rows) for _ in range(3))
+        result = model.process_datafile(df, chunk_size=100, workers=4, out=out)
+        for component, buffer, target in zip(result, out, expected):
+            self.assertIs(component, buffer)
+            np.testing.assert_array_equal(component, target)
+
+
+class TestSphericalHarmonicModel(TestCase):
+    def test_schmidt_legendre(self):
+        """Compare against closed forms of the low degree functions."""
+        theta = np.linspace(0, np.pi, 7)
+        c, s = np.cos(theta), np.sin(theta)
+        p, dp = schmidt_legendre(3, theta)
+        np.testing.assert_allclose(p[1, 1], s)
+        np.testing.assert_allclose(p[2, 0], 1.5 * c**2 - 0.5, atol=1e-15)
+        np.testing.assert_allclose(p[2, 1], np.sqrt(3) * c * s, atol=1e-15)
+        np.testing.assert_allclose(p[2, 2], np.sqrt(3) / 2 * s**2, atol=1e-15)
+        np.testing.assert_allclose(p[3, 3], np.sqrt(10) / 4 * s**3, atol=1e-15)
+        np.testing.assert_allclose(dp[2, 1], np.sqrt(3) * np.cos(2 * theta), atol=1e-15)
+        np.testing.assert_allclose(p[1, 2], 0)
+
+    def test_axisymmetric(self):
+        """An m = 0 model matches BFieldModel."""
+        gn0s = [21160.0, 1560.0, 2320.0]
+        rng = np.random.default_rng(1)
+        r = rng.uniform(1.0, 30.0, 100)
+        theta = rng.uniform(0.0, np.pi, 100)
+        phi = rng.uniform(-np.pi, np.pi, 100)
+        model = SphericalHarmonicModel.from_gn0s(gn0s)
+        b_r, b_theta, b_phi = model.field(r, theta, phi)
+        # Legendre functions are reused for the same co-latitudes
+        self.assertIs(model._legendre(theta.copy()), model._legendre(theta))
+        target_r, target_theta = BFieldModel(gn0s).field(r, theta)
+        np.testing.assert_allclose(b_r, target_r)
+        np.testing.assert_allclose(b_theta, target_theta)
+        np.testing.assert_allclose(b_phi, 0)
+
+    def test_gradient_of_potential(self):
+        """The field matches a finite difference gradient of the scalar
+        potential for a random non-axisymmetric model."""
+        degree = 4
+        rng = np.random.default_rng(2)
+        g = np.tril(rng.uniform(-1, 1, (degree + 1, degree + 1)))
+        h = np.tril(rng.uniform(-1, 1, (degree + 1, degree + 1)))
+        h[:, 0] = 0
+        g[0] = h[0] = 0
+        model = SphericalHarmonicModel(g, h)
+
+        def potential(r, theta, phi):
+            p, _ = schmidt_legendre(degree, theta)
+            return sum(
+                r ** -(n + 1)
+                * (g[n, m] * np.cos(m * phi) + h[n, m] * np.sin(m * phi))
+                * p[n, m]
+                for n in range(1, degree + 1)
+                for m in range(n + 1)
+            )
+
+        r = rng.uniform(1.5, 5.0, 50)
+        theta = rng.uniform(0.2, np.pi - 0.2, 50)
+        phi = rng.uniform(-np.pi, np.pi, 50)
+        b_r, b_theta, b_phi = model.field(r, theta, phi)
+
+        eps = 1e-6
+        dv_dr = (potential(r + eps, theta, phi) - potential(r - eps, theta, phi)) / (
+            2 * eps
+        )
+        dv_dtheta = (
+            potential(r, theta + eps, phi) - potential(r, theta - eps, phi)
+        ) / (2 * eps)
+        dv_dphi = (potential(r, theta, phi + eps) - potential(r, theta, phi - eps)) / (
+            2 * eps
+        )
+        np.testing.assert_allclose(b_r, -dv_dr, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(b_theta, -dv_dtheta / r, rtol=1e-6, atol=1e-8)
+        np.testing.assert_allclose(
+            b_phi, -dv_dphi / (r * np.sin(theta)), rtol=1e-6, atol=1e-8
+        )
+
+    def test_process_datafile(self):
+        df = DataFile(
+            os.path.join(CASDATA, "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd")
+        )
+        gn0s = [21160.0, 1560.0, 2320.0]
+        model = SphericalHarmonicModel.from_gn0s(gn0s)
+        result = model.process_datafile(df, chunk_size=500, workers=2)
+        for component, target in zip(result, BFieldModel(gn0s).process_datafile(df)):
+            np.testing.assert_allclose(component, target, atol=1e-12)
@@ -0,0 +1,134 @@
+import os
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from magda_tools import BFieldModel, DataFile, ModelCache, SphericalHarmonicModel
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+KRTP_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd"
+GN0S = [21160.0, 1560.0, 2320.0]
+
+
+class TestModelCache(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = Path(self.tmp.name) / KRTP_FILE.name
+        shutil.copy(KRTP_FILE, self.path)
+        shutil.copy(KRTP_FILE.with_suffix(".ffh"), self.path.with_suffix(".ffh"))
+        self.df = DataFile(str(self.path))
+        self.model = BFieldModel(GN0S)
+        self.expected = self.model.process_datafile(self.df)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_components_equal(self, actual, expected):
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(a, e)
+
+    def test_memory(self):
+        cache = ModelCache()
+        first = self.model.process_datafile(self.df, cache=cache)
+        self.assert_components_equal(first, self.expected)
+        self.assertFalse(first[0].flags.writeable)
+        with patch("magda_tools.model.position_properties") as position_properties:
+            second = self.model.process_datafile(DataFile(str(self.path)), cache=cache)
+        position_properties.assert_not_called()
+        self.assertIs(second[0], first[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.nbytes, 3 * self.df.n_rows * 8)
+
+        # results are copied into arrays given as out
+        out = tuple(np.empty(self.df.n_rows) for _ in range(3))
+        result = self.model.process_datafile(self.df, out=out, cache=cache)
+        self.assertIs(result[0], out[0])
+        self.assert_components_equal(out, self.expected)
+
+    def test_key(self):
+        """Test that the model, coefficients, rows and file are part of the
+        key"""
+        cache = ModelCache()
+        self.model.process_datafile(self.df, cache=cache)
+        BFieldModel(GN0S[:2]).process_datafile(self.df, cache=cache)
+        BFieldModel([21160.0, 1560.0, 2000.0]).process_datafile(self.df, cache=cache)
+        SphericalHarmonicModel.from_gn0s(GN0S).process_datafile(self.df, cache=cache)
+        subset = self.df.read_range(end=self.df.unix_time[99])
+        self.assert_components_equal(
+            self.model.process_datafile(subset, cache=cache),
+            [c[:100] for c in self.expected],
+        )
+        with patch("magda_tools.model.SATURN_RADIUS_KM", 60330.0):
+            self.model.process_datafile(self.df, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 6))
+
+        os.utime(self.path, ns=(0, 0))
+        self.model.process_datafile(DataFile(str(self.path)), cache=cache)
+        self.assertEqual(cache.misses, 7)
+
+    def test_modified_positions(self):
+        """Test that positions changed after reading are evaluated afresh"""
+        cache = ModelCache()
+        self.model.process_datafile(self.df, cache=cache)
+        df = DataFile(str(self.path))
+        df["X_KG"].data = df["X_KG"].data * 2
+        result = self.model.process_datafile(df, cache=cache)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        self.assert_components_equal(result, self.model.process_datafile(df))
+
+        df = DataFile(str(self.path))
+        df["Z_KG"].data[0] += 1000.0
+        self.model.process_datafile(df, cache=cache)
+        self.assertEqual(cache.misses, 3)
+
+    def test_disk(self):
+        """Test that components stored on disk are shared between caches"""
+        directory = os.path.join(self.tmp.name, "cache")
+        out = tuple(np.empty(self.df.n_rows) for _ in range(3))
+        self.model.process_datafile(
+            self.df, out=out, cache=ModelCache(directory=directory)
+        )
+        # the caller's arrays are not made read only
+        self.assertTrue(out[0].flags.writeable)
+        cache = ModelCache(directory=directory)
+        result = self.model.process_datafile(self.df, cache=cache)
+        self.assertEqual(cache.hits, 1)
+        self.assertIsInstance(result[0].base, np.memmap)
+        self.assert_components_equal(result, self.expected)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(os.listdir(directory), [])
+
+    def test_eviction(self):
+        """Test that least recently used entries are evicted to stay within
+        the size limits"""
+        directory = os.path.join(self.tmp.name, "cache")
+        nbytes = 3 * self.df.n_rows * 8
+        cache = ModelCache(2 * nbytes, directory, max_disk_bytes=2 * nbytes + 1000)
+        models = [BFieldModel(GN0S[:degree]) for degree in (1, 2, 3)]
+        keys = [
+            cache.key(self.df, "BFieldModel", model.degree, [model.gn0s], 60268.0)
+            for model in models
+        ]
+        for model in models[:2]:
+            model.process_datafile(self.df, cache=cache)
+        # the first entry becomes the most recently used
+        self.assertIsNotNone(cache.get(keys[0]))
+        models[2].process_datafile(self.df, cache=cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.nbytes, 2 * nbytes)
+        self.assertEqual(
+            sorted(os.listdir(directory)), sorted([keys[0] + ".npy", keys[2] + ".npy"])
+        )
+        self.assertIsNone(cache.get(keys[1]))
+
+        # entries larger than the memory limit are only stored on disk
+        cache = ModelCache(nbytes - 1, directory)
+        models[0].process_datafile(self.df, cache=cache)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 1)
@@ -1,11 +1,16 @@
 import json
+import os
+import shutil
 from copy import deepcopy
 from datetime import datetime
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
-from magda_tools import MAGDA_TIME_FMT_MS, DataFile
-from magda_tools.data_file import COLUMN_REGEX
+import numpy as np
+
+from magda_tools import MAGDA_TIME_FMT_MS, DataFile, RowCountWarning, parse_headers
+from magda_tools.data_file import COLUMN_REGEX, Column, _parse_header_time
 
 
 DATA_ROOT = Path(__file__).parent.absolute() / "data"
@@ -41,7 +46,7 @@ class TestDataParser(TestCase):
         metadata = DataFile.parse_header(ffh)
         columns = metadata.pop("columns")
         metadata.pop("end")
-        metadata.pop("timebase")
+        self.assertEqual(metadata.pop("timebase").unix, metadata.pop("timebase_unix"))
         for k, v in metadata.items():
             if isinstance(v, str):
                 metadata[k] = v.lower()
@@ -51,6 +56,43 @@ class TestDataParser(TestCase):
             for col, target_val in zip(columns, values):
                 self.assertEqual(getattr(col, attr), target_val)
 
+    def test_parse_header_time(self):
+        for value in (
+            "2008 100 APR  9 00:00:30.000",
+            "2017 051 FEB 20 00:00:30.5",
+            "2004 366 DEC 31 23:59:59.999999",
+        ):
+            self.assertEqual(
+                _parse_header_time(value),
+                datetime.strptime(" ".join(value.split()), MAGDA_TIME_FMT_MS),
+            )
+        self.assertEqual(
+            _parse_header_time("99 001 JAN  1 00:00:00.000"), datetime(1999, 1, 1)
+        )
+
+    def test_parse_headers(self):
+        """Test that the table of header metadata matches parsing each
+        header individually, both in and out of process."""
+        paths = sorted(CASDATA.glob("*/*/processed/*.ffh"))
+        for workers in (1, 2):
+            table = parse_headers(paths, workers=workers)
+            self.assertEqual(len(table), len(paths))
+            for row, path in zip(table, paths):
+                metadata = DataFile.parse_header(path)
+                self.assertEqual(row["path"], str(path))
+                self.assertEqual(row["n_rows"], metadata["n_rows"])
+                self.assertEqual(row["coord"], metadata["coord"])
+                self.assertEqual(row["res"], metadata["res"])
+                self.assertEqual(row["timebase"], metadata["timebase_unix"])
+                self.assertEqual(
+                    np.datetime64(metadata["start"]),
+                    np.datetime64(int(row["start"] * 1e6), "us"),
+                )
+                self.assertEqual(
+                    row["columns"].split(","), [c.name for c in metadata["columns"]]
+                )
+        self.assertEqual(len(parse_headers([])), 0)
+
     def test_datafile(self):
         ffd = self.ffh_rel_path.replace(".ffh", ".ffd")
         datafile = DataFile(Path(CASDATA, ffd))
@@ -83,6 +125,198 @@ class TestDataParser(TestCase):
         self.assertEqual(datafile.start, datafile["TIME"].data[0].datetime)
         self.assertEqual(datafile["TIME"].data[-1].datetime, datafile.end)
 
+    def test_datafile_mmap(self):
+        """Test that a memory mapped datafile defers conversion of its
+        columns until they are accessed and matches an eagerly read file."""
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        eager = DataFile(ffd)
+        mapped = DataFile(ffd, mmap=True)
+
+        self.assertEqual(mapped.n_rows, eager.n_rows)
+        for c in mapped.columns:
+            self.assertFalse(c.loaded, c.name)
+            self.assertIsInstance(c._data.base, np.memmap)
+
+        bx = mapped["BX_KG"]
+        self.assertTrue(np.array_equal(bx.data, eager["BX_KG"].data))
+        self.assertTrue(bx.data.dtype.isnative)
+        self.assertTrue(bx.loaded)
+        self.assertFalse(mapped["TIME"].loaded)
+
+        self.assertEqual(mapped.start, mapped["TIME"].data[0].datetime)
+        self.assertEqual(mapped["TIME"].data[-1].datetime, mapped.end)
+
+    def test_numeric_time(self):
+        """Test that the numeric time axis matches the astropy times and
+        that the astropy times are only built on request."""
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        datafile = DataFile(ffd)
+        self.assertFalse(datafile["TIME"].loaded)
+
+        self.assertEqual(datafile.unix_time.dtype, np.float64)
+        self.assertEqual(datafile.datetime64[0], np.datetime64(datafile.start))
+        self.assertEqual(datafile.datetime64[-1], np.datetime64(datafile.end))
+        np.testing.assert_allclose(
+            datafile.unix_time, datafile["TIME"].data.unix, rtol=0, atol=1e-6
+        )
+
+    def test_read_range(self):
+        """Test that reading a time range returns the same rows as selecting
+        them from the whole file."""
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        datafile = DataFile(ffd, mmap=True)
+        start, end = datetime(2008, 4, 9, 6), datetime(2008, 4, 9, 7)
+        subset = datafile.read_range(start, end)
+
+        times = datafile.datetime64
+        mask = (times >= np.datetime64(start)) & (times <= np.datetime64(end))
+        self.assertEqual(subset.n_rows, mask.sum())
+        self.assertTrue(np.array_equal(subset.datetime64, times[mask]))
+        self.assertTrue(
+            np.array_equal(subset["BX_KG"].data, datafile["BX_KG"].data[mask])
+        )
+        self.assertEqual(
+            np.datetime64(subset["TIME"].data[0].datetime), subset.datetime64[0]
+        )
+
+        self.assertEqual(datafile.read_range(end=datetime(2008, 1, 1)).n_rows, 0)
+        self.assertEqual(datafile.read_range().n_rows, datafile.n_rows)
+
+    def test_iter_chunks(self):
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        datafile = DataFile(ffd)
+        chunks = list(datafile.iter_chunks(500))
+        self.assertEqual([c.n_rows for c in chunks], [500, 500, 426])
+        self.assertTrue(
+            np.array_equal(
+                np.concatenate([c["BZ_KG"].data for c in chunks]),
+                datafile["BZ_KG"].data,
+            )
+        )
+
+        start = datetime(2008, 4, 9, 12)
+        chunks = list(datafile.iter_chunks(100, start=start))
+        self.assertEqual(
+            sum(c.n_rows for c in chunks),
+            (datafile.datetime64 >= np.datetime64(start)).sum(),
+        )
+        self.assertGreaterEqual(chunks[0].datetime64[0], np.datetime64(start))
+
+    def test_column_aliases(self):
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        datafile = DataFile(ffd)
+        self.assertIs(datafile["BX"], datafile["BX_KG"])
+        self.assertIs(datafile["Z"], datafile["Z_KG"])
+        self.assertIs(datafile["TIME_TAI"], datafile["TIME"])
+        self.assertIs(datafile["BTOTAL"], datafile.columns[4])
+        with self.assertRaises(ValueError):
+            datafile["BX_KSM"]
+
+    def test_vector(self):
+        """Test that the component vectors are views onto the records for
+        both eagerly read and memory mapped files."""
+        ffd = Path(CASDATA, self.ffh_rel_path.replace(".ffh", ".ffd"))
+        for mmap in (False, True):
+            datafile = DataFile(ffd, mmap=mmap)
+            expected = np.column_stack(
+                [datafile[name].data for name in ("X_KG", "Y_KG", "Z_KG")]
+            )
+            # reopen as loading the mapped columns above replaces their data
+            datafile = DataFile(ffd, mmap=mmap)
+            position = datafile.position_vector
+            self.assertEqual(position.shape, (datafile.n_rows, 3))
+            self.assertTrue(np.shares_memory(position, datafile["X"].raw))
+            self.assertTrue(np.array_equal(position, expected))
+            self.assertFalse(position.flags.writeable)
+
+        # equally spaced columns which are not adjacent are also viewed,
+        # while columns which are not equally spaced are stacked
+        for names, view in ((["BX", "BZ", "X"], True), (["BX", "BY", "X"], False)):
+            vector = datafile.vector(names)
+            self.assertEqual(np.shares_memory(vector, datafile["BX"].raw), view)
+            self.assertTrue(
+                np.array_equal(
+                    vector, np.column_stack([datafile[name].data for name in names])
+                )
+            )
+
+    def test_cache(self):
+        """Test that a datafile loaded from its cache matches the flat file
+        and that the cache is rebuilt when the flat file changes."""
+        with TemporaryDirectory() as tmp:
+            ffh = Path(tmp, Path(self.ffh_rel_path).name)
+            shutil.copy(Path(CASDATA, self.ffh_rel_path), ffh)
+            shutil.copy(Path(CASDATA, self.ffh_rel_path).with_suffix(".ffd"), tmp)
+            ffd = str(ffh.with_suffix(".ffd"))
+            datafile = DataFile(ffd)
+
+            cache_path = datafile.to_cache()
+            self.assertTrue(os.path.isdir(cache_path))
+            cached = DataFile.from_cache(ffd)
+            for attr in ("n_rows", "coord", "sensor", "telem", "res", "start", "end"):
+                self.assertEqual(getattr(cached, attr), getattr(datafile, attr))
+            self.assertEqual(cached.dtype, datafile.dtype)
+            for c in datafile.columns:
+                for attr in ("index", "name", "source", "units", "type_"):
+                    self.assertEqual(getattr(cached[c.name], attr), getattr(c, attr))
+            for c in datafile.columns[1:]:
+                self.assertIsInstance(cached[c.name].data, np.memmap)
+                self.assertTrue(np.array_equal(cached[c.name].data, c.data))
+            self.assertTrue(np.array_equal(cached.unix_time, datafile.unix_time))
+            self.assertEqual(cached.start, cached["TIME"].data[0].datetime)
+
+            # subsets and modified values can not be cached
+            subset = datafile.read_range(
+                datetime(2008, 4, 9, 6), datetime(2008, 4, 9, 7)
+            )
+            with self.assertRaises(ValueError):
+                subset.to_cache()
+            modified = DataFile(ffd)
+            modified["BX_KG"].data[0] += 1.0
+            with self.assertRaises(ValueError):
+                modified.to_cache()
+            self.assertEqual(DataFile.from_cache(ffd).n_rows, datafile.n_rows)
+            DataFile(ffd, mmap=True).to_cache()
+
+            # modifying the data file invalidates the cache
+            with open(ffd, "ab") as f:
+                f.write(bytes(datafile.dtype.itemsize))
+            with self.assertWarns(RowCountWarning):
+                rebuilt = DataFile.from_cache(ffd)
+            self.assertEqual(rebuilt.n_rows, datafile.n_rows + 1)
+            self.assertEqual(DataFile.from_cache(ffd).n_rows, datafile.n_rows + 1)
+
+    def test_identity(self):
+        """Test that the identity of a datafile is the same however it is
+        loaded and changes with the rows and values of the columns."""
+        with TemporaryDirectory() as tmp:
+            shutil.copy(Path(CASDATA, self.ffh_rel_path), tmp)
+            shutil.copy(Path(CASDATA, self.ffh_rel_path).with_suffix(".ffd"), tmp)
+            ffd = str(Path(tmp, Path(self.ffh_rel_path).with_suffix(".ffd").name))
+            columns = ["X_KG", "Y_KG", "Z_KG"]
+            datafile = DataFile(ffd)
+            identity = datafile.identity(columns)
+            self.assertEqual(identity["path"], os.path.abspath(ffd))
+            self.assertEqual(identity["rows"][0], datafile.n_rows)
+            self.assertEqual(sorted(identity["columns"]), columns)
+            json.dumps(identity)
+            datafile.to_cache()
+            for other in (DataFile(ffd, mmap=True), DataFile.from_cache(ffd)):
+                self.assertEqual(other.identity(columns), identity)
+            self.assertNotEqual(
+                datafile.read_range(end=datafile.unix_time[9]).identity(columns),
+                identity,
+            )
+
+            # changes to the values of the columns after reading
+            datafile["X_KG"].data[0] += 1.0
+            self.assertNotEqual(datafile.identity(columns), identity)
+            datafile["X_KG"].data[0] -= 1.0
+            self.assertEqual(datafile.identity(columns), identity)
+            datafile["Y_KG"].data = datafile["Y_KG"].data * 2
+            self.assertNotEqual(datafile.identity(columns), identity)
+            self.assertEqual(datafile.identity(), dict(identity, columns={}))
+
     def test_decode_sensor_status(self):
         """Test the bit shift operations used to decode sensor data"""
 
@@ -115,6 +349,23 @@ class TestDataParser(TestCase):
             self.assertEqual(s, t)
 
 
+class TestColumn(TestCase):
+    def test_construct(self):
+        """Test that the data of a column may be given on construction"""
+        data = np.arange(3.0)
+        column = Column(1, "BX_KSM", "CA_SD_RG_FGM", "nT", "f", data=data)
+        self.assertIs(column.data, data)
+        self.assertTrue(column.loaded)
+        self.assertEqual(len(Column(1, "BX_KSM", "CA_SD_RG_FGM", "nT", "f").data), 0)
+
+        column = Column(1, "BX_KSM", "CA_SD_RG_FGM", "nT", "f", data, np.negative)
+        self.assertFalse(column.loaded)
+        np.testing.assert_array_equal(column.data, -data)
+        copy = column.with_data(data)
+        self.assertEqual(copy.name, "BX_KSM")
+        self.assertIs(copy.data, data)
+
+
 class Regex(TestCase):
     def test_line1(self):
         target_data = dict(
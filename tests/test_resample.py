@@ -0,0 +1,162 @@
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import DataFile, MagdaDataset, bin_statistics, minmax_decimate
+from magda_tools.resample import parse_cadence
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+KSM_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd"
+
+
+class TestBinStatistics(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # 10 second samples with a gap spanning several 1 minute bins
+        self.unix_time = np.concatenate(
+            (np.arange(1000.0, 2000.0, 10.0), np.arange(2500.0, 3000.0, 10.0))
+        )
+        self.values = rng.normal(size=(len(self.unix_time), 2))
+
+    def test_parse_cadence(self):
+        self.assertEqual(parse_cadence("30s"), 30)
+        self.assertEqual(parse_cadence("1m"), 60)
+        self.assertEqual(parse_cadence("1.5h"), 5400)
+        self.assertEqual(parse_cadence(10), 10)
+        for invalid in ("1y", "m", "-1m", 0):
+            with self.assertRaises(ValueError):
+                parse_cadence(invalid)
+
+    def test_statistics(self):
+        """Test the binned statistics against a direct calculation."""
+        statistics = ("mean", "min", "max", "std")
+        bins, count, results = bin_statistics(
+            self.unix_time, self.values, "1m", statistics
+        )
+        self.assertEqual(bins[0], 960)
+        self.assertEqual(bins[-1], 2940)
+        np.testing.assert_array_equal(np.diff(bins), 60)
+        self.assertEqual(count.sum(), len(self.unix_time))
+
+        for i, start in enumerate(bins):
+            selected = (self.unix_time >= start) & (self.unix_time < start + 60)
+            self.assertEqual(count[i], selected.sum())
+            for statistic in statistics:
+                if not count[i]:
+                    self.assertTrue(np.isnan(results[statistic][i]).all())
+                    continue
+                expected = getattr(np, statistic)(self.values[selected], axis=0)
+                np.testing.assert_allclose(results[statistic][i], expected)
+
+    def test_one_dimensional(self):
+        bins, count, results = bin_statistics(
+            self.unix_time, self.values[:, 0], 300, ("mean",)
+        )
+        self.assertEqual(results["mean"].shape, bins.shape)
+        _, _, both = bin_statistics(self.unix_time, self.values, 300, ("mean",))
+        np.testing.assert_array_equal(results["mean"], both["mean"][:, 0])
+
+    def test_empty(self):
+        bins, count, results = bin_statistics(np.empty(0), np.empty(0), "1h")
+        self.assertEqual(len(bins), 0)
+        self.assertEqual(len(results["mean"]), 0)
+
+
+class TestMinMaxDecimate(TestCase):
+    def test_decimate(self):
+        rng = np.random.default_rng(1)
+        unix_time = np.concatenate((np.arange(0.0, 500.0), np.arange(700.0, 1000.0)))
+        values = rng.normal(size=len(unix_time))
+        times, decimated = minmax_decimate(unix_time, values, 100)
+
+        # each occupied pixel contributes its extremes, in time order, and a
+        # NaN separates the samples either side of the gap
+        gap = np.isnan(decimated)
+        self.assertEqual(gap.sum(), 1)
+        self.assertEqual(len(decimated), 2 * 80 + 1)
+        self.assertTrue(500 <= times[gap][0] < 700)
+        self.assertTrue((np.diff(times) >= 0).all())
+        self.assertEqual(np.nanmax(decimated), values.max())
+        self.assertEqual(np.nanmin(decimated), values.min())
+
+        pixel = (unix_time >= 10) & (unix_time < 20)
+        selected = (times >= 10) & (times < 20)
+        self.assertEqual(
+            sorted(decimated[selected]), [values[pixel].min(), values[pixel].max()]
+        )
+
+    def test_range(self):
+        unix_time = np.arange(100.0)
+        times, values = minmax_decimate(unix_time, unix_time, 5, start=10, end=59)
+        self.assertEqual(times[0], 10)
+        self.assertEqual(times[-1], 59)
+        self.assertEqual(len(times), 10)
+
+
+class TestDataFileResample(TestCase):
+    def test_resample(self):
+        df = DataFile(KSM_FILE)
+        resampled = df.resample("1h", statistics=("mean", "max"))
+        self.assertEqual(resampled.columns, [c.name for c in df.columns[1:]])
+        self.assertEqual(resampled.count.sum(), df.n_rows)
+        first_hour = df.datetime64 < resampled.datetime64[1]
+        np.testing.assert_allclose(
+            resampled.column("BX_KSM")[0],
+            df["BX_KSM"].data[first_hour].mean(dtype=np.float64),
+        )
+        self.assertEqual(
+            resampled.column("Z_KSM", "max")[0], df["Z_KSM"].data[first_hour].max()
+        )
+        with self.assertRaises(ValueError):
+            resampled.column("BX_KSM", "std")
+        with self.assertRaises(ValueError):
+            df.resample("1h", columns=["BX_KG"])
+
+    def test_resample_aliases(self):
+        """Test that columns may be selected by their aliases"""
+        df = DataFile(KSM_FILE)
+        expected = df.resample("1h", ["BX_KSM", "Z_KSM"])
+        dataset = MagdaDataset.open([KSM_FILE], workers=1)
+        for data in (df, dataset):
+            resampled = data.resample("1h", ["BX", "Z"])
+            self.assertEqual(resampled.columns, ["BX", "Z"])
+            np.testing.assert_array_equal(
+                resampled.values["mean"], expected.values["mean"]
+            )
+
+    def test_pyramid(self):
+        with TemporaryDirectory() as tmp:
+            ffd = Path(tmp, KSM_FILE.name)
+            shutil.copy(KSM_FILE, ffd)
+            shutil.copy(KSM_FILE.with_suffix(".ffh"), tmp)
+            df = DataFile(str(ffd))
+
+            levels = df.pyramid(("10m", "1h"), columns=["BX_KSM"])
+            self.assertEqual([level.cadence for level in levels], [600, 3600])
+            cached = df.pyramid(("10m", "1h"), columns=["BX_KSM"])
+            for level, cached_level in zip(levels, cached):
+                np.testing.assert_array_equal(level.count, cached_level.count)
+                np.testing.assert_array_equal(
+                    level.column("BX_KSM", "max"), cached_level.column("BX_KSM", "max")
+                )
+            self.assertEqual(len(list(Path(tmp).glob("*.cache/pyramid_*.npz"))), 2)
+
+            # a different selection of columns replaces the cached levels
+            levels = df.pyramid(("1h",), columns=["BY_KSM"])
+            self.assertEqual(levels[0].columns, ["BY_KSM"])
+
+            # levels of subsets or modified columns are not those of the file
+            subset = df.read_range(end=df.unix_time[0] + 3600 * 6)
+            (level,) = subset.pyramid(("1h",), columns=["BY_KSM"])
+            self.assertEqual(level.count.sum(), subset.n_rows)
+            (level,) = df.pyramid(("1h",), columns=["BY_KSM"])
+            self.assertEqual(level.count.sum(), df.n_rows)
+            df["BY_KSM"].data = df["BY_KSM"].data + 1.0
+            (level,) = df.pyramid(("1h",), columns=["BY_KSM"])
+            np.testing.assert_allclose(
+                level.column("BY_KSM", "mean"),
+                levels[0].column("BY_KSM", "mean") + 1.0,
+            )
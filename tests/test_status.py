@@ -0,0 +1,70 @@
+import os
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import DataFile, StatusSegments
+
+CASDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/casdata")
+
+
+class TestStatusSegments(TestCase):
+    def setUp(self):
+        self.status = np.array([1, 1, 1, 2, 2, 1, 0, 0, 0, 0], dtype=np.uint8)
+        self.unix_time = np.arange(10.0) + 100.0
+        self.segments = StatusSegments.from_status(self.status, self.unix_time)
+
+    def test_segments(self):
+        np.testing.assert_array_equal(self.segments.starts, [0, 3, 5, 6])
+        np.testing.assert_array_equal(self.segments.stops, [3, 5, 6, 10])
+        np.testing.assert_array_equal(self.segments.values, [1, 2, 1, 0])
+        self.assertEqual(self.segments.values.dtype, np.uint8)
+        np.testing.assert_array_equal(self.segments.start_time, [100, 103, 105, 106])
+        np.testing.assert_array_equal(self.segments.stop_time, [102, 104, 105, 109])
+        np.testing.assert_array_equal(self.segments.changes, [3, 5, 6])
+        np.testing.assert_array_equal(self.segments.change_times, [103, 105, 106])
+        np.testing.assert_array_equal(self.segments.ranges, [0, 1, 2])
+        np.testing.assert_array_equal(self.segments.status(), self.status)
+        self.assertEqual(self.segments.n_rows, 10)
+        np.testing.assert_array_equal(self.segments.at([0, 4, 5, 9]), [1, 2, 1, 0])
+
+    def test_empty(self):
+        segments = StatusSegments.from_status(np.array([], dtype=np.uint8))
+        self.assertEqual(len(segments), 0)
+        self.assertEqual(segments.n_rows, 0)
+        self.assertEqual(len(segments.mask(1)), 0)
+
+    def test_mask(self):
+        np.testing.assert_array_equal(self.segments.mask(1), self.status == 1)
+        np.testing.assert_array_equal(
+            self.segments.mask([0, 2]), np.isin(self.status, [0, 2])
+        )
+
+    def test_views(self):
+        views = self.segments.views(self.unix_time, 1)
+        self.assertEqual(len(views), 2)
+        np.testing.assert_array_equal(views[0], [100, 101, 102])
+        np.testing.assert_array_equal(views[1], [105])
+        for view in views:
+            self.assertTrue(np.shares_memory(view, self.unix_time))
+
+    def test_select(self):
+        # a single segment is returned as a view
+        selected = self.segments.select(self.unix_time, 0)
+        np.testing.assert_array_equal(selected, [106, 107, 108, 109])
+        self.assertTrue(np.shares_memory(selected, self.unix_time))
+        np.testing.assert_array_equal(
+            self.segments.select(self.unix_time, 1), [100, 101, 102, 105]
+        )
+
+    def test_decoded_dtype(self):
+        status = DataFile.decode_sensor_status([-1879046909, 268436995])
+        self.assertEqual(status.dtype, np.uint8)
+        np.testing.assert_array_equal(status, [2, 0])
+
+    def test_not_c(self):
+        df = DataFile(
+            os.path.join(CASDATA, "y17/17051/processed/17051_mrdcd_sdfgmc_ksm_1m.ffd")
+        )
+        with self.assertRaises(ValueError):
+            df.status_segments
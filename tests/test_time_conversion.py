@@ -2,8 +2,18 @@ from datetime import datetime
 from unittest import TestCase
 
 import astropy.time
+import numpy as np
 from pytz import UTC
 
+from magda_tools.data_file import EPOCHS
+from magda_tools.time_conversion import (
+    epoch_seconds_to_unix,
+    tai_minus_utc,
+    tai_to_utc,
+    unix_to_datetime64,
+    utc_to_tai,
+)
+
 
 class TestTime(TestCase):
     def compare_times(self, utc, diff):
@@ -21,3 +31,53 @@ class TestTime(TestCase):
         self.compare_times(datetime(2016, 12, 31, 12, tzinfo=UTC), 36)
         # At millenium difference should be 32 seconds
         self.compare_times(datetime(2000, 1, 1, 12, tzinfo=UTC), 32)
+
+
+class TestNumericTime(TestCase):
+    def test_tai_minus_utc(self):
+        """Test the TAI-UTC offset against the leap second table used by
+        astropy."""
+        utc = astropy.time.Time(
+            ["1966-06-01", "1980-01-01", "2000-01-01", "2016-12-31", "2017-01-01"],
+            scale="utc",
+        )
+        target = [
+            (tai - utc).total_seconds()
+            for tai, utc in zip(utc.tai.datetime, utc.datetime)
+        ]
+        np.testing.assert_allclose(tai_minus_utc(utc.unix), target, atol=1e-6)
+
+    def test_epoch_seconds_to_unix(self):
+        """Test conversion of flat file time stamps across a leap second
+        against astropy."""
+        timebase = astropy.time.Time(EPOCHS["J2000"], format="unix", scale="utc")
+        start = astropy.time.Time("2016-12-31 00:00:00", scale="utc")
+        seconds = (start - timebase).sec + np.linspace(0, 2 * 86400, 998)
+        target = (
+            astropy.time.TimeDelta(seconds, format="sec", scale="tai") + timebase
+        ).datetime
+
+        unix = epoch_seconds_to_unix(seconds, EPOCHS["J2000"])
+        error = unix_to_datetime64(unix) - target.astype("datetime64[ns]")
+        self.assertLess(np.abs(error).max(), np.timedelta64(1, "us"))
+
+    def test_tai_to_utc_inverse(self):
+        """Test that tai_to_utc inverts utc_to_tai including the pre 1972
+        era of drifting offsets."""
+        unix = np.linspace(-4e8, 1.7e9, 1001)
+        np.testing.assert_allclose(tai_to_utc(utc_to_tai(unix)), unix, atol=1e-6)
+
+    def test_leap_second(self):
+        """Test that times within the leap second at the end of 2016 map to
+        the end of 23:59:59 so that times stay in order."""
+        leap = float(np.datetime64("2017-01-01", "s").astype(np.int64))
+        offsets = np.arange(-2.0, 2.25, 0.25)
+        unix = tai_to_utc(utc_to_tai(leap) + offsets)
+        self.assertTrue(np.all(np.diff(unix) >= 0))
+        np.testing.assert_allclose(unix[:4], leap + offsets[:4] + 1)
+        np.testing.assert_array_equal(unix[4:9], leap)
+        np.testing.assert_allclose(unix[8:], leap + offsets[8:])
+
+        # as is the step in the offset at the start of the table
+        tai = utc_to_tai(-315619200.0) + np.linspace(-3.0, 1.0, 17)
+        self.assertTrue(np.all(np.diff(tai_to_utc(tai)) >= 0))
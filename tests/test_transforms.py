@@ -0,0 +1,123 @@
+from pathlib import Path
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import DataFile, transform_positions, transform_vectors
+from magda_tools.calculate import SECS_PER_DAY, SLT_ALPHA, SLT_OMEGA, SLT_PHI
+from magda_tools.transforms import (
+    cartesian_to_spherical,
+    rotation_matrices,
+    spherical_to_cartesian,
+)
+
+PROCESSED = Path(__file__).parent.absolute() / "data/casdata/y17/17051/processed"
+KSM_FILE = PROCESSED / "17051_mrdcd_sdfgmc_ksm_1m.ffd"
+KRTP_FILE = PROCESSED / "17051_mrdcd_sdfgmc_krtp_1m.ffd"
+
+
+class TestRotations(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.unix_time = np.sort(rng.uniform(1.0e9, 1.5e9, 1000))
+        self.vectors = rng.normal(size=(1000, 3))
+
+    def test_orthonormal(self):
+        for frames in (("KG", "KSM"), ("KSO", "KG"), ("J2000", "KSO")):
+            matrices = rotation_matrices(self.unix_time, *frames)
+            np.testing.assert_allclose(
+                matrices @ np.swapaxes(matrices, -1, -2),
+                np.broadcast_to(np.eye(3), matrices.shape),
+                atol=1e-12,
+            )
+            np.testing.assert_allclose(np.linalg.det(matrices), 1)
+
+    def test_round_trip(self):
+        frames = ("KG", "KSO", "KSM", "J2000", "KRTP")
+        position_kg = self.vectors * 1e5
+        for from_frame in frames:
+            for to_frame in frames:
+                there = transform_vectors(
+                    self.vectors, self.unix_time, from_frame, to_frame, position_kg
+                )
+                back = transform_vectors(
+                    there, self.unix_time, to_frame, from_frame, position_kg
+                )
+                np.testing.assert_allclose(back, self.vectors, atol=1e-12)
+
+    def test_solar_frames(self):
+        """Test that KSM and KSO share the Sun direction, differing by a
+        rotation about X, and that the latitude of the Sun matches the fit
+        used for Saturn local time."""
+        matrices = rotation_matrices(self.unix_time, "KSM", "KSO")
+        np.testing.assert_allclose(matrices[:, :, 0], [[1, 0, 0]] * 1000, atol=1e-12)
+
+        sun_kg = rotation_matrices(self.unix_time, "KSM", "KG")[:, :, 0]
+        latitude = np.degrees(np.arcsin(sun_kg[:, 2]))
+        fit = SLT_OMEGA * np.sin(
+            2 * np.pi * self.unix_time / SECS_PER_DAY / SLT_ALPHA + SLT_PHI
+        )
+        self.assertLess(np.abs(latitude - fit).max(), 3)
+
+    def test_krtp(self):
+        """Test that KRTP components are radial, southward and eastward."""
+        position_kg = np.array([[1.0, 0, 0], [0, 2.0, 0], [0, 0, 3.0]])
+        field_kg = np.array([[1.0, 0, 0], [0, 0, 1.0], [1.0, 0, 1.0]])
+        field = transform_vectors(
+            field_kg, np.full(3, 1.4e9), "KG", "KRTP", position_kg=position_kg
+        )
+        np.testing.assert_allclose(
+            field, [[1, 0, 0], [0, -1, 0], [1, 1, 0]], atol=1e-15
+        )
+
+        spherical = cartesian_to_spherical(position_kg)
+        np.testing.assert_allclose(spherical[1], [2, np.pi / 2, np.pi / 2])
+        np.testing.assert_allclose(
+            spherical_to_cartesian(spherical), position_kg, atol=1e-12
+        )
+        with self.assertRaises(ValueError):
+            transform_vectors(field_kg, np.full(3, 1.4e9), "KG", "KRTP")
+        with self.assertRaises(ValueError):
+            transform_vectors(field_kg, np.full(3, 1.4e9), "KG", "RTN")
+
+
+class TestDataFileTransforms(TestCase):
+    """Compare transformations of the KRTP data file against the KSM data
+    file for the same day, both produced with SPICE."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ksm = DataFile(KSM_FILE)
+        cls.krtp = DataFile(KRTP_FILE)
+
+    def test_positions(self):
+        self.assertEqual(self.krtp.position_frame, "KG")
+        position = self.krtp.position_in("KSM")
+        expected = self.ksm.position_vector.astype(np.float64)
+        cosine = (
+            np.sum(position * expected, 1)
+            / np.linalg.norm(position, axis=1)
+            / np.linalg.norm(expected, axis=1)
+        )
+        angle = np.degrees(np.arccos(np.clip(cosine, -1, 1)))
+        self.assertLess(np.median(angle), 0.01)
+        self.assertLess(angle.max(), 0.2)
+
+        spherical = self.krtp.position_in("KRTP")
+        np.testing.assert_allclose(
+            transform_positions(spherical, self.krtp.unix_time, "KRTP", "KSM"),
+            position,
+            rtol=1e-10,
+        )
+
+    def test_field(self):
+        field = self.krtp.field_in("KSM")
+        # the data are one minute averages taken in each frame so agree to
+        # within the variation of the field over the averaging interval
+        self.assertLess(np.abs(field - self.ksm.field_vector).max(), 0.2)
+        np.testing.assert_allclose(
+            np.linalg.norm(field, axis=1), self.ksm["BTOTAL"].data, rtol=1e-4
+        )
+        np.testing.assert_allclose(
+            self.ksm.field_in("KRTP"), self.krtp.field_vector, atol=0.2
+        )
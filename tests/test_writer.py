@@ -0,0 +1,153 @@
+from datetime import datetime
+from pathlib import Path
+import shutil
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import numpy as np
+
+from magda_tools import DataFile, FlatFileWriter
+from magda_tools.data_file import Column
+from magda_tools.writer import _encode_sensor_status, format_header_time
+
+CASDATA = Path(__file__).parent.absolute() / "data" / "casdata"
+KRTP_FILE = CASDATA / "y17/17051/processed/17051_mrdcd_sdfgmc_krtp_1m.ffd"
+
+COLUMNS = [
+    Column(0, "TIME_TAI", "CA_SD_RG_FGM", "SEC", "d"),
+    Column(1, "BX_KRTP", "Model residual", "nT", "f"),
+    Column(2, "BY_KRTP", "Model residual", "nT", "f"),
+    Column(3, "BZ_KRTP", "Model residual", "nT", "f"),
+    Column(4, "COUNT", "Derived", "none", "i"),
+]
+
+
+class TestFlatFileWriter(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """Test that writing a DataFile reproduces its records and a header
+        giving the same metadata"""
+        df = DataFile(str(KRTP_FILE))
+        path = self.dir / KRTP_FILE.name
+        df.write(str(path), abstract=["Copy of the test data"])
+        self.assertEqual(path.read_bytes(), KRTP_FILE.read_bytes())
+
+        written = DataFile(str(path))
+        self.assertEqual(written.n_rows, df.n_rows)
+        self.assertEqual(
+            [(c.name, c.source, c.units, c.type_) for c in written.columns],
+            [(c.name, c.source, c.units, c.type_) for c in df.columns],
+        )
+        self.assertEqual(written._timebase_unix, df._timebase_unix)
+        self.assertEqual(written.coord, "KRTP")
+        # header times are those of the first and last rows
+        self.assertEqual(written.start, datetime(2017, 2, 20, 0, 0, 29))
+        self.assertEqual(written.end, datetime(2017, 2, 21, 0, 0, 29))
+        header = path.with_suffix(".ffh").read_text()
+        self.assertEqual(len(header) % 72, 0)
+        self.assertIn("Copy of the test data", header)
+
+    def test_append(self):
+        """Test writing a file a chunk at a time, reopening it to append"""
+        path = self.dir / KRTP_FILE.name
+        chunks = DataFile(str(KRTP_FILE), mmap=True).iter_chunks(500)
+        next(chunks).write(str(path))
+        for chunk in chunks:
+            with FlatFileWriter(str(path), append=True) as writer:
+                writer.write_datafile(chunk)
+        self.assertEqual(path.read_bytes(), KRTP_FILE.read_bytes())
+        self.assertEqual(DataFile(str(path)).n_rows, 1438)
+
+    def test_append_existing(self):
+        """Test that appending to a file updates only its row count and end
+        time, leaving the rest of the header as it was"""
+        path = self.dir / KRTP_FILE.name
+        shutil.copy(KRTP_FILE, path)
+        shutil.copy(KRTP_FILE.with_suffix(".ffh"), path.with_suffix(".ffh"))
+        df = DataFile(str(path))
+        unix_time = df.unix_time[-1] + 60.0 * np.arange(1, 11)
+        with FlatFileWriter(str(path), append=True) as writer:
+            writer.write(
+                {c.name: np.zeros(10) for c in df.columns[1:]}, unix_time=unix_time
+            )
+
+        appended = DataFile(str(path))
+        self.assertEqual(appended.n_rows, df.n_rows + 10)
+        self.assertEqual(appended.start, df.start)
+        self.assertEqual(appended.end, datetime(2017, 2, 21, 0, 10, 29))
+        np.testing.assert_allclose(appended.unix_time[-10:], unix_time)
+        original = KRTP_FILE.with_suffix(".ffh").read_text()
+        header = path.with_suffix(".ffh").read_text()
+        self.assertEqual(len(header), len(original))
+        # the lines after the row count up to the last time are unchanged
+        self.assertEqual(header[72 * 5 : 72 * 18], original[72 * 5 : 72 * 18])
+        self.assertEqual(header[72 * 19 :], original[72 * 19 :])
+
+    def test_write(self):
+        """Test writing a derived product from arrays"""
+        path = self.dir / "17051_mrdcd_sdfgmc_krtp_1m.ffd"
+        rng = np.random.default_rng(0)
+        unix_time = 1487548829.0 + 60.0 * np.arange(250)
+        field = rng.normal(size=(250, 3))
+        with FlatFileWriter(str(path), COLUMNS, chunk_size=64) as writer:
+            for rows in (slice(0, 100), slice(100, 250)):
+                writer.write(
+                    dict(
+                        BX=field[rows, 0],
+                        BY=field[rows, 1],
+                        BZ=field[rows, 2],
+                        COUNT=np.arange(250)[rows],
+                    ),
+                    unix_time=unix_time[rows],
+                )
+            self.assertEqual(writer.n_rows, 250)
+
+        df = DataFile(str(path))
+        self.assertEqual(df.n_rows, 250)
+        self.assertEqual(
+            [c.units for c in df.columns], ["SEC", "nT", "nT", "nT", "none"]
+        )
+        np.testing.assert_allclose(df.unix_time, unix_time)
+        np.testing.assert_allclose(df.field_vector, field, rtol=1e-6)
+        np.testing.assert_array_equal(df["COUNT"].data, np.arange(250))
+
+    def test_invalid(self):
+        path = str(self.dir / "17051_mrdcd_sdfgmc_krtp_1m.ffd")
+        with self.assertRaises(ValueError):
+            FlatFileWriter(path)
+        with self.assertRaises(ValueError):
+            FlatFileWriter(path, COLUMNS[1:])
+        with FlatFileWriter(path, COLUMNS) as writer:
+            values = dict(BX=[1.0], BY=[1.0], BZ=[1.0], COUNT=[1])
+            with self.assertRaises(ValueError):
+                writer.write(dict(values, BZ=[]), unix_time=[0.0])
+            with self.assertRaises(ValueError):
+                writer.write(dict(values, BT=[1.0]), unix_time=[0.0])
+            with self.assertRaises(ValueError):
+                writer.write({"BX": [1.0]}, unix_time=[0.0])
+            writer.write(values, unix_time=[1.0e9])
+            with self.assertRaises(ValueError):
+                writer.write(values, unix_time=[0.0])
+        with self.assertRaises(ValueError):
+            FlatFileWriter(path, COLUMNS[:4], append=True)
+
+    def test_encode_sensor_status(self):
+        status = np.arange(4, dtype=np.uint8)
+        raw = _encode_sensor_status(status)
+        self.assertEqual(raw.dtype, np.int32)
+        np.testing.assert_array_equal(DataFile.decode_sensor_status(raw), status)
+
+    def test_format_header_time(self):
+        self.assertEqual(
+            format_header_time(1207699230.0), "2008 100 APR  9 00:00:30.000"
+        )
+        self.assertEqual(
+            format_header_time(1487548830.25, milliseconds=False),
+            "2017 051 FEB 20 00:00:30",
+        )